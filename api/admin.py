@@ -1,9 +1,26 @@
+from django import forms
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Product, Transaction
+from .models import InventoryMovement, Product, Reservation, Transaction
+
+class ProductAdminForm(forms.ModelForm):
+    class Meta:
+        model = Product
+        fields = '__all__'
+
+    def clean_quantity(self):
+        quantity = self.cleaned_data['quantity']
+        if self.instance.pk:
+            # Product.save applies the change to the current stock, which
+            # must still cover the units held by reservations
+            current, reserved = Product.objects.values_list('quantity', 'reserved').get(pk=self.instance.pk)
+            if current + quantity - self.instance.quantity < reserved:
+                raise forms.ValidationError(f'{reserved} units are held by reservations')
+        return quantity
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    form = ProductAdminForm
     list_display = ('name', 'price', 'quantity', 'image_preview', 'created_at', 'updated_at')
     list_filter = ('created_at', 'updated_at')
     search_fields = ('name',)
@@ -12,7 +29,10 @@ class ProductAdmin(admin.ModelAdmin):
     fields = ('name', 'price', 'quantity', 'image', 'image_url', 'image_preview')
 
     def image_preview(self, obj):
-        if obj.image:
+        thumb = obj.image_sources.get('thumb')
+        if thumb:
+            return format_html('<img src="{}" width="100" height="100" style="object-fit: cover; border-radius: 8px;" />', thumb['webp'])
+        elif obj.image:
             return format_html('<img src="{}" width="100" height="100" style="object-fit: cover; border-radius: 8px;" />', obj.image.url)
         elif obj.image_url:
             return format_html('<img src="{}" width="100" height="100" style="object-fit: cover; border-radius: 8px;" />', obj.image_url)
@@ -26,3 +46,37 @@ class TransactionAdmin(admin.ModelAdmin):
     list_filter = ('status', 'payment_method', 'created_at')
     search_fields = ('product__name', 'user__username')
     ordering = ('-created_at',)
+    list_select_related = ('product', 'user')
+
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'user', 'quantity', 'created_at', 'expires_at')
+    search_fields = ('product__name', 'user__username')
+    ordering = ('expires_at',)
+    list_select_related = ('product', 'user')
+    # Holds are counted in Product.reserved; edit them through the API only
+    readonly_fields = ('product', 'user', 'quantity', 'expires_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(InventoryMovement)
+class InventoryMovementAdmin(admin.ModelAdmin):
+    list_display = ('product', 'delta', 'reason', 'transaction_id', 'user', 'created_at')
+    list_filter = ('reason', 'created_at')
+    search_fields = ('product__name', 'user__username')
+    ordering = ('-id',)
+    list_select_related = ('product', 'user')
+
+    # The ledger is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
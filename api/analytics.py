@@ -0,0 +1,377 @@
+"""
+In-memory analytics over the transaction history with NumPy.
+
+Completed transactions are kept on disk as one flat little-endian file
+per column under ANALYTICS_DIR and memory-mapped for each analysis, so
+workers share the page cache instead of each holding a copy. ``refresh``
+appends transactions newer than the last one loaded, fetched in chunks
+with ``values_list().iterator()``; edits since the last refresh are found
+by ``updated_at``, deletions through the inventory ledger's REFUND
+movements, and patched in place (or the files rewritten without the
+deleted rows). Requests only ``load``; the ``analytics`` management
+command refreshes, e.g. ``manage.py analytics refresh --interval 60``.
+The files are raw columns rather than ``.npy`` files because an ``.npy``
+header records the array length and would have to be rewritten on every
+append; the row count lives in ``manifest.json``.
+
+The analyses are vectorized group-bys (``bincount``/``unique``) and
+windowed sums (``cumsum``) over those columns. Hours and days are in the
+current time zone, at its present UTC offset.
+"""
+import json
+import math
+import os
+import shutil
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .bulk import batched
+from .cache import shared_cache
+from .models import InventoryMovement, Product, Transaction
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Column name -> dtype
+COLUMNS = {
+    'id': '<i8',
+    'product_id': '<i4',
+    'user_id': '<i4',
+    'quantity': '<i4',
+    'amount_cents': '<i8',
+    'payment_method': 'u1',
+    'timestamp': '<i8',
+}
+PAYMENT_CODES = {code: index for index, (code, _) in enumerate(Transaction.PAYMENT_METHODS)}
+LOAD_CHUNK_SIZE = 10000
+# Transactions younger than this wait for the next refresh, so ids still
+# committing out of order are not skipped
+REFRESH_LAG = getattr(settings, 'ANALYTICS_REFRESH_LAG', 5)
+REFRESH_LOCK_KEY = 'analytics_refresh:lock'
+REFRESH_LOCK_TIMEOUT = 600
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class ReportParams(NamedTuple):
+    product_ids: Optional[list] = None
+    days: int = 28
+    window: int = 7
+    horizon: int = 7
+
+
+def _to_columns(rows):
+    ids, products, users, quantities, amounts, methods, created = zip(*rows)
+    return {
+        'id': np.array(ids, dtype=COLUMNS['id']),
+        'product_id': np.array(products, dtype=COLUMNS['product_id']),
+        'user_id': np.array([user or 0 for user in users], dtype=COLUMNS['user_id']),
+        'quantity': np.array(quantities, dtype=COLUMNS['quantity']),
+        'amount_cents': np.rint(np.array(amounts, dtype=np.float64) * 100).astype(COLUMNS['amount_cents']),
+        'payment_method': np.array([PAYMENT_CODES[method] for method in methods], dtype=COLUMNS['payment_method']),
+        'timestamp': np.array([moment.timestamp() for moment in created], dtype=COLUMNS['timestamp']),
+    }
+
+
+class TransactionColumns:
+    """
+    The column files under ``directory`` (default ANALYTICS_DIR). Each
+    rewrite goes to a new ``v<version>`` folder; appends extend the current
+    one. manifest.json is replaced atomically after the data is written.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or settings.ANALYTICS_DIR)
+
+    @property
+    def manifest_path(self):
+        return self.directory / 'manifest.json'
+
+    def folder(self, manifest):
+        return self.directory / f'v{manifest["version"]}'
+
+    def manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, manifest):
+        temporary = self.manifest_path.with_suffix('.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temporary, self.manifest_path)
+
+    def load(self):
+        """
+        Read-only memory maps of every column, or None before the first refresh
+        """
+        manifest = self.manifest()
+        if manifest is None:
+            return None
+        count = manifest['count']
+        if not count:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        folder = self.folder(manifest)
+        return {
+            name: np.memmap(folder / f'{name}.bin', dtype=dtype, mode='r', shape=(count,))
+            for name, dtype in COLUMNS.items()
+        }
+
+    def refresh(self, rebuild=False, lag=None):
+        """
+        Bring the files up to date with the database, leaving transactions
+        younger than ``lag`` seconds (default ANALYTICS_REFRESH_LAG) for
+        later. Returns the number of transactions appended, or None when
+        another refresh holds the lock.
+        """
+        if not shared_cache.add(REFRESH_LOCK_KEY, 1, REFRESH_LOCK_TIMEOUT):
+            return None
+        lag = REFRESH_LAG if lag is None else lag
+        try:
+            manifest = None if rebuild else self.manifest()
+            if manifest is None:
+                previous = self.manifest()
+                manifest = {
+                    'version': previous['version'] + 1 if previous else 1,
+                    'count': 0,
+                    'last_id': 0,
+                    # Edits from here on are applied by later refreshes
+                    'movement_id': InventoryMovement.objects.aggregate(last=Max('id'))['last'] or 0,
+                    'edited_at': timezone.now().timestamp(),
+                }
+                self.folder(manifest).mkdir(parents=True, exist_ok=True)
+                for name in COLUMNS:
+                    open(self.folder(manifest) / f'{name}.bin', 'wb').close()
+            else:
+                manifest = self._apply_edits(manifest, lag)
+            appended = self._append(manifest, lag)
+            self._write_manifest(manifest)
+            self._remove_old_versions(manifest)
+            return appended
+        finally:
+            shared_cache.delete(REFRESH_LOCK_KEY)
+
+    def _append(self, manifest, lag):
+        folder = self.folder(manifest)
+        # Drop bytes of an append that died before its manifest was written
+        for name, dtype in COLUMNS.items():
+            os.truncate(folder / f'{name}.bin', manifest['count'] * np.dtype(dtype).itemsize)
+
+        rows = (
+            Transaction.objects
+            .filter(id__gt=manifest['last_id'], status='COMPLETED',
+                    created_at__lte=timezone.now() - timedelta(seconds=lag))
+            .order_by('id')
+            .values_list('id', 'product_id', 'user_id', 'quantity', 'total_amount', 'payment_method', 'created_at')
+            .iterator(chunk_size=LOAD_CHUNK_SIZE)
+        )
+        appended = 0
+        for batch in batched(rows, LOAD_CHUNK_SIZE):
+            columns = _to_columns(batch)
+            for name, array in columns.items():
+                with open(folder / f'{name}.bin', 'ab') as f:
+                    array.tofile(f)
+            appended += len(batch)
+            manifest['count'] += len(batch)
+            manifest['last_id'] = int(columns['id'][-1])
+        return appended
+
+    def _apply_edits(self, manifest, lag):
+        high = InventoryMovement.objects.aggregate(last=Max('id'))['last'] or 0
+        now = timezone.now()
+        # Deleted rows leave only their REFUND movement behind
+        edited = set(
+            InventoryMovement.objects.filter(
+                id__gt=manifest['movement_id'], id__lte=high,
+                reason=InventoryMovement.REFUND,
+                transaction_id__lte=manifest['last_id'],
+            ).values_list('transaction_id', flat=True)
+        )
+        # Any other edit (quantity, total_amount, status) bumps updated_at.
+        # Look back ``lag`` seconds past the last refresh for edits that
+        # were still committing then; patching a row twice is harmless.
+        since = datetime.fromtimestamp(manifest.get('edited_at', 0), dt_timezone.utc) - timedelta(seconds=lag)
+        edited.update(
+            Transaction.objects.filter(id__lte=manifest['last_id'], updated_at__gt=since)
+            .values_list('id', flat=True)
+        )
+        manifest = dict(manifest, movement_id=high, edited_at=now.timestamp())
+        if not edited or not manifest['count']:
+            return manifest
+
+        folder = self.folder(manifest)
+        ids = np.memmap(folder / 'id.bin', dtype=COLUMNS['id'], mode='r', shape=(manifest['count'],))
+        current = {
+            pk: (quantity, amount)
+            for pk, quantity, amount in Transaction.objects.filter(pk__in=edited, status='COMPLETED')
+            .values_list('pk', 'quantity', 'total_amount')
+        }
+        if current:
+            # Rows are appended in id order, so positions are a binary search away
+            wanted = np.array(sorted(current), dtype=COLUMNS['id'])
+            positions = np.searchsorted(ids, wanted)
+            quantities = np.memmap(folder / 'quantity.bin', dtype=COLUMNS['quantity'], mode='r+',
+                                   shape=(manifest['count'],))
+            amounts = np.memmap(folder / 'amount_cents.bin', dtype=COLUMNS['amount_cents'], mode='r+',
+                                shape=(manifest['count'],))
+            for pk, position in zip(wanted.tolist(), positions.tolist()):
+                if position < len(ids) and ids[position] == pk:
+                    quantities[position] = current[pk][0]
+                    amounts[position] = round(current[pk][1] * 100)
+            quantities.flush()
+            amounts.flush()
+
+        removed = np.array(sorted(edited - set(current)), dtype=COLUMNS['id'])
+        keep = ~np.isin(ids, removed)
+        if keep.all():
+            return manifest
+        columns = {
+            name: np.fromfile(folder / f'{name}.bin', dtype=dtype, count=manifest['count'])[keep]
+            for name, dtype in COLUMNS.items()
+        }
+        manifest = dict(manifest, version=manifest['version'] + 1, count=int(keep.sum()))
+        self.folder(manifest).mkdir(parents=True, exist_ok=True)
+        for name, array in columns.items():
+            array.tofile(self.folder(manifest) / f'{name}.bin')
+        return manifest
+
+    def _remove_old_versions(self, manifest):
+        current = self.folder(manifest).name
+        for folder in self.directory.glob('v*'):
+            if folder.name != current:
+                # Open memory maps keep their pages; only new loads need the files
+                shutil.rmtree(folder, ignore_errors=True)
+
+
+def _utc_offset():
+    return int(timezone.localtime().utcoffset().total_seconds())
+
+
+def _local_day(timestamps):
+    return (timestamps + _utc_offset()) // SECONDS_PER_DAY
+
+
+def _select(columns, params, since_days=None):
+    mask = np.ones(len(columns['id']), dtype=bool)
+    if params.product_ids:
+        mask &= np.isin(columns['product_id'], params.product_ids)
+    if since_days is not None:
+        today = _local_day(int(timezone.now().timestamp()))
+        days = _local_day(columns['timestamp'])
+        mask &= (days > today - since_days) & (days <= today)
+    return mask
+
+
+def _daily_demand(columns, params, days):
+    """
+    Units sold per product per day for the last ``days`` days, today last.
+    Returns (product ids, matrix).
+    """
+    mask = _select(columns, params, since_days=days)
+    local_days = _local_day(columns['timestamp'][mask])
+    today = _local_day(int(timezone.now().timestamp()))
+    products, product_index = np.unique(columns['product_id'][mask], return_inverse=True)
+    cells = product_index * days + (local_days - (today - days + 1))
+    matrix = np.bincount(cells, weights=columns['quantity'][mask], minlength=len(products) * days)
+    return products, matrix.reshape(len(products), days)
+
+
+def hour_of_day(columns, params):
+    """
+    Units and transactions per hour of the day over the last ``days`` days
+    """
+    mask = _select(columns, params, since_days=params.days)
+    hours = ((columns['timestamp'][mask] + _utc_offset()) // 3600) % 24
+    units = np.bincount(hours, weights=columns['quantity'][mask], minlength=24)
+    transactions = np.bincount(hours, minlength=24)
+    return [
+        {'hour': hour, 'quantity': int(units[hour]), 'transactions': int(transactions[hour])}
+        for hour in range(24)
+    ]
+
+
+def basket_sizes(columns, params):
+    """
+    Distribution of units per basket over the last ``days`` days. A
+    checkout writes all of its lines in the same second, so a user's
+    transactions within one second count as one basket.
+    """
+    mask = _select(columns, params, since_days=params.days)
+    keys = (columns['user_id'][mask].astype(np.int64) << 32) | columns['timestamp'][mask]
+    _, basket = np.unique(keys, return_inverse=True)
+    units = np.bincount(basket, weights=columns['quantity'][mask]).astype(np.int64)
+    if not len(units):
+        return {'baskets': 0, 'mean': None, 'median': None, 'distribution': []}
+    distribution = np.bincount(units)
+    return {
+        'baskets': len(units),
+        'mean': round(float(units.mean()), 2),
+        'median': float(np.median(units)),
+        'distribution': [
+            {'units': size, 'baskets': int(count)} for size, count in enumerate(distribution.tolist()) if count
+        ],
+    }
+
+
+def moving_average_demand(columns, params):
+    """
+    ``window``-day moving average of daily units per product, for each of
+    the last ``days`` days
+    """
+    products, matrix = _daily_demand(columns, params, params.days + params.window - 1)
+    totals = np.cumsum(np.pad(matrix, ((0, 0), (1, 0))), axis=1)
+    averages = (totals[:, params.window:] - totals[:, :-params.window]) / params.window
+    start = timezone.localdate() - timedelta(days=params.days - 1)
+    return {
+        'start': start.isoformat(),
+        'window': params.window,
+        'products': [
+            {'product_id': int(product_id), 'moving_average': np.round(row, 2).tolist()}
+            for product_id, row in zip(products.tolist(), averages)
+        ],
+    }
+
+
+def restock_forecast(columns, params):
+    """
+    Average daily demand over the last ``window`` days against available
+    stock: days of cover and the units needed to last ``horizon`` days,
+    soonest to sell out first
+    """
+    products, matrix = _daily_demand(columns, params, params.window)
+    demand = dict(zip(products.tolist(), (matrix.sum(axis=1) / params.window).tolist()))
+    stock = Product.objects.order_by('pk').values_list('pk', 'name', 'quantity', 'reserved')
+    if params.product_ids:
+        stock = stock.filter(pk__in=params.product_ids)
+
+    forecast = []
+    for product_id, name, quantity, reserved in stock:
+        available = quantity - reserved
+        daily = demand.get(product_id, 0.0)
+        forecast.append({
+            'product_id': product_id,
+            'name': name,
+            'available': available,
+            'daily_demand': round(daily, 2),
+            'days_of_cover': round(available / daily, 1) if daily else None,
+            # Rounded first so 6 / 7 * 14 does not ceil to 13
+            'restock': max(0, math.ceil(round(daily * params.horizon, 6)) - available),
+        })
+    forecast.sort(key=lambda row: (row['days_of_cover'] is None, row['days_of_cover'] or 0))
+    return forecast
+
+
+REPORTS = {
+    'hour_of_day': hour_of_day,
+    'basket_sizes': basket_sizes,
+    'demand': moving_average_demand,
+    'restock': restock_forecast,
+}
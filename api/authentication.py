@@ -0,0 +1,42 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from .timing import measure
+
+AUTH_TOKEN_CACHE_TIMEOUT = getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 300)
+
+
+def token_cache_key(key):
+    # Never use the raw token as a cache key
+    return 'auth_token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_token(key):
+    cache.delete(token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that resolves token -> user from the cache instead of
+    running the Token + User join on every request. Entries expire after
+    AUTH_TOKEN_CACHE_TIMEOUT and are dropped when the token is deleted or
+    its user is changed or deactivated (see api.signals).
+    """
+
+    @measure('auth')
+    def authenticate(self, request):
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Raises AuthenticationFailed for unknown tokens and inactive users
+        user, token = super().authenticate_credentials(key)
+        cache.set(cache_key, (user, token), AUTH_TOKEN_CACHE_TIMEOUT)
+        return user, token
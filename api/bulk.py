@@ -0,0 +1,113 @@
+"""
+Bulk product upserts keyed on the unique product name, used by the
+``import_products`` command.
+
+Rows are written with one ``INSERT ... ON CONFLICT (name) DO UPDATE`` per
+batch instead of a get_or_create round trip per product. Model signals do
+not fire for bulk writes, so callers invalidate the product cache and
+search index once when they are done (``finish_upsert``). Quantity
+changes are appended to the inventory ledger in the same transaction;
+rows that would leave fewer units than reservations hold are rejected.
+"""
+from collections import defaultdict
+from itertools import islice
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .cache import invalidate_product_cache
+from .models import InventoryMovement, Product
+from .search import product_index
+from .serializers import ProductImportSerializer
+
+DEFAULT_BATCH_SIZE = 1000
+UPSERT_FIELDS = ('price', 'quantity', 'image_url')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def validate_rows(rows):
+    """
+    Validate raw rows. Returns (valid rows, [(index, errors), ...])
+    """
+    serializer = ProductImportSerializer()
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            valid.append(serializer.run_validation(row))
+        except ValidationError as e:
+            errors.append((index, e.detail))
+    return valid, errors
+
+
+def upsert_batch(rows):
+    """
+    Insert or update validated rows by name. Returns (created, updated,
+    [(name, error), ...]) where the errors are rows left unwritten because
+    their quantity is below the units held by reservations.
+
+    Rows are grouped by the optional fields they carry, so a row without
+    ``image_url`` never clears an existing one. A later row with the same
+    name wins.
+    """
+    latest = {row['name']: row for row in rows}
+
+    with transaction.atomic():
+        # Locked so the ledger records exactly the change this batch makes,
+        # and no hold can be taken between the check and the write
+        existing, rejected = {}, []
+        for pk, name, quantity, reserved in (
+            Product.objects.select_for_update().filter(name__in=list(latest))
+            .values_list('pk', 'name', 'quantity', 'reserved')
+        ):
+            if latest[name].get('quantity', quantity) < reserved:
+                rejected.append((name, f'quantity is below the {reserved} units held by reservations'))
+                del latest[name]
+            else:
+                existing[name] = (pk, quantity)
+
+        groups = defaultdict(list)
+        for row in latest.values():
+            groups[tuple(field for field in UPSERT_FIELDS if field in row)].append(Product(**row))
+        for fields, products in groups.items():
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=[*fields, 'updated_at'],
+            )
+        record_movements(latest, existing)
+    return len(latest) - len(existing), len(existing), rejected
+
+
+def record_movements(latest, existing):
+    """
+    Append the stock changes of an upsert to the inventory ledger: opening
+    stock for new products, corrections for changed quantities
+    """
+    created = Product.objects.filter(
+        name__in=[name for name, row in latest.items() if name not in existing and row.get('quantity')]
+    ).values_list('name', 'pk')
+    movements = [
+        InventoryMovement(product_id=pk, delta=latest[name]['quantity'], reason=InventoryMovement.OPENING)
+        for name, pk in created
+    ]
+    for name, (pk, quantity) in existing.items():
+        if 'quantity' in latest[name] and latest[name]['quantity'] != quantity:
+            movements.append(InventoryMovement(
+                product_id=pk, delta=latest[name]['quantity'] - quantity, reason=InventoryMovement.CORRECTION
+            ))
+    InventoryMovement.objects.bulk_create(movements, batch_size=DEFAULT_BATCH_SIZE)
+
+
+def finish_upsert():
+    """
+    Invalidate cached product responses and rebuild search indexes once
+    after a bulk upsert
+    """
+    invalidate_product_cache()
+    product_index.names_changed()
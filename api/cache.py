@@ -0,0 +1,215 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from functools import partial
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
+
+PRODUCT_GENERATION_KEY = 'product_generation'
+PRODUCT_CACHE_TIMEOUT = getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 300)
+# Query parameters holding comma-separated, order-insensitive name lists
+SET_QUERY_PARAMS = ('fields', 'expand')
+
+# Locks and counters live in a shared cache of their own: every worker must
+# see them, releasing one must not broadcast an L1 invalidation, and they
+# must not be culled to make room for response bytes. Point it at Redis or
+# Memcached for locks that hold across workers (see get_or_fill)
+shared_cache = ConnectionProxy(caches, 'coordination')
+
+
+def cache_backend(cache):
+    """
+    Return the backend behind ``cache``, which may be a ConnectionProxy
+    """
+    if isinstance(cache, ConnectionProxy):
+        return cache._connections[cache._alias]
+    return cache
+
+
+FILL_LOCK_TIMEOUT = 10
+# How long a request waits for another worker's fill before computing itself
+FILL_WAIT = 2.0
+FILL_POLL_INTERVAL = 0.02
+# XFetch beta; larger values refresh earlier
+EARLY_REFRESH_BETA = 1.0
+
+# Keys this process is currently filling. Checked before the shared lock so
+# threads of one worker never race on the shared tier's add()
+_local_fills = set()
+_local_fills_lock = threading.Lock()
+
+
+def _fresh_generation():
+    # Seed from the clock so a counter lost to eviction never reuses an old
+    # generation and resurrects stale entries
+    return int(time.time() * 1000)
+
+
+def generation(key):
+    """
+    Return the current value of a generation counter. Entries keyed by it
+    are invalidated all at once by bumping the counter.
+    """
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, _fresh_generation(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump_generation(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        value = _fresh_generation()
+        cache.set(key, value, timeout=None)
+        return value
+
+
+def product_generation():
+    """
+    Return the current product generation. Every cached product response is
+    keyed by it, so bumping the counter invalidates all of them at once.
+    """
+    return generation(PRODUCT_GENERATION_KEY)
+
+
+def bump_product_generation():
+    return bump_generation(PRODUCT_GENERATION_KEY)
+
+
+def transaction_generation(user_id):
+    """
+    Return the generation of one user's transaction history
+    """
+    return generation(f'transaction_generation:{user_id}')
+
+
+def bump_transaction_generation(user_id):
+    return bump_generation(f'transaction_generation:{user_id}')
+
+
+def invalidate_product_cache():
+    """
+    Invalidate every cached product response in O(1) once the current
+    database transaction commits (straight away outside one), so readers
+    cannot cache data from before the commit under the new generation
+    """
+    transaction.on_commit(bump_product_generation)
+
+
+def invalidate_transaction_cache(user_id):
+    """
+    Invalidate one user's cached transaction history, on commit like
+    invalidate_product_cache()
+    """
+    transaction.on_commit(partial(bump_transaction_generation, user_id))
+
+
+def _normalized_value(key, value):
+    if key in SET_QUERY_PARAMS:
+        return ','.join(sorted({item.strip() for item in value.split(',') if item.strip()}))
+    return value
+
+
+def normalized_query(params):
+    """
+    Return a canonical query string so equivalent requests share a cache entry
+    """
+    return urlencode(sorted(
+        (key, _normalized_value(key, value)) for key in params for value in params.getlist(key)
+    ))
+
+
+def request_origin_path(request):
+    """
+    Scheme, host and path of ``request``. Responses carry absolute links
+    (pagination, images), so the same path served under another host or
+    scheme is a different response.
+    """
+    return f'{request.scheme}://{request.get_host()}{request.path}'
+
+
+def response_cache_key(prefix, request, generation):
+    digest = hashlib.sha1(
+        f'{request_origin_path(request)}?{normalized_query(request.query_params)}'.encode()
+    ).hexdigest()
+    return f'{prefix}:{generation}:{request.accepted_renderer.format}:{digest}'
+
+
+def _acquire_fill(key):
+    with _local_fills_lock:
+        if key in _local_fills:
+            return False
+        _local_fills.add(key)
+    if shared_cache.add(f'{key}:lock', 1, FILL_LOCK_TIMEOUT):
+        return True
+    with _local_fills_lock:
+        _local_fills.discard(key)
+    return False
+
+
+def _release_fill(key):
+    shared_cache.delete(f'{key}:lock')
+    with _local_fills_lock:
+        _local_fills.discard(key)
+
+
+def _fill(key, fill, timeout, stale_key):
+    started = time.time()
+    try:
+        value = fill()
+        delta = time.time() - started
+        cache.set(key, (value, delta, time.time() + timeout), timeout)
+        if stale_key:
+            cache.set(stale_key, value, timeout)
+        return value
+    finally:
+        _release_fill(key)
+
+
+def get_or_fill(key, fill, timeout=PRODUCT_CACHE_TIMEOUT, stale_key=None):
+    """
+    Return the cached value for ``key``, calling ``fill()`` on a miss.
+
+    Fills are single-flight: one caller takes a lock and recomputes while
+    the others return the value stored under ``stale_key`` (if any) or wait
+    briefly for the fresh one. Entries are also refreshed early with
+    probability rising towards expiry (XFetch), so hot keys are usually
+    rebuilt by a single request before they expire.
+
+    Threads of one process are serialised by ``_local_fills``. Across
+    workers the lock is ``add()`` on the shared cache, which is only atomic
+    on backends such as Redis and Memcached; on the file-based cache two
+    workers can occasionally both fill a key, which costs a duplicate
+    render but nothing else.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires_at = entry
+        early = time.time() - delta * EARLY_REFRESH_BETA * math.log(1 - random.random()) >= expires_at
+        if early and _acquire_fill(key):
+            return _fill(key, fill, timeout, stale_key)
+        return value
+
+    if _acquire_fill(key):
+        return _fill(key, fill, timeout, stale_key)
+
+    # Someone else is filling: serve stale data if we have it, else wait
+    if stale_key:
+        stale = cache.get(stale_key)
+        if stale is not None:
+            return stale
+    deadline = time.monotonic() + FILL_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(FILL_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return fill()
@@ -0,0 +1,224 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .timing import count, measure
+
+STAMP_KEY = 'tiered-cache:stamp'
+
+_missing = object()
+
+# One L1 store per LOCATION, shared by every thread of the process (like
+# LocMemCache); each gunicorn worker therefore has its own L1
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class _LocalStore:
+    def __init__(self):
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.stamp_checked_at = float('-inf')
+        self.stats = {'l1_hits': 0, 'l1_misses': 0, 'l2_hits': 0, 'l2_misses': 0}
+
+
+class TieredCache(BaseCache):
+    """
+    Two-tier cache: a bounded in-process LRU (L1) in front of a cache shared
+    by every worker (L2, another configured cache alias).
+
+    Reads are served from L1 when possible and filled from L2 on a miss;
+    writes go through to both tiers. Deletes, clears and counter updates
+    bump a generation stamp stored in L2. Each worker re-reads the stamp at
+    most every STAMP_INTERVAL seconds and ignores L1 entries filled under an
+    older stamp, which broadcasts invalidation to every process. Overwrites
+    of existing keys reach other workers after at most L1_TIMEOUT seconds,
+    so data that must change everywhere at once should use versioned keys.
+
+    Keys starting with one of the L2_ONLY prefixes are never held in L1.
+    They are read from L2 every time, so changing or deleting them needs no
+    broadcast. Use it for counters that are bumped often, such as the
+    generations versioned keys are built from; bumping one would otherwise
+    empty every worker's L1.
+
+    OPTIONS:
+        L2              alias of the shared cache (default 'shared')
+        L2_ONLY         key prefixes kept out of L1 (default none)
+        MAX_ENTRIES     L1 capacity (default 1000)
+        L1_TIMEOUT      upper bound on an L1 entry's lifetime (default 30)
+        STAMP_INTERVAL  seconds between stamp checks (default 1.0)
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', 'shared')
+        self._l2_only = tuple(options.get('L2_ONLY', ()))
+        self._l1_timeout = options.get('L1_TIMEOUT', 30)
+        self._stamp_interval = options.get('STAMP_INTERVAL', 1.0)
+        with _stores_lock:
+            self._store = _stores.setdefault(location, _LocalStore())
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def stats(self):
+        """
+        Return this process's hit/miss counters for both tiers
+        """
+        with self._store.lock:
+            return dict(self._store.stats)
+
+    def _count(self, name):
+        with self._store.lock:
+            self._store.stats[name] += 1
+
+    # Generation stamps
+
+    def _current_stamp(self):
+        store = self._store
+        now = time.monotonic()
+        if now - store.stamp_checked_at >= self._stamp_interval:
+            stamp = self.l2.get(STAMP_KEY)
+            if stamp is None:
+                self.l2.add(STAMP_KEY, int(time.time() * 1000), timeout=None)
+                stamp = self.l2.get(STAMP_KEY)
+            store.stamp = stamp
+            store.stamp_checked_at = now
+        return store.stamp
+
+    def _broadcast(self):
+        """
+        Invalidate the L1 of every worker, including this one
+        """
+        try:
+            stamp = self.l2.incr(STAMP_KEY)
+        except ValueError:
+            stamp = int(time.time() * 1000)
+            self.l2.set(STAMP_KEY, stamp, timeout=None)
+        self._store.stamp = stamp
+        self._store.stamp_checked_at = time.monotonic()
+
+    # L1 helpers
+
+    def _l1_get(self, key, stamp):
+        store = self._store
+        with store.lock:
+            entry = store.data.get(key)
+            if entry is not None:
+                pickled, expires_at, entry_stamp = entry
+                if entry_stamp == stamp and expires_at > time.time():
+                    store.data.move_to_end(key)
+                    store.stats['l1_hits'] += 1
+                    return pickle.loads(pickled)
+                del store.data[key]
+            store.stats['l1_misses'] += 1
+        return _missing
+
+    def _l1_set(self, key, value, timeout, stamp):
+        expires_at = time.time() + self._l1_timeout
+        backend_timeout = self.get_backend_timeout(timeout)
+        if backend_timeout is not None:
+            expires_at = min(expires_at, backend_timeout)
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        store = self._store
+        with store.lock:
+            store.data[key] = (pickled, expires_at, stamp)
+            store.data.move_to_end(key)
+            while len(store.data) > self._max_entries:
+                store.data.popitem(last=False)
+
+    def _l1_delete(self, key):
+        with self._store.lock:
+            self._store.data.pop(key, None)
+
+    def _in_l1(self, key):
+        return not key.startswith(self._l2_only)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        with measure('cache'):
+            value = self._get(key, version)
+        if value is _missing:
+            count('cache_misses')
+            return default
+        count('cache_hits')
+        return value
+
+    def _get(self, key, version):
+        if not self._in_l1(key):
+            return self.l2.get(key, _missing, version=version)
+        l1_key = self.make_and_validate_key(key, version=version)
+        stamp = self._current_stamp()
+        value = self._l1_get(l1_key, stamp)
+        if value is not _missing:
+            return value
+
+        value = self.l2.get(key, _missing, version=version)
+        if value is _missing:
+            self._count('l2_misses')
+            return _missing
+        self._count('l2_hits')
+        self._l1_set(l1_key, value, DEFAULT_TIMEOUT, stamp)
+        return value
+
+    @measure('cache')
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self.l2.set(key, value, timeout=timeout, version=version)
+        if self._in_l1(key):
+            self._l1_set(l1_key, value, timeout, self._current_stamp())
+
+    @measure('cache')
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        added = self.l2.add(key, value, timeout=timeout, version=version)
+        if added and self._in_l1(key):
+            self._l1_set(l1_key, value, timeout, self._current_stamp())
+        return added
+
+    @measure('cache')
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self.l2.touch(key, timeout=timeout, version=version)
+
+    @measure('cache')
+    def delete(self, key, version=None):
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        deleted = self.l2.delete(key, version=version)
+        if self._in_l1(key):
+            self._broadcast()
+        return deleted
+
+    @measure('cache')
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._l1_delete(self.make_and_validate_key(key, version=version))
+        self.l2.delete_many(keys, version=version)
+        if any(self._in_l1(key) for key in keys):
+            self._broadcast()
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version=version) is not _missing
+
+    @measure('cache')
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        if self._in_l1(key):
+            self._l1_delete(self.make_and_validate_key(key, version=version))
+            self._broadcast()
+        return value
+
+    @measure('cache')
+    def clear(self):
+        with self._store.lock:
+            self._store.data.clear()
+        self.l2.clear()
+        self._broadcast()
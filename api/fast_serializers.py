@@ -0,0 +1,178 @@
+"""
+Fast serialization for list and retrieve responses.
+
+DRF's ModelSerializer builds a model instance per row and then walks its
+field objects for every attribute. The serializers here read plain
+``.values()`` rows instead and run one precompiled converter per column.
+The output is the same, byte for byte, as the ModelSerializer they mirror.
+"""
+import decimal
+
+from rest_framework import serializers
+
+from .images import image_source, image_sources
+from .serializers import ProductSerializer, SalesReportRowSerializer, TransactionSerializer
+from .timing import measure
+
+
+def _identity(value):
+    return value
+
+
+def _decimal_converter(field):
+    quantum = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(quantum, rounding=rounding, context=context))
+    return convert
+
+
+def _datetime_converter(field):
+    field_timezone = field.default_timezone()
+
+    def convert(value):
+        if field_timezone is not None:
+            value = value.astimezone(field_timezone)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _file_converter(model_field, request):
+    storage = model_field.storage
+
+    def convert(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+    return convert
+
+
+class RowSerializer:
+    """
+    Serialize ``.values()`` rows exactly like ``serializer_class`` would
+    serialize the matching instances.
+
+    Plain model fields are compiled from the DRF serializer's own field
+    definitions, with the same sparse fieldset (``fields``/``expand``).
+    Nested serializers are listed in ``nested``. Each SerializerMethodField
+    needs a ``get_<name>(row)`` method here; the columns it reads come from
+    the serializer's ``method_field_sources``.
+    """
+    serializer_class = None
+    nested = {}
+
+    def __init__(self, context=None, prefix='', fields=None, expand=None):
+        self.context = context or {}
+        self.prefix = prefix
+        request = self.context.get('request')
+        model = self.serializer_class.Meta.model
+        serializer = self.serializer_class(context=self.context, fields=fields, expand=expand)
+        self.columns = serializer.get_columns(prefix)
+        self.plan = []
+
+        for name, field in serializer.fields.items():
+            if name in self.nested and isinstance(field, serializers.BaseSerializer):
+                child = self.nested[name](self.context, prefix=f'{prefix}{field.source}__',
+                                          fields=field.requested_fields)
+                self.plan.append((name, None, child.to_representation))
+            elif isinstance(field, serializers.SerializerMethodField):
+                self.plan.append((name, None, getattr(self, f'get_{name}')))
+            else:
+                self.plan.append((name, prefix + field.source, self._converter(field, model, request)))
+
+    def _converter(self, field, model, request):
+        if isinstance(field, serializers.DecimalField):
+            return _decimal_converter(field)
+        if isinstance(field, serializers.DateTimeField):
+            return _datetime_converter(field)
+        if isinstance(field, serializers.FileField):
+            return _file_converter(model._meta.get_field(field.source), request)
+        return _identity
+
+    def column(self, row, name):
+        return row[self.prefix + name]
+
+    def to_representation(self, row):
+        data = {}
+        for name, column, convert in self.plan:
+            if column is None:
+                # Nested and method fields read their own columns
+                data[name] = convert(row)
+            else:
+                value = row[column]
+                data[name] = None if value is None else convert(value)
+        return data
+
+    @measure('serialize')
+    def serialize_many(self, rows):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
+
+
+class ProductRowSerializer(RowSerializer):
+    serializer_class = ProductSerializer
+
+    def get_available_quantity(self, row):
+        return self.column(row, 'quantity') - self.column(row, 'reserved')
+
+    def _image_args(self, row):
+        return self.column(row, 'image'), self.column(row, 'image_url'), self.column(row, 'image_variants')
+
+    def get_image_source(self, row):
+        return image_source(*self._image_args(row))
+
+    def get_image_sources(self, row):
+        return image_sources(*self._image_args(row))
+
+
+class TransactionRowSerializer(RowSerializer):
+    serializer_class = TransactionSerializer
+    nested = {'product': ProductRowSerializer}
+
+
+class AggregateRowSerializer:
+    """
+    Serialize ``.values().annotate()`` rows exactly like the plain
+    ``serializer_class``, whose fields name their column in ``source``.
+    Fields whose column is not in a row are left out, as DRF leaves out
+    fields with ``required=False``.
+    """
+    serializer_class = None
+
+    def __init__(self):
+        self.plan = []
+        for name, field in self.serializer_class().fields.items():
+            if isinstance(field, serializers.DecimalField):
+                convert = _decimal_converter(field)
+            elif isinstance(field, serializers.DateTimeField):
+                convert = _datetime_converter(field)
+            else:
+                convert = _identity
+            self.plan.append((name, field.source, convert))
+
+    def to_representation(self, row):
+        return {
+            name: None if row[source] is None else convert(row[source])
+            for name, source, convert in self.plan if source in row
+        }
+
+    @measure('serialize')
+    def serialize_many(self, rows):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
+
+
+class SalesReportRowFastSerializer(AggregateRowSerializer):
+    serializer_class = SalesReportRowSerializer
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+# How long a duplicate waits for the original request to finish
+WAIT_TIMEOUT = getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 5)
+# After this long an unfinished claim is treated as abandoned
+LOCK_TIMEOUT = getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 30)
+POLL_INTERVAL = 0.05
+# Client errors that may go away on their own; like server errors they are
+# not stored, so a retry with the same key runs the request again
+TRANSIENT_STATUS_CODES = {408, 409, 423, 425, 429}
+PURGE_BATCH_SIZE = 1000
+
+
+def _scope(request, key):
+    """
+    Keys are scoped to the user and endpoint so clients cannot collide
+    """
+    raw = f'{request.user.pk}:{request.method}:{request.path}:{key}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _cache_key(scope):
+    return f'idempotency:{scope}'
+
+
+def _lookup(scope):
+    """
+    Return the stored record for a key, checking the cache before the database
+    """
+    record = cache.get(_cache_key(scope))
+    if record is not None:
+        return record
+
+    row = IdempotencyKey.objects.filter(key=scope, expires_at__gt=timezone.now()).first()
+    if row is None:
+        return None
+    record = {
+        'fingerprint': row.fingerprint,
+        'status_code': row.status_code,
+        'data': row.response_data,
+    }
+    if row.status_code is not None:
+        cache.set(_cache_key(scope), record, timeout=KEY_TTL)
+    return record
+
+
+def _claim(scope, fingerprint):
+    """
+    Insert an in-flight row. The unique key makes this the cross-worker lock;
+    returns False when another request already holds the key.
+    """
+    expires_at = timezone.now() + timedelta(seconds=LOCK_TIMEOUT)
+    try:
+        IdempotencyKey.objects.create(key=scope, fingerprint=fingerprint, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        pass
+
+    # Reclaim keys whose TTL ran out or whose original request died
+    if IdempotencyKey.objects.filter(key=scope, expires_at__lte=timezone.now()).delete()[0]:
+        try:
+            IdempotencyKey.objects.create(key=scope, fingerprint=fingerprint, expires_at=expires_at)
+            return True
+        except IntegrityError:
+            pass
+    return False
+
+
+def _is_final(response):
+    """
+    Whether a response is the request's outcome for good: a success or a
+    client error that a retry would only repeat
+    """
+    return response.status_code < 500 and response.status_code not in TRANSIENT_STATUS_CODES
+
+
+def _complete(scope, fingerprint, response):
+    """
+    Store the response. Runs in the view's database transaction, so the
+    write and its record commit together.
+    """
+    IdempotencyKey.objects.filter(key=scope).update(
+        status_code=response.status_code,
+        response_data=response.data,
+        expires_at=timezone.now() + timedelta(seconds=KEY_TTL)
+    )
+    record = {
+        'fingerprint': fingerprint,
+        'status_code': response.status_code,
+        'data': response.data,
+    }
+    transaction.on_commit(lambda: cache.set(_cache_key(scope), record, timeout=KEY_TTL))
+
+
+def _release(scope):
+    IdempotencyKey.objects.filter(key=scope).delete()
+    cache.delete(_cache_key(scope))
+
+
+def _replay(record, fingerprint):
+    if record['fingerprint'] != fingerprint:
+        return Response(
+            {'error': f'{HEADER} was already used with a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(record['data'], status=record['status_code'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for(scope):
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = _lookup(scope)
+        if record is None or record['status_code'] is not None:
+            return record
+    return None
+
+
+def idempotent(view):
+    """
+    Honour the Idempotency-Key header on a mutating view or view method.
+
+    The first response for a key is stored and replayed for every repeat of
+    that key. A duplicate that arrives while the first request is still
+    running waits for its result instead of performing the write again.
+    Server errors and transient client errors (TRANSIENT_STATUS_CODES) are
+    not stored, so the client may retry them. The view runs in one database
+    transaction with the storing of its response.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request = args[0] if isinstance(args[0], Request) else args[1]
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        scope = _scope(request, key)
+        fingerprint = _fingerprint(request)
+
+        record = _lookup(scope)
+        if record is not None and record['status_code'] is not None:
+            return _replay(record, fingerprint)
+
+        if not _claim(scope, fingerprint):
+            record = _wait_for(scope)
+            if record is None or record['status_code'] is None:
+                return Response(
+                    {'error': f'A request with this {HEADER} is still in progress'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            return _replay(record, fingerprint)
+
+        try:
+            with transaction.atomic():
+                response = view(*args, **kwargs)
+                if _is_final(response):
+                    _complete(scope, fingerprint, response)
+                    return response
+        except Exception:
+            _release(scope)
+            raise
+        _release(scope)
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys(now=None):
+    """
+    Delete stored responses and abandoned claims past their expiry,
+    PURGE_BATCH_SIZE rows per statement. Returns the number deleted.
+    """
+    now = now or timezone.now()
+    purged = 0
+    while True:
+        expired = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:PURGE_BATCH_SIZE]
+        )
+        if not expired:
+            return purged
+        purged += IdempotencyKey.objects.filter(pk__in=expired).delete()[0]
@@ -0,0 +1,151 @@
+"""
+Resized JPEG and WebP variants of uploaded product images.
+
+Saving a product with a new upload schedules ``generate_variants`` on a
+small thread pool once the transaction commits. Variant files are named
+after a hash of the source bytes plus their dimensions, so identical
+uploads share files and a URL never changes meaning. Until the variants
+exist, ``image_source`` keeps serving the original.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .cache import invalidate_product_cache
+
+logger = logging.getLogger(__name__)
+
+# Size label -> (width, height); images are cropped to fill the box
+IMAGE_SIZES = getattr(settings, 'PRODUCT_IMAGE_SIZES', {'thumb': (200, 200), 'card': (600, 400)})
+# Variant served as image_source
+IMAGE_SOURCE_SIZE = getattr(settings, 'PRODUCT_IMAGE_SOURCE_SIZE', 'card')
+IMAGE_WORKERS = getattr(settings, 'PRODUCT_IMAGE_WORKERS', 2)
+VARIANT_DIR = 'products/variants'
+# Pillow format -> (extension, save options)
+FORMATS = {
+    'jpeg': ('jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def current_variants(image_name, variants):
+    """
+    Return the size -> format -> file name map of ``variants`` if it was
+    generated from ``image_name``, else an empty dict
+    """
+    if not image_name or not variants or variants.get('source') != image_name:
+        return {}
+    return variants.get('sizes', {})
+
+
+def image_source(image_name, image_url, variants):
+    """
+    URL of the IMAGE_SOURCE_SIZE JPEG variant, falling back to the original
+    upload and then to ``image_url``
+    """
+    if not image_name:
+        return image_url
+    variant = current_variants(image_name, variants).get(IMAGE_SOURCE_SIZE, {}).get('jpeg')
+    return default_storage.url(variant or image_name)
+
+
+def image_sources(image_name, image_url, variants):
+    """
+    Original URL plus a size -> format -> URL map of the generated variants
+    """
+    sources = {'original': default_storage.url(image_name) if image_name else image_url}
+    for size, files in current_variants(image_name, variants).items():
+        sources[size] = {fmt: default_storage.url(name) for fmt, name in files.items()}
+    return sources
+
+
+def _encode(image, fmt):
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            rgba = image.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+    elif fmt == 'webp' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), **FORMATS[fmt][1])
+    return buffer.getvalue()
+
+
+def _store(name, content):
+    # Content-addressed: an existing file already holds these bytes
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+    return name
+
+
+def generate_variants(product_id):
+    """
+    Build and store every size and format for the product's current image
+    and record them on the product. Returns the recorded map, or None if
+    the product has no image.
+    """
+    from .models import Product
+
+    product = Product.objects.filter(pk=product_id).only('image').first()
+    if product is None or not product.image:
+        return None
+    name = product.image.name
+    with product.image.open('rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+
+    sizes = {}
+    with Image.open(io.BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original)
+        for size, (width, height) in IMAGE_SIZES.items():
+            fitted = ImageOps.fit(original, (width, height), Image.Resampling.LANCZOS)
+            sizes[size] = {
+                fmt: _store(f'{VARIANT_DIR}/{digest}-{width}x{height}.{extension}', _encode(fitted, fmt))
+                for fmt, (extension, _) in FORMATS.items()
+            }
+
+    variants = {'source': name, 'sizes': sizes}
+    # Skip the write if another upload replaced the image meanwhile
+    if Product.objects.filter(pk=product_id, image=name).update(image_variants=variants):
+        invalidate_product_cache()
+    return variants
+
+
+def _run(product_id):
+    try:
+        generate_variants(product_id)
+    except Exception:
+        logger.exception('Could not generate image variants for product %s', product_id)
+    finally:
+        # Pool threads outlive requests, so nothing else closes this
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='product-images')
+        return _executor
+
+
+def schedule_variants(product_id):
+    """
+    Generate the product's variants in the background after commit
+    """
+    transaction.on_commit(lambda: get_executor().submit(_run, product_id))
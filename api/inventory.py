@@ -0,0 +1,256 @@
+"""
+Stock changes and the inventory ledger.
+
+``Product.quantity`` is the live stock figure. It is only changed by a
+single conditional UPDATE, so concurrent sales never read-modify-write it
+and can never oversell. Units held by reservations (``api.reservations``)
+stay in quantity and are counted in ``Product.reserved``; only the rest
+can be sold or written off. Every change also appends an
+InventoryMovement in the same database transaction; the ledger is the
+audit trail, and
+``compact_inventory`` (run by the ``compact_inventory`` command) folds it
+into per-product InventorySnapshot rows so stock can be checked against,
+and rebuilt from, the ledger without summing its whole history.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Max, Q, Sum, Value, When
+from django.utils import timezone
+
+from .cache import shared_cache
+from .models import InventoryMovement, InventorySnapshot, Product
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when a stock change would take a product below zero
+    """
+
+
+# Products per UPDATE; keeps the OR'ed conditions within SQLite's
+# expression depth limit
+STOCK_UPDATE_CHUNK = 500
+# Movements younger than this are left for the next compaction: ids are
+# allocated on insert, so a transaction still open may commit a lower id
+COMPACTION_LAG = getattr(settings, 'INVENTORY_COMPACTION_LAG', 60)
+COMPACTION_LOCK_KEY = 'inventory_compaction:lock'
+COMPACTION_LOCK_TIMEOUT = 300
+SNAPSHOT_BATCH_SIZE = 1000
+
+
+def _per_product(chunk):
+    """
+    Case expression picking each product's amount from ``[(id, amount), ...]``
+    """
+    return Case(*[When(pk=product_id, then=Value(amount)) for product_id, amount in chunk], default=Value(0))
+
+
+def _chunks(items):
+    for start in range(0, len(items), STOCK_UPDATE_CHUNK):
+        yield items[start:start + STOCK_UPDATE_CHUNK]
+
+
+def _record_movements(items, reason, user=None, transactions=None):
+    transactions = transactions or {}
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(product_id=product_id, delta=delta, reason=reason, user=user,
+                          transaction_id=transactions.get(product_id))
+        for product_id, delta in items if delta
+    ], batch_size=SNAPSHOT_BATCH_SIZE)
+
+
+def adjust_stock(deltas, reason, user=None, transactions=None):
+    """
+    Atomically apply signed stock changes with one UPDATE per
+    STOCK_UPDATE_CHUNK products.
+
+    ``deltas`` maps product id to the number of units to add (negative to
+    take). A product is only updated when the change leaves at least its
+    reserved units; the caller must run this inside ``transaction.atomic()``
+    so a partial match can be rolled back. Raises InsufficientStock when a
+    product is short or missing.
+
+    Each non-zero change is recorded as an InventoryMovement with
+    ``reason``, ``user`` and, when ``transactions`` maps the product id to
+    one, the Transaction id it belongs to.
+    """
+    items = list(deltas.items())
+    try:
+        # Savepoint, so a short product's chunk can be retried below
+        with transaction.atomic():
+            _apply_deltas(items)
+    except InsufficientStock:
+        if not _release_expired_holds([product_id for product_id, delta in items if delta < 0]):
+            raise
+        _apply_deltas(items)
+    _record_movements(items, reason, user, transactions)
+
+
+def _apply_deltas(items):
+    now = timezone.now()
+    for chunk in _chunks(items):
+        allowed = Q(pk__in=[product_id for product_id, delta in chunk if delta >= 0])
+        for product_id, delta in chunk:
+            if delta < 0:
+                allowed |= Q(pk=product_id, quantity__gte=F('reserved') - delta)
+
+        updated = Product.objects.filter(allowed).update(
+            quantity=F('quantity') + _per_product(chunk),
+            updated_at=now
+        )
+        if updated != len(chunk):
+            raise InsufficientStock('Not enough stock available')
+
+
+def _release_expired_holds(product_ids):
+    """
+    Release expired holds on ``product_ids`` that the sweeper has not got
+    to yet, so they never block a sale. Returns the number released.
+    """
+    # api.reservations builds on this module
+    from .reservations import release_expired
+
+    return release_expired(product_ids=product_ids) if product_ids else 0
+
+
+def decrement_stock(quantities, user=None, transactions=None):
+    """
+    Atomically take stock for several products in a single UPDATE.
+
+    ``quantities`` maps product id to the number of units to take. Rows are
+    only updated when every product still has enough stock; the caller must
+    run this inside ``transaction.atomic()`` so a partial match can be rolled
+    back. Raises InsufficientStock when any product is short. Recorded in
+    the ledger as sales.
+    """
+    adjust_stock(
+        {product_id: -quantity for product_id, quantity in quantities.items()},
+        InventoryMovement.SALE, user=user, transactions=transactions
+    )
+
+
+def hold_stock(product_id, quantity):
+    """
+    Count ``quantity`` units of a product as reserved, with one conditional
+    UPDATE. Raises InsufficientStock when fewer units are available.
+    Holding moves no stock, so nothing is written to the ledger.
+    """
+    def hold():
+        return Product.objects.filter(pk=product_id, quantity__gte=F('reserved') + quantity).update(
+            reserved=F('reserved') + quantity
+        )
+
+    if not hold() and not (_release_expired_holds([product_id]) and hold()):
+        raise InsufficientStock('Not enough stock available')
+
+
+def release_stock(quantities):
+    """
+    Stop counting held units as reserved. ``quantities`` maps product id to
+    the number of units released.
+    """
+    for chunk in _chunks(list(quantities.items())):
+        Product.objects.filter(pk__in=[product_id for product_id, _ in chunk]).update(
+            reserved=F('reserved') - _per_product(chunk)
+        )
+
+
+def sell_held_stock(quantities, user=None, transactions=None):
+    """
+    Take held units out of stock as sales. No stock check: the units were
+    set aside by hold_stock() and nothing else can take them.
+    """
+    items = list(quantities.items())
+    now = timezone.now()
+    for chunk in _chunks(items):
+        Product.objects.filter(pk__in=[product_id for product_id, _ in chunk]).update(
+            quantity=F('quantity') - _per_product(chunk),
+            reserved=F('reserved') - _per_product(chunk),
+            updated_at=now
+        )
+    _record_movements([(product_id, -quantity) for product_id, quantity in items],
+                      InventoryMovement.SALE, user, transactions)
+
+
+def unfolded_movements():
+    """
+    Movements not yet folded into their product's snapshot
+    """
+    return InventoryMovement.objects.filter(
+        Q(product__inventory_snapshot__isnull=True)
+        | Q(id__gt=F('product__inventory_snapshot__last_movement_id'))
+    )
+
+
+def compact_inventory(lag=None, rebuild=False):
+    """
+    Fold movements older than ``lag`` seconds (default
+    INVENTORY_COMPACTION_LAG) into InventorySnapshot rows, one upsert per
+    SNAPSHOT_BATCH_SIZE products. With ``rebuild`` the snapshots are first
+    discarded and recomputed from the whole ledger. Returns the number of
+    snapshots written, or None when another compaction holds the lock.
+    """
+    lag = COMPACTION_LAG if lag is None else lag
+    if not shared_cache.add(COMPACTION_LOCK_KEY, 1, COMPACTION_LOCK_TIMEOUT):
+        return None
+    try:
+        with transaction.atomic():
+            if rebuild:
+                InventorySnapshot.objects.all().delete()
+            # Everything up to the newest snapshot was folded by an earlier run
+            watermark = InventorySnapshot.objects.aggregate(last=Max('last_movement_id'))['last'] or 0
+            high = InventoryMovement.objects.filter(
+                id__gt=watermark, created_at__lte=timezone.now() - timedelta(seconds=lag)
+            ).aggregate(last=Max('id'))['last']
+            if high is None:
+                return 0
+
+            folds = dict(
+                unfolded_movements().filter(id__gt=watermark, id__lte=high)
+                .values_list('product_id').annotate(delta=Sum('delta')).order_by()
+            )
+            current = InventorySnapshot.objects.in_bulk(list(folds))
+            InventorySnapshot.objects.bulk_create(
+                [
+                    InventorySnapshot(
+                        product_id=product_id,
+                        quantity=(current[product_id].quantity if product_id in current else 0) + delta,
+                        last_movement_id=high,
+                    )
+                    for product_id, delta in folds.items()
+                ],
+                batch_size=SNAPSHOT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['product'],
+                update_fields=['quantity', 'last_movement_id', 'compacted_at'],
+            )
+        return len(folds)
+    finally:
+        shared_cache.delete(COMPACTION_LOCK_KEY)
+
+
+def ledger_quantities():
+    """
+    Stock per product id according to the ledger: its snapshot plus the
+    movements after it
+    """
+    quantities = dict(InventorySnapshot.objects.values_list('product_id', 'quantity'))
+    pending = unfolded_movements().values_list('product_id').annotate(delta=Sum('delta')).order_by()
+    for product_id, delta in pending:
+        quantities[product_id] = quantities.get(product_id, 0) + delta
+    return quantities
+
+
+def verify_inventory():
+    """
+    Products whose quantity disagrees with the ledger, as
+    ``[(product_id, quantity, ledger quantity), ...]``
+    """
+    ledger = ledger_quantities()
+    return [
+        (product_id, quantity, ledger.get(product_id, 0))
+        for product_id, quantity in Product.objects.order_by('pk').values_list('pk', 'quantity')
+        if quantity != ledger.get(product_id, 0)
+    ]
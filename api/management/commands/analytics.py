@@ -0,0 +1,50 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.analytics import REPORTS, ReportParams, TransactionColumns, np
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the analytics column files and runs an analysis over them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('report', choices=['refresh', *REPORTS],
+                            help='Analysis to print as JSON, or refresh to only update the files')
+        parser.add_argument('--rebuild', action='store_true', help='Reload every transaction')
+        parser.add_argument('--interval', type=float,
+                            help='With refresh, keep running, refreshing every INTERVAL seconds')
+        parser.add_argument('--product', type=int, action='append', help='Limit to this product id (repeatable)')
+        defaults = ReportParams()
+        parser.add_argument('--days', type=int, default=defaults.days)
+        parser.add_argument('--window', type=int, default=defaults.window)
+        parser.add_argument('--horizon', type=int, default=defaults.horizon)
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('Analytics need NumPy (pip install numpy)')
+
+        store = TransactionColumns()
+        self.refresh(store, options['rebuild'])
+        if options['report'] == 'refresh':
+            while options['interval']:
+                close_old_connections()
+                time.sleep(options['interval'])
+                self.refresh(store)
+            return
+
+        columns = store.load()
+        if columns is None:
+            raise CommandError('No analytics data yet')
+        params = ReportParams(options['product'], options['days'], options['window'], options['horizon'])
+        self.stdout.write(json.dumps(REPORTS[options['report']](columns, params), indent=2))
+
+    def refresh(self, store, rebuild=False):
+        start = time.perf_counter()
+        appended = store.refresh(rebuild=rebuild)
+        if appended is None:
+            self.stderr.write('Another refresh is running; using the files as they are')
+        else:
+            self.stderr.write(f'Loaded {appended} transactions in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.cache import invalidate_product_cache
+from api.inventory import COMPACTION_LAG, compact_inventory, verify_inventory
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Folds new inventory movements into the stock snapshots and checks stock against the ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep running, compacting every INTERVAL seconds')
+        parser.add_argument('--lag', type=float, default=COMPACTION_LAG,
+                            help='Leave movements younger than this many seconds for the next run')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every snapshot from the whole ledger')
+        parser.add_argument('--verify', action='store_true',
+                            help='Report products whose quantity disagrees with the ledger')
+        parser.add_argument('--repair', action='store_true',
+                            help='With --verify, set those quantities from the ledger')
+
+    def compact(self, options):
+        written = compact_inventory(lag=options['lag'], rebuild=options['rebuild'])
+        if written is None:
+            self.stderr.write('Another compaction is running')
+        else:
+            self.stdout.write(f'Compacted {written} snapshots')
+
+    def handle(self, *args, **options):
+        if options['repair'] and not options['verify']:
+            raise CommandError('--repair needs --verify')
+
+        if options['interval']:
+            while True:
+                self.compact(options)
+                options['rebuild'] = False
+                close_old_connections()
+                time.sleep(options['interval'])
+        self.compact(options)
+
+        if options['verify']:
+            mismatches = verify_inventory()
+            for product_id, quantity, ledger in mismatches:
+                self.stderr.write(f'Product {product_id}: quantity {quantity}, ledger {ledger}')
+            if mismatches and options['repair']:
+                for product_id, quantity, ledger in mismatches:
+                    Product.objects.filter(pk=product_id).update(quantity=ledger)
+                invalidate_product_cache()
+                self.stdout.write(self.style.SUCCESS(f'Repaired {len(mismatches)} products'))
+            elif mismatches:
+                raise CommandError(f'{len(mismatches)} products disagree with the ledger')
+            else:
+                self.stdout.write(self.style.SUCCESS('Stock matches the ledger'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.images import current_variants, generate_variants
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Generates missing thumbnail and WebP variants for product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate existing variants too')
+
+    def handle(self, *args, **options):
+        generated = 0
+        products = Product.objects.exclude(image='').exclude(image__isnull=True).only('image', 'image_variants')
+        for product in products.iterator():
+            if not options['force'] and current_variants(product.image.name, product.image_variants):
+                continue
+            try:
+                generate_variants(product.pk)
+            except Exception as e:
+                self.stderr.write(f'Product {product.pk}: {e}')
+                continue
+            generated += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {generated} products'))
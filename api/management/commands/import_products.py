@@ -0,0 +1,74 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulk import DEFAULT_BATCH_SIZE, batched, finish_upsert, upsert_batch, validate_rows
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates products, matched by name, from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file, or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Rows validated and written per statement')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only')
+
+    def read_rows(self, stream, input_format):
+        if input_format == 'csv':
+            for row in csv.DictReader(stream):
+                # Empty cells mean "not given", not an empty value
+                yield {key: value for key, value in row.items() if value not in ('', None)}
+            return
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise CommandError(f'Line {number}: invalid JSON ({e})')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        try:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(str(e))
+        start = time.perf_counter()
+        totals = {'read': 0, 'created': 0, 'updated': 0, 'invalid': 0}
+        try:
+            for batch in batched(self.read_rows(stream, input_format), options['batch_size']):
+                valid, errors = validate_rows(batch)
+                for index, detail in errors:
+                    self.stderr.write(f'Row {totals["read"] + index + 1}: {detail}')
+                totals['read'] += len(batch)
+                totals['invalid'] += len(errors)
+                if valid and not options['dry_run']:
+                    created, updated, rejected = upsert_batch(valid)
+                    for name, detail in rejected:
+                        self.stderr.write(f'Product {name!r}: {detail}')
+                    totals['created'] += created
+                    totals['updated'] += updated
+                    totals['invalid'] += len(rejected)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'{totals["read"]} rows ({totals["read"] / elapsed:,.0f} rows/s)')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if totals['created'] or totals['updated']:
+                finish_upsert()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{totals["created"]} created, {totals["updated"]} updated, {totals["invalid"]} invalid '
+            f'in {elapsed:.1f}s ({totals["read"] / elapsed:,.0f} rows/s)'
+        ))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Deletes stored Idempotency-Key responses that have expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep running, purging every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            purged = purge_expired_keys()
+            self.stdout.write(f'Purged {purged} expired idempotency keys')
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
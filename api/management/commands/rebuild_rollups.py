@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.reports import rebuild_rollups
+from api.views.transactions import parse_export_bound
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the hourly and daily sales rollups from the transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild from this date or datetime on (default: everything)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since, _ = parse_export_bound(options['since'])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        start = time.perf_counter()
+        written = rebuild_rollups(since)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} rollup rows in {time.perf_counter() - start:.1f}s'
+        ))
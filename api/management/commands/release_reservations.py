@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Releases the stock held by expired cart reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep running, sweeping every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired()
+            self.stdout.write(f'Released {released} expired reservations')
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,160 @@
+"""
+Serving of uploaded media for deployments without a separate file server.
+
+Responses carry ETag and Last-Modified, honour conditional requests and
+single byte ranges, and are cached by browsers: content-hashed files
+(see ``api.images``) for a year as immutable, everything else for
+MEDIA_CACHE_MAX_AGE seconds. Full responses are FileResponses, which WSGI
+servers with ``wsgi.file_wrapper`` (gunicorn) send with sendfile(). With
+MEDIA_ACCEL_REDIRECT set, nginx sends the file instead
+(``X-Accel-Redirect``) and Django only sets the headers.
+"""
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .images import VARIANT_DIR
+
+MEDIA_CACHE_MAX_AGE = getattr(settings, 'MEDIA_CACHE_MAX_AGE', 60 * 60)
+# Files under these prefixes never change once written
+MEDIA_IMMUTABLE_PREFIXES = getattr(settings, 'MEDIA_IMMUTABLE_PREFIXES', (f'{VARIANT_DIR}/',))
+MEDIA_ACCEL_REDIRECT = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Read size when the bytes do pass through Python (no sendfile)
+BLOCK_SIZE = 64 * 1024
+
+range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single satisfiable byte range, None
+    to send the whole file, or raise ValueError if it is unsatisfiable.
+    Multiple ranges are answered with the whole file, as RFC 9110 allows.
+    """
+    match = range_re.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            # Invalid rather than unsatisfiable; ignore it
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length:
+            raise ValueError(header)
+        start, end = max(size - length, 0), size - 1
+    if start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFileResponse(StreamingHttpResponse):
+    """
+    Bytes ``start``-``end`` of an open file. Not handed to
+    ``wsgi.file_wrapper``, which may send to EOF.
+    """
+    block_size = BLOCK_SIZE
+
+    def __init__(self, filelike, start, end, **kwargs):
+        filelike.seek(start)
+        super().__init__(self._read(filelike, end - start + 1), **kwargs)
+        self._resource_closers.append(filelike.close)
+        self['Content-Length'] = str(end - start + 1)
+
+    def _read(self, filelike, remaining):
+        while remaining > 0:
+            chunk = filelike.read(min(self.block_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def cache_control(path):
+    if path.startswith(MEDIA_IMMUTABLE_PREFIXES):
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={MEDIA_CACHE_MAX_AGE}'
+
+
+def if_range_matches(request, etag, last_modified):
+    """
+    False when an If-Range precondition fails and the whole file must be sent
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_media(request, path, document_root=None):
+    """
+    Serve ``path`` from ``document_root`` (default MEDIA_ROOT)
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = Path(safe_join(document_root or settings.MEDIA_ROOT, path))
+        stat = fullpath.stat()
+    except (OSError, ValueError):
+        raise Http404('Not found')
+    if not fullpath.is_file():
+        raise Http404('Not found')
+
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    last_modified = int(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': cache_control(path),
+        'Accept-Ranges': 'bytes',
+    }
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(str(fullpath))
+    content_type = content_type or 'application/octet-stream'
+
+    if MEDIA_ACCEL_REDIRECT:
+        # nginx handles Range and sendfile() itself
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Accel-Redirect'] = MEDIA_ACCEL_REDIRECT.rstrip('/') + '/' + path
+        return response
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header and request.method in ('GET', 'HEAD') and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416, headers=headers)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(fullpath.open('rb'), content_type=content_type, headers=headers)
+        response.block_size = BLOCK_SIZE
+    else:
+        start, end = byte_range
+        response = RangeFileResponse(fullpath.open('rb'), start, end, status=206,
+                                     content_type=content_type, headers=headers)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
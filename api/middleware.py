@@ -0,0 +1,121 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware, re_accepts_gzip
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+from .timing import RequestTimings, activate, deactivate
+
+# Below this many bytes the gzip header and CPU time outweigh the savings
+GZIP_MIN_LENGTH = getattr(settings, 'GZIP_MIN_LENGTH', 1024)
+# Send per-request timings to clients; the log line is always written
+SERVER_TIMING = getattr(settings, 'SERVER_TIMING', False)
+
+timing_logger = logging.getLogger('api.timing')
+
+
+def accepts_gzip(request):
+    return bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+def gzip_content(content):
+    """
+    Compress ``content`` the way MinimumSizeGZipMiddleware would, or
+    return None when it would send it uncompressed
+    """
+    if len(content) < GZIP_MIN_LENGTH:
+        return None
+    compressed = compress_string(content, max_random_bytes=GZipMiddleware.max_random_bytes)
+    return compressed if len(compressed) < len(content) else None
+
+
+def use_compressed(response, compressed):
+    """
+    Send already-compressed bytes, e.g. from the response cache
+    """
+    response.content = compressed
+    response['Content-Length'] = str(len(compressed))
+    response['Content-Encoding'] = 'gzip'
+    response.precompressed = True
+    return response
+
+
+class MinimumSizeGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that leaves responses shorter than GZIP_MIN_LENGTH bytes
+    alone (Django's own cut-off is 200 bytes), as well as files served with
+    byte ranges, which must go out as stored. Responses compressed ahead
+    of time with ``use_compressed()`` get the Vary and weak ETag headers
+    the middleware would have set.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header('Accept-Ranges'):
+            return response
+        if getattr(response, 'precompressed', False):
+            patch_vary_headers(response, ('Accept-Encoding',))
+            etag = response.get('ETag')
+            if etag and etag.startswith('"'):
+                response['ETag'] = 'W/' + etag
+            return response
+        if not response.streaming and len(response.content) < GZIP_MIN_LENGTH:
+            return response
+        return super().process_response(request, response)
+
+
+class ServerTimingMiddleware:
+    """
+    Time each request (see api.timing): queries and their time on every
+    database connection, cache hits, misses and time, authentication,
+    throttling, serialization and rendering. The results go out as one
+    ``key=value`` line on the ``api.timing`` logger, whose record also
+    carries them as ``timings``, and as a Server-Timing header to staff
+    users, in DEBUG, or to everyone when SERVER_TIMING is True.
+
+    Install it first so ``total`` covers the other middleware. The body of
+    a streaming response is produced after it returns and is not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = activate(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.time_query))
+                response = self.get_response(request)
+        finally:
+            deactivate(token)
+        timings.finish()
+
+        if self.send_header(request):
+            response['Server-Timing'] = timings.header()
+        self.log(request, response, timings)
+        return response
+
+    def send_header(self, request):
+        # Timings tell anyone where the server spends its time; DRF views
+        # set request.user once they have authenticated
+        user = getattr(request, 'user', None)
+        return SERVER_TIMING or settings.DEBUG or bool(user and user.is_staff)
+
+    def log(self, request, response, timings):
+        if not timing_logger.isEnabledFor(logging.INFO):
+            return
+        match = request.resolver_match
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'view': (match.view_name or match._func_path) if match else None,
+            'status': response.status_code,
+        }
+        fields.update({f'{name}_ms': ms for name, ms in timings.metrics().items()})
+        fields.update(timings.counts)
+        timing_logger.info(' '.join(f'{key}={value}' for key, value in fields.items()),
+                           extra={'timings': fields})
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["user", "-created_at"], name="api_txn_user_created_idx"),
+        ),
+    ]
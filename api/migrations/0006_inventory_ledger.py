@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def record_opening_stock(apps, schema_editor):
+    Product = apps.get_model("api", "Product")
+    InventoryMovement = apps.get_model("api", "InventoryMovement")
+    InventoryMovement.objects.bulk_create(
+        [
+            InventoryMovement(product_id=product_id, delta=quantity, reason="OPENING")
+            for product_id, quantity in Product.objects.exclude(quantity=0).values_list("id", "quantity")
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("api", "0005_product_image_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InventorySnapshot",
+            fields=[
+                ("product", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name="inventory_snapshot", serialize=False, to="api.product")),
+                ("quantity", models.IntegerField(default=0)),
+                ("last_movement_id", models.BigIntegerField(default=0)),
+                ("compacted_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="InventoryMovement",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("delta", models.IntegerField()),
+                ("reason", models.CharField(choices=[("OPENING", "Opening stock"), ("SALE", "Sale"), ("ADJUSTMENT", "Transaction adjusted"), ("REFUND", "Transaction deleted"), ("RESTOCK", "Restock"), ("CORRECTION", "Manual correction")], max_length=10)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("product", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="movements", to="api.product")),
+                ("transaction", models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name="movements", to="api.transaction")),
+                ("user", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["product", "id"], name="api_movement_product_id_idx")],
+            },
+        ),
+        migrations.RunPython(record_opening_stock, migrations.RunPython.noop),
+    ]
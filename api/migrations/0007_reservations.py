@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("api", "0006_inventory_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="reserved",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="Reservation",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("quantity", models.PositiveIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("expires_at", models.DateTimeField()),
+                ("product", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="reservations", to="api.product")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="reservations", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["expires_at"], name="api_reservation_expiry_idx"), models.Index(fields=["user", "expires_at"], name="api_reservation_user_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_reservations"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("grain", models.CharField(choices=[("hour", "Hour"), ("day", "Day")], max_length=4)),
+                ("period_start", models.DateTimeField()),
+                ("payment_method", models.CharField(choices=[("CASH", "Cash Payment"), ("APP", "App Payment")], max_length=10)),
+                ("quantity", models.IntegerField(default=0)),
+                ("revenue", models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ("transactions", models.IntegerField(default=0)),
+                ("product", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="sales_rollups", to="api.product")),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="salesrollup",
+            constraint=models.UniqueConstraint(fields=("grain", "period_start", "product", "payment_method"), name="api_rollup_unique_period"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_sales_rollups"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["updated_at"], name="api_txn_updated_idx"),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_transaction_updated_index"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="api_txn_user_created_idx",
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["user", "-created_at", "-id"], name="api_txn_user_created_idx"),
+        ),
+    ]
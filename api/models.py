@@ -1,23 +1,91 @@
-from django.db import models
+from django.db import models, transaction
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import User
 
+from .images import image_source, image_sources
+
 class Product(models.Model):
     name = models.CharField(max_length=100, unique=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.IntegerField(default=0)
+    # Units of quantity held by unexpired reservations (see api.reservations)
+    reserved = models.IntegerField(default=0, editable=False)
     image = models.ImageField(upload_to='products/', null=True, blank=True)
     image_url = models.URLField(max_length=200, null=True, blank=True)
+    # Resized copies of image, filled in by api.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.name} - ${self.price} (Qty: {self.quantity})"
 
+    # Written only by api.inventory's conditional UPDATEs, never by save()
+    STOCK_FIELDS = ('quantity', 'reserved')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'quantity' in field_names:
+            # The stock the editor saw; save() applies edits relative to it
+            instance._loaded_quantity = instance.quantity
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or 'quantity' in fields:
+            self._loaded_quantity = self.quantity
+
+    def save(self, *args, **kwargs):
+        """
+        Direct edits of quantity (admin, PUT/PATCH) are applied as the
+        change from the quantity that was loaded, through
+        api.inventory.adjust_stock, and recorded in the ledger as
+        corrections. Units sold or held in the meantime are kept, and
+        ``reserved`` is never written back. Raises InsufficientStock when
+        the edit would leave fewer units than are held.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'quantity' not in update_fields:
+            return super().save(*args, **kwargs)
+        if self._state.adding:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                if self.quantity:
+                    InventoryMovement.objects.create(product=self, delta=self.quantity,
+                                                     reason=InventoryMovement.OPENING)
+            self._loaded_quantity = self.quantity
+            return
+
+        # api.inventory builds on these models
+        from .inventory import adjust_stock
+
+        if update_fields is None:
+            update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+        kwargs['update_fields'] = [name for name in update_fields if name not in self.STOCK_FIELDS]
+        with transaction.atomic():
+            loaded = getattr(self, '_loaded_quantity', None)
+            if loaded is None:
+                # Not loaded from the database, e.g. Product(pk=...): the
+                # quantity is the new absolute figure
+                loaded = Product.objects.select_for_update().values_list('quantity', flat=True).get(pk=self.pk)
+            super().save(*args, **kwargs)
+            if self.quantity != loaded:
+                adjust_stock({self.pk: self.quantity - loaded}, InventoryMovement.CORRECTION)
+            self.quantity, self.reserved = Product.objects.values_list(*self.STOCK_FIELDS).get(pk=self.pk)
+        self._loaded_quantity = self.quantity
+
+    @property
+    def available_quantity(self):
+        return self.quantity - self.reserved
+
     @property
     def image_source(self):
-        if self.image:
-            return self.image.url
-        return self.image_url
+        return image_source(self.image.name, self.image_url, self.image_variants)
+
+    @property
+    def image_sources(self):
+        return image_sources(self.image.name, self.image_url, self.image_variants)
 
 class Transaction(models.Model):
     PAYMENT_METHODS = [
@@ -40,6 +108,15 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Serves a user's history newest-first, and its (created_at, id)
+            # keyset cursors, without sorting the table
+            models.Index(fields=['user', '-created_at', '-id'], name='api_txn_user_created_idx'),
+            # Lets the analytics refresh find edited rows without a full scan
+            models.Index(fields=['updated_at'], name='api_txn_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.product.name} - {self.payment_method} - {self.status}"
 
@@ -47,3 +124,129 @@ class Transaction(models.Model):
         if not self.total_amount:
             self.total_amount = self.product.price * self.quantity
         super().save(*args, **kwargs)
+
+class IdempotencyKey(models.Model):
+    """
+    Stored outcome of a mutating request sent with an Idempotency-Key header.
+    A row without a status_code is a request that is still in flight.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'in flight'})"
+
+
+class Reservation(models.Model):
+    """
+    Units of a product held for a user's cart until expires_at. The units
+    stay in Product.quantity and are counted in Product.reserved.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The sweeper reads expired holds oldest first from the index
+            models.Index(fields=['expires_at'], name='api_reservation_expiry_idx'),
+            models.Index(fields=['user', 'expires_at'], name='api_reservation_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} holds {self.quantity} x {self.product_id} until {self.expires_at}"
+
+
+class SalesRollup(models.Model):
+    """
+    Completed sales of one product with one payment method in one hour or
+    day, kept up to date by api.reports
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    GRAINS = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+
+    grain = models.CharField(max_length=4, choices=GRAINS)
+    period_start = models.DateTimeField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_rollups')
+    payment_method = models.CharField(max_length=10, choices=Transaction.PAYMENT_METHODS)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transactions = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['grain', 'period_start', 'product', 'payment_method'],
+                                    name='api_rollup_unique_period'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.payment_method} {self.grain} {self.period_start}: {self.revenue}"
+
+
+class InventoryMovement(models.Model):
+    """
+    One change to a product's stock. Rows are only ever appended: the sum
+    of a product's deltas is its quantity, and InventorySnapshot holds
+    that sum up to a given movement (see api.inventory).
+    """
+    OPENING = 'OPENING'
+    SALE = 'SALE'
+    ADJUSTMENT = 'ADJUSTMENT'
+    REFUND = 'REFUND'
+    RESTOCK = 'RESTOCK'
+    CORRECTION = 'CORRECTION'
+    REASONS = [
+        (OPENING, 'Opening stock'),
+        (SALE, 'Sale'),
+        (ADJUSTMENT, 'Transaction adjusted'),
+        (REFUND, 'Transaction deleted'),
+        (RESTOCK, 'Restock'),
+        (CORRECTION, 'Manual correction'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='movements')
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=10, choices=REASONS)
+    # Kept after the transaction itself is deleted, for the audit trail
+    transaction = models.ForeignKey(Transaction, null=True, blank=True, on_delete=models.DO_NOTHING,
+                                    db_constraint=False, related_name='movements')
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A product's movements after its snapshot, in order
+            models.Index(fields=['product', 'id'], name='api_movement_product_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Inventory movements are append-only')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.product_id} {self.delta:+d} ({self.reason})"
+
+
+class InventorySnapshot(models.Model):
+    """
+    A product's stock as of last_movement_id, written by the compactor
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='inventory_snapshot')
+    quantity = models.IntegerField(default=0)
+    last_movement_id = models.BigIntegerField(default=0)
+    compacted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product_id}: {self.quantity} (to movement {self.last_movement_id})"
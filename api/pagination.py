@@ -0,0 +1,184 @@
+import hashlib
+import json
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+COUNT_CACHE_TIMEOUT = getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 60)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator whose COUNT(*) is cached per query.
+
+    With a ``count_version`` (e.g. the product generation) the count is
+    exact: any write moves to a new key. Without one it may lag behind by
+    up to PAGINATION_COUNT_CACHE_TIMEOUT seconds, which is an acceptable
+    approximation for page links on very large tables.
+    """
+
+    def __init__(self, object_list, per_page, count_version=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_version = count_version
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None:
+            return super().count
+        try:
+            sql, params = query.sql_with_params()
+        except EmptyResultSet:
+            # e.g. pk__in=[] from a search without matches
+            return 0
+        digest = hashlib.sha1(f'{sql}|{params!r}|{self.count_version}'.encode()).hexdigest()
+        key = f'page_count:{digest}'
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the view's ordering plus ``id``; never issues
+    an OFFSET scan or a COUNT(*).
+
+    DRF's cursor carries only the first ordering field and counts an offset
+    past rows that share it, which skips or repeats rows when one is
+    inserted at that value (e.g. a checkout's transactions, which share a
+    timestamp). Here the ordering always ends in the unique ``id``, the
+    cursor carries every ordering value and the page starts strictly after
+    that tuple.
+    """
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not {'id', 'pk'} & {field.lstrip('-') for field in ordering}:
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def _get_position_from_instance(self, instance, ordering):
+        fields = [field.lstrip('-') for field in ordering]
+        if isinstance(instance, dict):
+            values = [instance[field] for field in fields]
+        else:
+            values = [getattr(instance, field) for field in fields]
+        return json.dumps([str(value) for value in values])
+
+    def _after(self, ordering, position):
+        """
+        Rows strictly after ``position`` in ``ordering``:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        after, equal = Q(pk__in=[]), Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            after |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return after
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, current_position = self.cursor or (0, False, None)
+
+        # Backwards pages walk the reversed ordering and flip the page
+        order = self.ordering
+        if reverse:
+            order = tuple(field[1:] if field.startswith('-') else f'-{field}' for field in order)
+        queryset = queryset.order_by(*order)
+        if current_position is not None:
+            queryset = queryset.filter(self._after(order, current_position))
+
+        # One extra row tells whether a following page exists. Positions are
+        # unique, so the links never carry an offset; a hand-made one is
+        # still honoured, up to offset_cutoff
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering)
+            if len(results) > len(self.page) else None
+        )
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class HybridPagination(PageNumberPagination):
+    """
+    Page-number pagination with cached counts by default, and opt-in keyset
+    pagination with ``?pagination=cursor`` (the ``next``/``previous`` links
+    then carry a ``cursor`` parameter). Deep keyset pages cost the same as
+    the first one.
+
+    Views may define ``get_count_version()`` to make cached counts exact,
+    and ``cursor_ordering`` to choose the keyset when no ordering filter
+    applies.
+    """
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+
+    def use_cursor(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = KeysetPagination()
+            self.cursor_paginator.ordering = getattr(view, 'cursor_ordering', KeysetPagination.ordering)
+            page = self.cursor_paginator.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.cursor_paginator.display_page_controls
+            return page
+
+        get_count_version = getattr(view, 'get_count_version', None)
+        self.django_paginator_class = partial(
+            CachedCountPaginator,
+            count_version=get_count_version() if get_count_version else None
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
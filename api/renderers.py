@@ -0,0 +1,105 @@
+import csv
+import datetime
+import io
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .timing import measure
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    The output is the same as DRF's compact JSON. Datetimes and the types
+    orjson has no native support for (Decimal, lazy strings, ...) are
+    handed to DRF's own encoder. Indented or ASCII-only output, e.g. for
+    the browsable API, still goes through the stdlib encoder.
+    """
+    orjson_options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    @measure('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=self.orjson_options)
+        # Like JSONRenderer, escape the separators that are invalid in JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class StreamingRenderer(BaseRenderer):
+    """
+    Renderer for row exports. ``stream()`` encodes an iterator of tuples
+    lazily, ``batch_size`` rows per chunk, for use with
+    StreamingHttpResponse. ``render()`` only handles ordinary responses
+    such as errors.
+    """
+    charset = 'utf-8'
+    batch_size = 1000
+
+    def encode_batch(self, header, rows):
+        raise NotImplementedError
+
+    def stream(self, header, rows):
+        rows = iter(rows)
+        yield self.encode_header(header)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return
+            yield self.encode_batch(header, batch)
+
+    def encode_header(self, header):
+        return b''
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def encode_batch(self, header, rows):
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        return ''.join(encoder.encode(dict(zip(header, row))) + '\n' for row in rows).encode()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=DjangoJSONEncoder) + '\n').encode()
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def _encode(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+    def encode_header(self, header):
+        return self._encode([header])
+
+    def encode_batch(self, header, rows):
+        # Same timestamp format as the JSON renderers
+        default = DjangoJSONEncoder().default
+        return self._encode(
+            [default(value) if isinstance(value, datetime.datetime) else value for value in row]
+            for row in rows
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        return self._encode([list(data), [data[key] for key in data]])
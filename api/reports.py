@@ -0,0 +1,114 @@
+"""
+Sales rollups: quantity, revenue and number of completed transactions per
+product and payment method, by hour and by day.
+
+``record_sales`` adds signed changes to the rollup rows inside the
+caller's database transaction, so a rollup changes exactly when the sale
+it counts commits. ``rebuild_rollups`` (the ``rebuild_rollups`` command)
+recomputes them from the Transaction table for backfills. The sales
+report reads only the rollups, so its cost follows the number of periods
+asked for, not the size of the sales history.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import SalesRollup, Transaction
+
+TRUNCATE = {SalesRollup.HOUR: TruncHour, SalesRollup.DAY: TruncDay}
+REBUILD_BATCH_SIZE = 1000
+
+
+def period_start(moment, grain):
+    """
+    Start of the hour or day holding ``moment``, in the current time zone
+    like the database's TruncHour/TruncDay
+    """
+    local = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    return local.replace(hour=0) if grain == SalesRollup.DAY else local
+
+
+def sale_changes(transactions, sign=1):
+    """
+    Rollup changes for completed transactions: ``sign`` 1 counts them, -1
+    takes them back out
+    """
+    return [
+        (t.created_at, t.product_id, t.payment_method, sign * t.quantity, sign * t.total_amount, sign)
+        for t in transactions if t.status == 'COMPLETED'
+    ]
+
+
+def record_sales(changes):
+    """
+    Add ``[(created_at, product_id, payment_method, quantity, revenue,
+    transactions), ...]`` to the hourly and daily rollups. Must run inside
+    ``transaction.atomic()`` with the sales being counted.
+    """
+    totals = defaultdict(lambda: [0, Decimal('0'), 0])
+    for created_at, product_id, payment_method, quantity, revenue, count in changes:
+        for grain in TRUNCATE:
+            total = totals[(grain, period_start(created_at, grain), product_id, payment_method)]
+            total[0] += quantity
+            total[1] += revenue
+            total[2] += count
+
+    for (grain, start, product_id, payment_method), (quantity, revenue, count) in totals.items():
+        rollup = SalesRollup.objects.filter(grain=grain, period_start=start, product_id=product_id,
+                                            payment_method=payment_method)
+        increments = {
+            'quantity': F('quantity') + quantity,
+            'revenue': F('revenue') + revenue,
+            'transactions': F('transactions') + count,
+        }
+        if rollup.update(**increments):
+            continue
+        try:
+            # Savepoint, so losing the race to create the row keeps the
+            # caller's transaction usable
+            with transaction.atomic():
+                SalesRollup.objects.create(grain=grain, period_start=start, product_id=product_id,
+                                           payment_method=payment_method, quantity=quantity,
+                                           revenue=revenue, transactions=count)
+        except IntegrityError:
+            rollup.update(**increments)
+
+
+def rebuild_rollups(since=None):
+    """
+    Recompute the rollups from completed transactions, all of them or those
+    from the start of the day holding ``since``. Returns the number of
+    rollup rows written.
+    """
+    sales = Transaction.objects.filter(status='COMPLETED')
+    rollups = SalesRollup.objects.all()
+    if since is not None:
+        since = period_start(since, SalesRollup.DAY)
+        sales = sales.filter(created_at__gte=since)
+        rollups = rollups.filter(period_start__gte=since)
+
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        for grain, truncate in TRUNCATE.items():
+            totals = (
+                sales.annotate(period=truncate('created_at'))
+                .values('period', 'product_id', 'payment_method')
+                .annotate(units=Sum('quantity'), revenue=Sum('total_amount'), count=Count('id'))
+                .order_by()
+            )
+            created = SalesRollup.objects.bulk_create(
+                [
+                    SalesRollup(grain=grain, period_start=row['period'], product_id=row['product_id'],
+                                payment_method=row['payment_method'], quantity=row['units'],
+                                revenue=row['revenue'], transactions=row['count'])
+                    for row in totals.iterator()
+                ],
+                batch_size=REBUILD_BATCH_SIZE,
+            )
+            written += len(created)
+    return written
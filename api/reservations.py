@@ -0,0 +1,133 @@
+"""
+Time-bounded stock reservations for carts.
+
+``reserve`` holds units with one conditional UPDATE of
+``Product.reserved``, so a shopper learns at add-to-cart time whether the
+stock is there. ``purchase`` turns a hold into a Transaction without a
+second stock check. Holds that reach ``expires_at`` are released by
+``release_expired``, which reads them oldest first from the expiry index:
+one batch before every new reservation, and all of them from the
+``release_reservations`` command.
+
+Each hold is released or sold by whoever deletes its row, so a hold that
+is cancelled, purchased and swept at the same time is only counted once.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_product_cache
+from .inventory import hold_stock, release_stock, sell_held_stock
+from .models import Reservation, Transaction
+from .reports import record_sales, sale_changes
+
+RESERVATION_TTL = getattr(settings, 'RESERVATION_TTL', 10 * 60)
+RESERVATION_MAX_TTL = getattr(settings, 'RESERVATION_MAX_TTL', 30 * 60)
+SWEEP_BATCH_SIZE = 500
+
+
+class ReservationExpired(Exception):
+    """
+    Raised when purchasing a reservation past its expiry
+    """
+
+
+def _claim(reservation):
+    # Deleting the row is what entitles the caller to its units
+    deleted, _ = Reservation.objects.filter(pk=reservation.pk).delete()
+    return bool(deleted)
+
+
+def reserve(user, product, quantity, ttl=None):
+    """
+    Hold ``quantity`` units of ``product`` for ``ttl`` seconds (default
+    RESERVATION_TTL). Raises InsufficientStock when fewer are available.
+    """
+    release_expired(limit=SWEEP_BATCH_SIZE)
+    with transaction.atomic():
+        hold_stock(product.pk, quantity)
+        reservation = Reservation.objects.create(
+            product=product,
+            user=user,
+            quantity=quantity,
+            expires_at=timezone.now() + timedelta(seconds=ttl or RESERVATION_TTL)
+        )
+    invalidate_product_cache()
+    return reservation
+
+
+def cancel(reservation):
+    """
+    Release a reservation's units straight away
+    """
+    with transaction.atomic():
+        if _claim(reservation):
+            release_stock({reservation.product_id: reservation.quantity})
+    invalidate_product_cache()
+
+
+def purchase(reservation, payment_method='APP'):
+    """
+    Buy the held units. Raises ReservationExpired, after releasing the
+    units, when the reservation has expired, and Reservation.DoesNotExist
+    when it was already purchased, cancelled or swept.
+    """
+    expired = reservation.expires_at <= timezone.now()
+    with transaction.atomic():
+        if not _claim(reservation):
+            raise Reservation.DoesNotExist('Reservation not found')
+        if expired:
+            release_stock({reservation.product_id: reservation.quantity})
+        else:
+            transaction_obj = Transaction.objects.create(
+                product=reservation.product,
+                user=reservation.user,
+                quantity=reservation.quantity,
+                payment_method=payment_method,
+                total_amount=reservation.product.price * reservation.quantity,
+                status='COMPLETED'
+            )
+            sell_held_stock({reservation.product_id: reservation.quantity}, user=reservation.user,
+                            transactions={reservation.product_id: transaction_obj.pk})
+            record_sales(sale_changes([transaction_obj]))
+    invalidate_product_cache()
+    if expired:
+        raise ReservationExpired('Reservation has expired')
+    return transaction_obj
+
+
+def release_expired(now=None, limit=None, product_ids=None):
+    """
+    Release holds that expired by ``now``, SWEEP_BATCH_SIZE per database
+    transaction, stopping after roughly ``limit`` holds. With
+    ``product_ids``, only holds on those products are released. Returns
+    the number released.
+    """
+    now = now or timezone.now()
+    holds = Reservation.objects.select_for_update(skip_locked=True).filter(expires_at__lte=now)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    released = 0
+    while limit is None or released < limit:
+        with transaction.atomic():
+            # Range scan of api_reservation_expiry_idx; skip_locked lets
+            # several sweepers share the backlog where the database has it
+            expired = list(
+                holds.order_by('expires_at').values_list('pk', 'product_id', 'quantity')[:SWEEP_BATCH_SIZE]
+            )
+            if not expired:
+                break
+            Reservation.objects.filter(pk__in=[pk for pk, _, _ in expired]).delete()
+            quantities = defaultdict(int)
+            for _, product_id, quantity in expired:
+                quantities[product_id] += quantity
+            release_stock(quantities)
+        released += len(expired)
+        if len(expired) < SWEEP_BATCH_SIZE:
+            break
+    if released:
+        invalidate_product_cache()
+    return released
@@ -0,0 +1,202 @@
+import bisect
+import logging
+import threading
+from collections import defaultdict
+
+from django.db import DatabaseError
+from rest_framework import filters
+
+from .cache import bump_generation, generation
+from .models import Product
+
+NAMES_GENERATION_KEY = 'product_names_generation'
+# Beyond this many matches an IN (...) list costs more than the LIKE scan
+MAX_INDEXED_MATCHES = 1000
+# Shorter terms have no trigram; they are matched against every name
+MIN_SUBSTRING_LENGTH = 3
+
+logger = logging.getLogger(__name__)
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ProductSearchIndex:
+    """
+    In-memory index over product names for substring search and prefix
+    autocomplete.
+
+    Substring search intersects trigram posting sets and then verifies the
+    candidates; prefix lookups bisect a sorted list of (token, id) pairs
+    holding each full name and each of its words. Terms shorter than a
+    trigram are checked against every name in memory. The index is built
+    when the worker starts (``warm()``, called from the WSGI/ASGI modules),
+    or on first use where that did not happen, and kept in step by the
+    Product signals. Other workers notice changes through the names
+    generation counter and rebuild; lookups keep answering from the old
+    index until the new one is swapped in.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Held for a whole build, so only one thread per worker rebuilds
+        self._build_lock = threading.Lock()
+        self._version = None
+        self._reset()
+
+    def _reset(self):
+        self._names = {}
+        self._grams = defaultdict(set)
+        self._prefixes = []
+
+    def _tokens(self, name):
+        return {name} | set(name.split())
+
+    def _add(self, product_id, name):
+        lowered = name.lower()
+        self._names[product_id] = (lowered, name)
+        for gram in _trigrams(lowered):
+            self._grams[gram].add(product_id)
+        for token in self._tokens(lowered):
+            bisect.insort(self._prefixes, (token, product_id))
+
+    def _remove(self, product_id):
+        entry = self._names.pop(product_id, None)
+        if entry is None:
+            return
+        lowered = entry[0]
+        for gram in _trigrams(lowered):
+            self._grams[gram].discard(product_id)
+            if not self._grams[gram]:
+                del self._grams[gram]
+        for token in self._tokens(lowered):
+            i = bisect.bisect_left(self._prefixes, (token, product_id))
+            if i < len(self._prefixes) and self._prefixes[i] == (token, product_id):
+                del self._prefixes[i]
+
+    def _ensure_current(self):
+        current = generation(NAMES_GENERATION_KEY)
+        if self._version == current:
+            return
+        # Without any index yet there is nothing to answer from, so wait
+        # for the build; otherwise let the thread already building finish
+        if not self._build_lock.acquire(blocking=self._version is None):
+            return
+        try:
+            if self._version != current:
+                self._build(current)
+        finally:
+            self._build_lock.release()
+
+    def build(self, version=None):
+        with self._build_lock:
+            self._build(generation(NAMES_GENERATION_KEY) if version is None else version)
+
+    def _build(self, version):
+        # Read and sorted without self._lock; only the swap holds it
+        names = {}
+        grams = defaultdict(set)
+        prefixes = []
+        for product_id, name in Product.objects.values_list('id', 'name').iterator():
+            lowered = name.lower()
+            names[product_id] = (lowered, name)
+            for gram in _trigrams(lowered):
+                grams[gram].add(product_id)
+            prefixes.extend((token, product_id) for token in self._tokens(lowered))
+        # One sort instead of an insort per token
+        prefixes.sort()
+        with self._lock:
+            self._names, self._grams, self._prefixes = names, grams, prefixes
+            self._version = version
+
+    def warm(self):
+        """
+        Build the index ahead of the first request. Skipped, leaving the
+        build to first use, while the database is not ready, e.g. before
+        the first migrate.
+        """
+        try:
+            self.build()
+        except DatabaseError:
+            logger.warning('Product search index not built at startup', exc_info=True)
+
+    def product_changed(self, product_id, name=None):
+        """
+        Apply a saved (``name`` given) or deleted product and tell other
+        workers to rebuild
+        """
+        with self._lock:
+            new_version = bump_generation(NAMES_GENERATION_KEY)
+            # Only patch in place when no other change was missed meanwhile
+            if self._version is not None and self._version == new_version - 1:
+                self._remove(product_id)
+                if name is not None:
+                    self._add(product_id, name)
+                self._version = new_version
+
+    def names_changed(self):
+        """
+        Tell every worker to rebuild, e.g. after a bulk write without signals
+        """
+        bump_generation(NAMES_GENERATION_KEY)
+
+    def _prefixed(self, prefix):
+        # (id, name) of names with a word or the whole name starting with prefix
+        matches = {}
+        i = bisect.bisect_left(self._prefixes, (prefix,))
+        while i < len(self._prefixes) and self._prefixes[i][0].startswith(prefix):
+            product_id = self._prefixes[i][1]
+            matches[product_id] = self._names[product_id][1]
+            i += 1
+        return matches
+
+    def search(self, term):
+        """
+        Return the ids of products whose name contains ``term``
+        """
+        term = term.lower()
+        self._ensure_current()
+        with self._lock:
+            if len(term) < MIN_SUBSTRING_LENGTH:
+                return {pk for pk, (lowered, _) in self._names.items() if term in lowered}
+            postings = sorted((self._grams.get(gram, set()) for gram in _trigrams(term)), key=len)
+            candidates = set.intersection(*postings) if postings else set()
+            return {pk for pk in candidates if term in self._names[pk][0]}
+
+    def autocomplete(self, prefix, limit=10):
+        """
+        Return up to ``limit`` (id, name) pairs whose name or a word of it
+        starts with ``prefix``, ordered by name
+        """
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        self._ensure_current()
+        with self._lock:
+            matches = self._prefixed(prefix)
+        return sorted(matches.items(), key=lambda item: (item[1].lower(), item[0]))[:limit]
+
+
+product_index = ProductSearchIndex()
+
+
+class IndexedSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter that answers product name searches from product_index
+    instead of a LIKE '%term%' table scan. Broad terms that match most of
+    the catalogue fall back to the database.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or queryset.model is not Product:
+            return super().filter_queryset(request, queryset, view)
+
+        ids = None
+        for term in terms:
+            matches = product_index.search(term)
+            ids = matches if ids is None else ids & matches
+        if len(ids) > MAX_INDEXED_MATCHES:
+            return super().filter_queryset(request, queryset, view)
+        return queryset.filter(pk__in=ids)
@@ -1,24 +1,143 @@
+from collections import OrderedDict
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Product, Transaction
+from .models import Product, Reservation, Transaction
+from .reservations import RESERVATION_MAX_TTL
+from .timing import measure
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets for ModelSerializers.
+
+    ``fields`` names the fields to keep; ``nested.field`` picks fields of a
+    nested serializer. A nested serializer that is kept but neither expanded
+    (``expand``) nor picked into collapses to its primary key.
+    ``get_columns()`` and ``get_related()`` describe what the remaining
+    fields read, for ``.only()``/``.values()`` and ``select_related()``.
+    """
+    # SerializerMethodField name -> model fields it reads
+    method_field_sources = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested_fields = None if fields is None else list(fields)
+        self.requested_expand = set(expand or ())
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.requested_fields is None:
+            return fields
+
+        selected = OrderedDict()
+        for item in self.requested_fields:
+            name, _, child = item.partition('.')
+            selected.setdefault(name, [])
+            if child:
+                selected[name].append(child)
+        unknown = [name for name in selected if name not in fields]
+        if unknown:
+            raise serializers.ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+
+        pruned = OrderedDict()
+        for name, field in fields.items():
+            if name not in selected:
+                continue
+            if isinstance(field, SparseFieldsMixin):
+                if selected[name] or name in self.requested_expand:
+                    field = field.__class__(*field._args, **dict(field._kwargs, fields=selected[name] or None))
+                else:
+                    field = serializers.PrimaryKeyRelatedField(read_only=True)
+            pruned[name] = field
+        return pruned
+
+    def get_columns(self, prefix=''):
+        columns = []
+        for name, field in self.fields.items():
+            if isinstance(field, SparseFieldsMixin):
+                columns.append(prefix + field.source)
+                columns.extend(field.get_columns(f'{prefix}{field.source}__'))
+            elif isinstance(field, serializers.SerializerMethodField):
+                columns.extend(prefix + source for source in self.method_field_sources[name])
+            else:
+                columns.append(prefix + field.source)
+        return list(dict.fromkeys(columns))
+
+    def get_related(self, prefix=''):
+        related = []
+        for field in self.fields.values():
+            if isinstance(field, SparseFieldsMixin):
+                related.append(prefix + field.source)
+                related.extend(field.get_related(f'{prefix}{field.source}__'))
+        return related
+
+class TimedSerializerMixin:
+    """
+    Counts ``to_representation()`` towards the request's serialize time
+    (see api.timing)
+    """
+
+    def to_representation(self, instance):
+        with measure('serialize'):
+            return super().to_representation(instance)
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email')
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    available_quantity = serializers.SerializerMethodField()
     image_source = serializers.SerializerMethodField()
+    image_sources = serializers.SerializerMethodField()
+    method_field_sources = {
+        'available_quantity': ['quantity', 'reserved'],
+        'image_source': ['image', 'image_url', 'image_variants'],
+        'image_sources': ['image', 'image_url', 'image_variants'],
+    }
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'price', 'quantity', 'image', 'image_url', 'image_source', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = [
+            'id', 'name', 'price', 'quantity', 'reserved', 'available_quantity', 'image', 'image_url',
+            'image_source', 'image_sources', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'reserved', 'created_at', 'updated_at']
+
+    def get_available_quantity(self, obj):
+        return obj.available_quantity
 
     def get_image_source(self, obj):
         return obj.image_source
 
-class TransactionSerializer(serializers.ModelSerializer):
+    def get_image_sources(self, obj):
+        return obj.image_sources
+
+class ProductImportSerializer(serializers.Serializer):
+    """
+    One row of a bulk product upsert. Plain fields only, so validating a
+    row never queries the database (name uniqueness is the upsert key).
+    """
+    name = serializers.CharField(max_length=100)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+    quantity = serializers.IntegerField(min_value=0)
+    image_url = serializers.URLField(max_length=200, required=False, allow_null=True, allow_blank=True)
+
+class BulkProductOperationSerializer(serializers.Serializer):
+    """
+    One operation of a bulk restock/reprice request
+    """
+    id = serializers.IntegerField()
+    quantity_delta = serializers.IntegerField(required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'), required=False)
+
+    def validate(self, attrs):
+        if 'quantity_delta' not in attrs and 'price' not in attrs:
+            raise serializers.ValidationError('Give quantity_delta, price or both')
+        return attrs
+
+class TransactionSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
 
     class Meta:
@@ -26,4 +145,26 @@ class TransactionSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'product', 'quantity', 'total_amount',
             'payment_method', 'status', 'created_at'
-        ] 
\ No newline at end of file
+        ]
+
+class ReservationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # Seconds to hold the units for; defaults to RESERVATION_TTL
+    ttl = serializers.IntegerField(write_only=True, required=False, min_value=1, max_value=RESERVATION_MAX_TTL)
+
+    class Meta:
+        model = Reservation
+        fields = ['id', 'product', 'quantity', 'ttl', 'created_at', 'expires_at']
+        read_only_fields = ['id', 'created_at', 'expires_at']
+        extra_kwargs = {'quantity': {'min_value': 1}}
+
+class SalesReportRowSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    One group of a sales report; columns that were not grouped by are left out
+    """
+    period = serializers.DateTimeField(source='period_start', required=False)
+    product_id = serializers.IntegerField(required=False)
+    product_name = serializers.CharField(source='product__name', required=False)
+    payment_method = serializers.CharField(required=False)
+    quantity = serializers.IntegerField(source='units')
+    revenue = serializers.DecimalField(source='amount', max_digits=14, decimal_places=2)
+    transactions = serializers.IntegerField(source='count')
@@ -0,0 +1,48 @@
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+from .cache import invalidate_product_cache, invalidate_transaction_cache
+from .images import schedule_variants
+from .models import Product, Transaction
+from .search import product_index
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    # After commit, so a rollback changes nothing
+    invalidate_product_cache()
+    transaction.on_commit(partial(product_index.product_changed, instance.pk, instance.name))
+    if instance.image and instance.image_variants.get('source') != instance.image.name:
+        schedule_variants(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    invalidate_product_cache()
+    transaction.on_commit(partial(product_index.product_changed, instance.pk))
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def transaction_changed(sender, instance, **kwargs):
+    invalidate_transaction_cache(instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which cached users don't need
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        invalidate_token(key)
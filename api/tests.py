@@ -1,13 +1,73 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from PIL import Image
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import ExtractHour
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
-from rest_framework.test import APIClient
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework.authtoken.models import Token
 from rest_framework import status
+from datetime import timedelta
 from decimal import Decimal
-from .models import Product, Transaction
+from .analytics import (
+    ReportParams, TransactionColumns, basket_sizes, hour_of_day, moving_average_demand, np
+)
+from .cache import PRODUCT_GENERATION_KEY, get_or_fill, product_generation, shared_cache
+from .cache_backends import TieredCache
+from .fast_serializers import SalesReportRowFastSerializer
+from .images import generate_variants
+from .inventory import compact_inventory, verify_inventory
+from .models import IdempotencyKey, Product, Reservation, SalesRollup, Transaction
+from .renderers import FastJSONRenderer
+from .reservations import release_expired
+from .search import NAMES_GENERATION_KEY, product_index
+from .serializers import SalesReportRowSerializer
+from .throttling import UserSlidingWindowThrottle
+
+# One line per request; test_server_timing captures it with assertLogs
+logging.getLogger('api.timing').setLevel(logging.WARNING)
+
+# Keep the file-based cache tiers out of the project's .cache directory
+TEST_CACHE_DIR = tempfile.mkdtemp(prefix='vending-test-cache-')
+TEST_CACHES = {alias: dict(options) for alias, options in settings.CACHES.items()}
+TEST_CACHES['shared']['LOCATION'] = TEST_CACHE_DIR
+TEST_CACHES['coordination']['LOCATION'] = os.path.join(TEST_CACHE_DIR, 'coordination')
+
+
+def clear_caches():
+    for alias in TEST_CACHES:
+        caches[alias].clear()
+
+
+def tearDownModule():
+    shutil.rmtree(TEST_CACHE_DIR, ignore_errors=True)
 
+@override_settings(CACHES=TEST_CACHES)
 class VendingMachineTests(TestCase):
     def setUp(self):
+        clear_caches()
+
         # Create test user
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.token = Token.objects.create(user=self.user)
@@ -71,3 +131,1058 @@ class VendingMachineTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
         self.assertEqual(response.data['results'][0]['quantity'], 1)
+
+
+    def test_checkout_purchases_all_lines(self):
+        """Test checking out a multi-line cart"""
+        chips = Product.objects.create(name='Chips', price=Decimal('1.50'), quantity=5)
+        response = self.client.post('/api/checkout/', {
+            'items': [
+                {'product_id': self.product.id, 'quantity': 2},
+                {'product_id': chips.id, 'quantity': 3},
+            ],
+            'payment_method': 'CASH'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['transactions']), 2)
+        self.assertEqual(Decimal(response.data['total_amount']), Decimal('9.50'))
+
+        self.product.refresh_from_db()
+        chips.refresh_from_db()
+        self.assertEqual(self.product.quantity, 8)
+        self.assertEqual(chips.quantity, 2)
+        self.assertEqual(Transaction.objects.filter(payment_method='CASH').count(), 2)
+
+    def test_checkout_is_all_or_nothing(self):
+        """Test that one short line rolls back the whole cart"""
+        chips = Product.objects.create(name='Chips', price=Decimal('1.50'), quantity=1)
+        response = self.client.post('/api/checkout/', {
+            'items': [
+                {'product_id': self.product.id, 'quantity': 2},
+                {'product_id': chips.id, 'quantity': 3},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.product.refresh_from_db()
+        chips.refresh_from_db()
+        self.assertEqual(self.product.quantity, 10)
+        self.assertEqual(chips.quantity, 1)
+        self.assertFalse(Transaction.objects.exists())
+
+
+    def test_purchase_retry_with_idempotency_key(self):
+        """Test that a retried purchase replays the first response"""
+        url = f'/api/products/{self.product.id}/purchase/'
+        first = self.client.post(url, {'quantity': 2}, HTTP_IDEMPOTENCY_KEY='retry-1')
+        second = self.client.post(url, {'quantity': 2}, HTTP_IDEMPOTENCY_KEY='retry-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 8)
+
+        reused = self.client.post(url, {'quantity': 3}, HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(reused.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_idempotent_writes_invalidate_caches_on_commit(self):
+        """Test that writes sent with an Idempotency-Key bump generations only after their commit"""
+        writes = [
+            (f'/api/products/{self.product.id}/purchase/', {'quantity': 1}),
+            ('/api/checkout/', [{'product_id': self.product.id, 'quantity': 1}]),
+            ('/api/reservations/', {'product': self.product.id, 'quantity': 1}),
+        ]
+        for index, (url, data) in enumerate(writes):
+            with self.subTest(url=url), mock.patch('api.cache.bump_product_generation') as bump:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY=f'commit-{index}')
+                    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                    bump.assert_not_called()
+                bump.assert_called()
+
+    def test_failed_purchase_can_be_retried_with_same_key(self):
+        """Test that database errors are not stored under an Idempotency-Key"""
+        url = f'/api/products/{self.product.id}/purchase/'
+        self.client.raise_request_exception = False
+        with mock.patch('api.views.products.decrement_stock', side_effect=OperationalError('database is locked')):
+            failed = self.client.post(url, {'quantity': 2}, HTTP_IDEMPOTENCY_KEY='retry-2')
+        self.assertEqual(failed.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+        retried = self.client.post(url, {'quantity': 2}, HTTP_IDEMPOTENCY_KEY='retry-2')
+        self.assertEqual(retried.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(retried.has_header('Idempotent-Replayed'))
+
+        # Expired records are purged
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+    def test_product_list_cache_hit_skips_database(self):
+        """Test that a cached product page is served without queries"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        first = client.get('/api/products/?page=1')
+        with self.assertNumQueries(0):
+            second = client.get('/api/products/?page=1')
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+
+    def test_product_list_cache_respects_filters_and_writes(self):
+        """Test that filters get their own entries and writes invalidate them"""
+        Product.objects.create(name='Water', price=Decimal('1.00'), quantity=3)
+        self.assertEqual(self.client.get('/api/products/').json()['count'], 2)
+        self.assertEqual(self.client.get('/api/products/?search=cola').json()['count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 4})
+        results = self.client.get('/api/products/?search=cola').json()['results']
+        self.assertEqual(results[0]['quantity'], 6)
+
+
+    def test_product_list_etag(self):
+        """Test conditional GETs on the product list"""
+        response = self.client.get('/api/products/?page=1')
+        etag = response['ETag']
+        not_modified = self.client.get('/api/products/?page=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 1})
+        changed = self.client.get('/api/products/?page=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'vending.example'])
+    def test_product_list_cache_is_per_host_and_scheme(self):
+        """Test that cached pages keep the absolute links of their own origin"""
+        for i in range(6):
+            Product.objects.create(name=f'Snack {i}', price=Decimal('1.00'), quantity=1)
+        self.assertTrue(self.client.get('/api/products/').json()['next'].startswith('http://testserver/'))
+        other = self.client.get('/api/products/', HTTP_HOST='vending.example')
+        self.assertTrue(other.json()['next'].startswith('http://vending.example/'))
+        secure = self.client.get('/api/products/', secure=True)
+        self.assertTrue(secure.json()['next'].startswith('https://testserver/'))
+        self.assertNotEqual(secure['ETag'], self.client.get('/api/products/')['ETag'])
+
+    def test_stale_product_list_keeps_its_own_etag(self):
+        """Test that a waiter served the previous generation's bytes gets their ETag"""
+        old = self.client.get('/api/products/?page=1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 1})
+
+        # Another request holds the fill lock for the new generation
+        with mock.patch('api.cache._acquire_fill', return_value=False):
+            stale = self.client.get('/api/products/?page=1')
+        self.assertEqual(stale.content, old.content)
+        self.assertEqual(stale['ETag'], old['ETag'])
+
+        fresh = self.client.get('/api/products/?page=1', HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(fresh.status_code, status.HTTP_200_OK)
+        self.assertEqual(fresh.json()['results'][0]['quantity'], 9)
+
+    def test_transaction_detail_etag(self):
+        """Test conditional GETs on a transaction"""
+        transaction = Transaction.objects.create(
+            product=self.product, user=self.user, quantity=1,
+            total_amount=self.product.price, payment_method='APP', status='COMPLETED'
+        )
+        url = f'/api/transactions/{transaction.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'quantity': 2})
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_200_OK
+        )
+
+
+    def test_token_authentication_is_cached(self):
+        """Test that a known token is resolved without a database query"""
+        self.client.get('/api/users/me/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['username'], 'testuser')
+
+    def test_cached_token_is_invalidated(self):
+        """Test that deleting a token or deactivating a user revokes access"""
+        self.assertEqual(self.client.get('/api/users/me/').status_code, status.HTTP_200_OK)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, status.HTTP_200_OK)
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+    def test_transaction_history_query_count_is_constant(self):
+        """Test that listing transactions does not query once per row"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        def list_queries(rows):
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(rows):
+                    Transaction.objects.create(product=self.product, user=self.user, quantity=1,
+                                               total_amount=self.product.price, payment_method='APP')
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get('/api/transactions/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        self.assertEqual(list_queries(1), list_queries(5))
+
+
+    def test_transaction_cursor_pagination(self):
+        """Test opt-in keyset pagination of the transaction history"""
+        Transaction.objects.bulk_create([
+            Transaction(product=self.product, user=self.user, quantity=i + 1,
+                        total_amount=self.product.price, payment_method='APP')
+            for i in range(8)
+        ])
+        first = self.client.get('/api/transactions/?pagination=cursor').json()
+        self.assertNotIn('count', first)
+        self.assertEqual(len(first['results']), 6)
+        self.assertIn('cursor=', first['next'])
+
+        # Rows sharing a timestamp, as a checkout writes them, are neither
+        # skipped nor repeated when another lands at that timestamp
+        created_at = timezone.now()
+        Transaction.objects.update(created_at=created_at)
+        first = self.client.get('/api/transactions/?pagination=cursor').json()
+        Transaction.objects.create(product=self.product, user=self.user, quantity=1,
+                                   total_amount=self.product.price, payment_method='APP', created_at=created_at)
+        Transaction.objects.filter(created_at__gt=created_at).update(created_at=created_at)
+
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(second['results']), 2)
+        self.assertIsNone(second['next'])
+        seen = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(len(set(seen)), 8)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        previous = self.client.get(second['previous']).json()
+        self.assertEqual([row['id'] for row in previous['results']], seen[:6])
+
+
+    def test_product_changes_apply_on_commit(self):
+        """Test that a rolled-back product write leaves the cache and index alone"""
+        generation = product_generation()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Product.objects.create(name='Ghost Soda', price=Decimal('1.00'), quantity=1)
+            raise RuntimeError
+        self.assertEqual(product_generation(), generation)
+        self.assertEqual(product_index.autocomplete('ghost'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ghost = Product.objects.create(name='Ghost Soda', price=Decimal('1.00'), quantity=1)
+            self.assertEqual(product_generation(), generation)
+        self.assertNotEqual(product_generation(), generation)
+        self.assertEqual(product_index.autocomplete('ghost'), [(ghost.pk, 'Ghost Soda')])
+
+    def test_product_search_answers_during_rebuild(self):
+        """Test that lookups use the old index while another thread rebuilds it"""
+        product_index.build()
+        Product.objects.filter(pk=self.product.pk).update(name='Test Lemonade')
+        product_index.names_changed()
+        results = []
+        # Stands in for another thread halfway through a build
+        with product_index._build_lock:
+            lookup = threading.Thread(target=lambda: results.append(product_index.search('cola')))
+            lookup.start()
+            lookup.join(timeout=5)
+        self.assertEqual(results, [{self.product.pk}])
+        self.assertEqual(product_index.search('cola'), set())
+        self.assertEqual(product_index.search('lemon'), {self.product.pk})
+
+    def test_product_search_uses_index(self):
+        """Test substring search and autocomplete from the product index"""
+        Product.objects.create(name='Cold Brew Coffee', price=Decimal('3.00'), quantity=5)
+        water = Product.objects.create(name='Water', price=Decimal('1.00'), quantity=5)
+
+        def search(term):
+            return [p['name'] for p in self.client.get('/api/products/', {'search': term}).json()['results']]
+
+        self.assertEqual(search('ola'), ['Test Cola'])
+        self.assertEqual(search('old'), ['Cold Brew Coffee'])
+        # Terms shorter than a trigram still match anywhere in the name
+        self.assertEqual(search('co'), ['Cold Brew Coffee', 'Test Cola'])
+        self.assertEqual(search('ol'), ['Cold Brew Coffee', 'Test Cola'])
+        with mock.patch('api.search.MAX_INDEXED_MATCHES', 0):
+            self.assertEqual(search('ol'), ['Cold Brew Coffee', 'Test Cola'])
+
+        response = self.client.get('/api/products/autocomplete/?q=co')
+        self.assertEqual([p['name'] for p in response.data], ['Cold Brew Coffee', 'Test Cola'])
+
+        water.name = 'Cool Water'
+        with self.captureOnCommitCallbacks(execute=True):
+            water.save()
+        self.assertEqual(
+            [p['name'] for p in self.client.get('/api/products/autocomplete/?q=wat').data],
+            ['Cool Water']
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            water.delete()
+        self.assertEqual(self.client.get('/api/products/autocomplete/?q=wat').data, [])
+
+
+    def test_fast_serializers_match_model_serializers(self):
+        """Test that the values() fast path renders byte-identical JSON"""
+        Product.objects.create(name='Juice', price=Decimal('1.5'), quantity=0, image='products/juice.png')
+        Product.objects.create(name='Tea', price=Decimal('3.00'), quantity=2, image_url='http://example.com/tea.png')
+        self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 2}, format='json')
+        transaction_id = Transaction.objects.get().pk
+        urls = ['/api/products/', f'/api/products/{self.product.id}/', '/api/products/?ordering=-price',
+                '/api/transactions/', f'/api/transactions/{transaction_id}/',
+                '/api/transactions/?pagination=cursor', '/api/products/?fields=id,image_source',
+                '/api/transactions/?fields=id,product', '/api/transactions/?fields=id,product.price',
+                '/api/transactions/?fields=status,product&expand=product&pagination=cursor']
+
+        for url in urls:
+            cache.clear()
+            fast = self.client.get(url)
+            cache.clear()
+            with override_settings(API_FAST_SERIALIZATION=False):
+                slow = self.client.get(url)
+            self.assertEqual(fast.status_code, status.HTTP_200_OK)
+            self.assertEqual(fast.content, slow.content, url)
+
+
+    def test_sparse_fieldsets(self):
+        """Test that ?fields= and ?expand= trim the payload and the selected columns"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/?fields=id,name,price,quantity')
+        self.assertEqual(list(response.data['results'][0]), ['id', 'name', 'price', 'quantity'])
+        self.assertNotIn('image_url', queries.captured_queries[-1]['sql'])
+
+        # The field set is part of the cache key, in any order
+        self.assertEqual(list(self.client.get('/api/products/?fields=name').data['results'][0]), ['name'])
+        self.assertEqual(self.client.get('/api/products/?fields=quantity,id').content,
+                         self.client.get('/api/products/?fields=id,quantity').content)
+
+        self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 1}, format='json')
+        row = self.client.get('/api/transactions/?fields=id,product').data['results'][0]
+        self.assertEqual(row['product'], self.product.id)
+        row = self.client.get('/api/transactions/?fields=id,product&expand=product').data['results'][0]
+        self.assertEqual(row['product']['name'], 'Test Cola')
+        row = self.client.get('/api/transactions/?fields=product.name,product.price').data['results'][0]
+        self.assertEqual(row, {'product': {'name': 'Test Cola', 'price': '2.50'}})
+
+        response = self.client.get('/api/transactions/?fields=id,nope')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_transaction_export(self):
+        """Test the staff-only streaming export"""
+        self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 2}, format='json')
+        self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 1}, format='json')
+        self.assertEqual(self.client.get('/api/transactions/export/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/transactions/export/?format=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([line['quantity'] for line in lines], [2, 1])
+        self.assertEqual(lines[0]['product_name'], 'Test Cola')
+        self.assertEqual(lines[0]['total_amount'], '5.00')
+
+        response = self.client.get('/api/transactions/export/?format=csv')
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], 'id,created_at,user,product_id,product_name,product_price,'
+                                  'quantity,total_amount,payment_method,status')
+        self.assertEqual(len(rows), 3)
+
+        tomorrow = (timezone.now() + timedelta(days=1)).date().isoformat()
+        response = self.client.get(f'/api/transactions/export/?from={tomorrow}')
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        response = self.client.get('/api/transactions/export/?to=yesterday')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_fast_json_renderer_matches_drf(self):
+        """Test that the orjson renderer produces DRF's JSON"""
+        data = {
+            'price': Decimal('2.50'), 'when': timezone.now(), 'day': timezone.now().date(),
+            'label': gettext_lazy('Name'), 'text': 'caf\u00e9 \u2028', 1: [None, True, 1.5],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_list_responses_are_gzipped_from_the_cache(self):
+        """Test gzip above the size threshold, served from the response cache"""
+        for i in range(5):
+            Product.objects.create(name=f'Snack {i}', price=Decimal('1.00'), quantity=3)
+        plain = self.client.get('/api/products/').content
+
+        first = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(len(queries), 0)
+        for response in (first, second):
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertTrue(response['ETag'].startswith('W/'))
+            self.assertEqual(gzip.decompress(response.content), plain)
+
+        small = self.client.get(f'/api/products/{self.product.id}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='vending-media-'))
+    def test_uploaded_images_get_resized_variants(self):
+        """Test thumbnail and WebP generation for uploaded product images"""
+        buffer = io.BytesIO()
+        Image.new('RGBA', (1600, 1200), (200, 30, 30, 128)).save(buffer, format='PNG')
+        upload = SimpleUploadedFile('cola.png', buffer.getvalue(), content_type='image/png')
+
+        with mock.patch('api.images.get_executor') as get_executor, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/products/{self.product.id}/', {'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        get_executor.return_value.submit.assert_called_once()
+        # Served as the original until the worker has run
+        self.assertEqual(response.data['image_source'], '/media/' + Product.objects.get().image.name)
+
+        variants = generate_variants(self.product.id)
+        card = variants['sizes']['card']
+        self.assertRegex(card['webp'], r'^products/variants/[0-9a-f]{16}-600x400\.webp$')
+        with default_storage.open(card['jpeg']) as f:
+            self.assertEqual(Image.open(f).size, (600, 400))
+        self.assertEqual(generate_variants(self.product.id)['sizes'], variants['sizes'])
+
+        data = self.client.get(f'/api/products/{self.product.id}/').data
+        self.assertEqual(data['image_source'], '/media/' + card['jpeg'])
+        self.assertEqual(data['image_sources']['thumb']['webp'], '/media/' + variants['sizes']['thumb']['webp'])
+
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='vending-media-'))
+    def test_media_serving(self):
+        """Test caching headers, conditional requests and byte ranges for media"""
+        variant = default_storage.save('products/variants/0123456789abcdef-200x200.webp', io.BytesIO(b'0123456789'))
+        upload = default_storage.save('products/cola.png', io.BytesIO(b'original'))
+
+        response = self.client.get('/media/' + variant, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertNotIn('immutable', self.client.get('/media/' + upload)['Cache-Control'])
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/media/' + variant, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get('/media/' + variant, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                         .status_code, status.HTTP_304_NOT_MODIFIED)
+
+        partial = self.client.get('/media/' + variant, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(partial.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(partial['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(partial.streaming_content), b'2345')
+        suffix = self.client.get('/media/' + variant, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(suffix.streaming_content), b'789')
+        self.assertEqual(self.client.get('/media/' + variant, HTTP_RANGE='bytes=10-').status_code,
+                         status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        stale = self.client.get('/media/' + variant, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.client.get('/media/products/missing.png').status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_import_products_upserts_by_name(self):
+        """Test the bulk CSV/JSONL product import"""
+        self.assertEqual(self.client.get('/api/products/').data['count'], 1)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('name,price,quantity,image_url\n'
+                    'Test Cola,3.00,40,\n'
+                    'Water,1.00,5,http://example.com/water.png\n'
+                    'Broken,abc,1,\n'
+                    'Juice,2.00,7,\n'
+                    'Juice,2.25,8,\n')
+        out, err = io.StringIO(), io.StringIO()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            call_command('import_products', f.name, '--batch-size=10', stdout=out, stderr=err)
+        os.remove(f.name)
+        self.assertIn('2 created, 1 updated, 1 invalid', out.getvalue())
+        self.assertIn('Row 3', err.getvalue())
+        self.assertLess(len(queries), 10)
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.price, self.product.quantity), (Decimal('3.00'), 40))
+        self.assertEqual(Product.objects.get(name='Juice').quantity, 8)
+        self.assertEqual(self.client.get('/api/products/').data['count'], 3)
+        self.assertEqual(self.client.get('/api/products/autocomplete/?q=jui').data[0]['name'], 'Juice')
+
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('{"name": "Water", "price": "1.10", "quantity": 6}\n')
+        call_command('import_products', f.name, stdout=out)
+        os.remove(f.name)
+        water = Product.objects.get(name='Water')
+        self.assertEqual((water.price, water.image_url), (Decimal('1.10'), 'http://example.com/water.png'))
+
+        # Rows leaving fewer units than reservations hold are rejected
+        self.client.post('/api/reservations/', {'product': water.id, 'quantity': 4})
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('{"name": "Water", "price": "1.20", "quantity": 3}\n')
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_products', f.name, stdout=out, stderr=err)
+        os.remove(f.name)
+        self.assertIn('0 created, 0 updated, 1 invalid', out.getvalue())
+        self.assertIn("Product 'Water': quantity is below the 4 units held", err.getvalue())
+        water.refresh_from_db()
+        self.assertEqual((water.price, water.quantity, water.reserved), (Decimal('1.10'), 6, 4))
+        self.assertEqual(verify_inventory(), [])
+
+
+    def test_bulk_restock_and_reprice(self):
+        """Test the staff-only bulk product update"""
+        water = Product.objects.create(name='Water', price=Decimal('1.00'), quantity=2)
+        operations = [
+            {'id': self.product.id, 'quantity_delta': 5},
+            {'id': water.id, 'price': '1.20'},
+            {'id': self.product.id, 'quantity_delta': -3, 'price': '2.75'},
+        ]
+        self.assertEqual(self.client.post('/api/products/bulk/', operations, format='json').status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        self.client.get('/api/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/products/bulk/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['products'], [
+            {'id': self.product.id, 'name': 'Test Cola', 'price': '2.75', 'quantity': 12},
+            {'id': water.id, 'name': 'Water', 'price': '1.20', 'quantity': 2},
+        ])
+        # The cached list was invalidated
+        prices = {p['name']: p['price'] for p in self.client.get('/api/products/').data['results']}
+        self.assertEqual(prices, {'Test Cola': '2.75', 'Water': '1.20'})
+
+        # All or nothing: the price change is rolled back with the failed decrement
+        response = self.client.post('/api/products/bulk/', [
+            {'id': self.product.id, 'price': '9.99'}, {'id': water.id, 'quantity_delta': -3},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal('2.75'))
+
+        response = self.client.post('/api/products/bulk/', [{'id': 999, 'quantity_delta': 1}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post('/api/products/bulk/', [{'id': water.id}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(verify_inventory(), [])
+
+    def test_inventory_ledger_matches_stock(self):
+        """Test that every stock change is recorded and compacted into snapshots"""
+        response = self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 3})
+        transaction_id = response.data['id']
+        self.client.put(f'/api/transactions/{transaction_id}/', {'quantity': 5})
+        self.client.post('/api/checkout/', [{'product_id': self.product.id, 'quantity': 2}], format='json')
+        self.client.delete(f'/api/transactions/{transaction_id}/')
+        self.product.refresh_from_db()
+        self.product.quantity = 20
+        self.product.save()
+
+        movements = list(self.product.movements.order_by('id').values_list('reason', 'delta', 'transaction_id'))
+        self.assertEqual(movements, [
+            ('OPENING', 10, None),
+            ('SALE', -3, transaction_id),
+            ('ADJUSTMENT', -2, transaction_id),
+            ('SALE', -2, Transaction.objects.get().id),
+            ('REFUND', 5, transaction_id),
+            ('CORRECTION', 12, None),
+        ])
+        with self.assertRaises(ValueError):
+            self.product.movements.first().save()
+
+        self.assertEqual(compact_inventory(lag=0), 1)
+        self.assertEqual(self.product.inventory_snapshot.quantity, 20)
+        self.assertEqual(verify_inventory(), [])
+
+        # Drift is reported and repaired from the ledger
+        Product.objects.filter(pk=self.product.pk).update(quantity=7)
+        self.assertEqual(verify_inventory(), [(self.product.id, 7, 20)])
+        call_command('compact_inventory', '--verify', '--repair', '--lag=0', stdout=io.StringIO(),
+                     stderr=io.StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 20)
+
+    def test_reservations_hold_stock(self):
+        """Test holding, buying, cancelling and expiring cart reservations"""
+        response = self.client.post('/api/reservations/', {'product': self.product.id, 'quantity': 4})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        reservation_id = response.data['id']
+        product = self.client.get(f'/api/products/{self.product.id}/').data
+        self.assertEqual((product['quantity'], product['reserved'], product['available_quantity']), (10, 4, 6))
+
+        # Held units can't be bought or reserved by anyone else
+        response = self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 7})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/reservations/', {'product': self.product.id, 'quantity': 7})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(f'/api/reservations/{reservation_id}/purchase/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['quantity'], 4)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity, self.product.reserved), (6, 0))
+        response = self.client.post(f'/api/reservations/{reservation_id}/purchase/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.post('/api/reservations/', {'product': self.product.id, 'quantity': 2})
+        self.assertEqual(self.client.delete(f'/api/reservations/{response.data["id"]}/').status_code,
+                         status.HTTP_204_NO_CONTENT)
+        response = self.client.post('/api/reservations/', {'product': self.product.id, 'quantity': 3, 'ttl': 60})
+        expired_id = response.data['id']
+        self.client.post('/api/reservations/', {'product': self.product.id, 'quantity': 1})
+        Reservation.objects.filter(pk=expired_id).update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.client.post(f'/api/reservations/{expired_id}/purchase/')
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity, self.product.reserved), (6, 1))
+
+        # The sweeper reads expired holds from the expiry index
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        plan = Reservation.objects.filter(expires_at__lte=timezone.now()).order_by('expires_at').explain()
+        self.assertIn('api_reservation_expiry_idx', plan)
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual(self.client.get('/api/reservations/').data, [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 0)
+        self.assertEqual(verify_inventory(), [])
+
+    def test_stock_edits_keep_concurrent_sales_and_holds(self):
+        """Test that stale product edits and expired holds don't undo or block sales"""
+        stale = Product.objects.get(pk=self.product.pk)
+        self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 3})
+        self.client.post('/api/reservations/', {'product': self.product.id, 'quantity': 2})
+
+        # An edit loaded before the sale keeps it and the hold; a restock
+        # adds to the current stock
+        stale.price = Decimal('3.00')
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.price, self.product.quantity, self.product.reserved),
+                         (Decimal('3.00'), 7, 2))
+        stale.quantity += 5
+        stale.save()
+        self.assertEqual((stale.quantity, stale.reserved), (12, 2))
+        response = self.client.patch(f'/api/products/{self.product.id}/', {'quantity': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('quantity', response.data)
+        response = self.client.patch(f'/api/products/{self.product.id}/', {'quantity': 8})
+        self.assertEqual((response.data['quantity'], response.data['reserved']), (8, 2))
+
+        # A hold past its expiry no longer blocks a purchase or a new hold
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 7})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity, self.product.reserved), (1, 0))
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(verify_inventory(), [])
+
+    def test_sales_rollups_and_report(self):
+        """Test incrementally maintained rollups and the sales report"""
+        water = Product.objects.create(name='Water', price=Decimal('1.00'), quantity=20)
+        first = self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 2}).data['id']
+        self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 1})
+        self.client.post('/api/checkout/', {
+            'items': [{'product_id': water.id, 'quantity': 5}, {'product_id': self.product.id, 'quantity': 1}],
+            'payment_method': 'CASH',
+        }, format='json')
+        self.client.put(f'/api/transactions/{first}/', {'quantity': 3})
+        last = self.client.post(f'/api/products/{water.id}/purchase/', {'quantity': 4}).data['id']
+        self.client.delete(f'/api/transactions/{last}/')
+
+        def rollups():
+            return sorted(SalesRollup.objects.filter(transactions__gt=0).values_list(
+                'grain', 'period_start', 'product_id', 'payment_method', 'quantity', 'revenue', 'transactions'
+            ))
+        incremental = rollups()
+        self.assertEqual(len(incremental), 6)
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(rollups(), incremental)
+
+        self.assertEqual(self.client.get('/api/reports/sales/').status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/reports/sales/?group_by=product&ordering=-revenue&grain=hour')
+        self.assertNotIn('"api_transaction"', ' '.join(query['sql'] for query in queries))
+        self.assertEqual(response.data['results'], [
+            {'product_id': self.product.id, 'product_name': 'Test Cola', 'quantity': 5,
+             'revenue': '12.50', 'transactions': 3},
+            {'product_id': water.id, 'product_name': 'Water', 'quantity': 5, 'revenue': '5.00', 'transactions': 1},
+        ])
+        self.assertEqual(response.data['totals'], {'quantity': 10, 'revenue': '17.50', 'transactions': 4})
+        rows = SalesRollup.objects.values('period_start', 'product_id', 'product__name').annotate(
+            units=Sum('quantity'), amount=Sum('revenue'), count=Sum('transactions'))
+        self.assertEqual(SalesReportRowFastSerializer().serialize_many(rows),
+                         SalesReportRowSerializer(rows, many=True).data)
+
+        response = self.client.get('/api/reports/sales/?group_by=period,payment_method')
+        self.assertEqual([(row['payment_method'], row['revenue']) for row in response.data['results']],
+                         [('APP', '10.00'), ('CASH', '7.50')])
+        response = self.client.get('/api/reports/sales/?grain=week')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @unittest.skipIf(np is None, 'NumPy is not installed')
+    @override_settings(ANALYTICS_DIR=tempfile.mkdtemp(prefix='vending-analytics-'))
+    def test_analytics_column_store(self):
+        """Test the NumPy analytics against the same ORM aggregations"""
+        water = Product.objects.create(name='Water', price=Decimal('1.00'), quantity=20)
+        first = self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 2}).data['id']
+        basket = self.client.post('/api/checkout/', {
+            'items': [{'product_id': self.product.id, 'quantity': 1}, {'product_id': water.id, 'quantity': 3}],
+            'payment_method': 'CASH',
+        }, format='json').data['transactions']
+        now = timezone.now().replace(microsecond=0)
+        Transaction.objects.filter(pk=first).update(created_at=now - timedelta(days=2))
+        Transaction.objects.filter(pk__in=[t['id'] for t in basket]).update(created_at=now)
+
+        store = TransactionColumns()
+        self.assertEqual(store.refresh(lag=0), 3)
+        self.assertEqual(store.refresh(lag=0), 0)
+        params = ReportParams(days=7)
+        by_hour = Transaction.objects.annotate(hour=ExtractHour('created_at')).values('hour').annotate(
+            units=Sum('quantity'))
+        self.assertEqual(
+            {row['hour']: row['quantity'] for row in hour_of_day(store.load(), params) if row['quantity']},
+            {row['hour']: row['units'] for row in by_hour}
+        )
+        self.assertEqual(basket_sizes(store.load(), params)['distribution'],
+                         [{'units': 2, 'baskets': 1}, {'units': 4, 'baskets': 1}])
+
+        # Edits reach the files by updated_at, deletions through the ledger
+        self.client.put(f'/api/transactions/{first}/', {'quantity': 5})
+        self.client.delete(f'/api/transactions/{basket[1]["id"]}/')
+        discounted = Transaction.objects.get(pk=basket[0]['id'])
+        discounted.total_amount = Decimal('2.00')
+        discounted.save()
+        store.refresh(lag=0)
+        columns = store.load()
+        self.assertEqual(columns['id'].tolist(), [first, basket[0]['id']])
+        self.assertEqual(columns['quantity'].tolist(), [5, 1])
+        self.assertEqual(columns['amount_cents'].tolist(), [1250, 200])
+
+        demand = moving_average_demand(columns, ReportParams(days=3, window=2))
+        self.assertEqual(demand['products'], [{'product_id': self.product.id, 'moving_average': [2.5, 2.5, 0.5]}])
+
+        self.assertEqual(self.client.get('/api/analytics/restock/').status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(f'/api/analytics/restock/?window=7&horizon=14&product={self.product.id}')
+        self.assertEqual(response.data['results'], [{
+            'product_id': self.product.id, 'name': 'Test Cola', 'available': 4,
+            'daily_demand': 0.86, 'days_of_cover': 4.7, 'restock': 8,
+        }])
+        # Requests read the files as the last refresh left them
+        self.client.post(f'/api/products/{self.product.id}/purchase/', {'quantity': 1})
+        response = self.client.get('/api/analytics/hour_of_day/?days=7')
+        self.assertEqual(sum(row['transactions'] for row in response.data['results']), 2)
+        self.assertEqual(self.client.get('/api/analytics/nope/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/analytics/demand/?days=0').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_server_timing(self):
+        """Requests report where their time went in Server-Timing and the log"""
+        def metrics(response):
+            entries = [entry.split(';') for entry in response['Server-Timing'].split(', ')]
+            return {name: dict(param.split('=', 1) for param in params) for name, *params in entries}
+
+        # Only staff see the header by default
+        self.assertNotIn('Server-Timing', self.client.get('/api/products/'))
+        with mock.patch('api.middleware.SERVER_TIMING', True):
+            self.assertIn('Server-Timing', self.client.get('/api/products/'))
+        self.user.is_staff = True
+        self.user.save()
+
+        with self.assertLogs('api.timing', 'INFO') as logs, CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/', {'pagination': 'cursor'})
+        timings = metrics(response)
+        for name in ('db', 'cache', 'auth', 'throttle', 'serialize', 'render', 'total'):
+            self.assertGreaterEqual(float(timings[name]['dur']), 0)
+        self.assertEqual(timings['db']['desc'], f'"{len(queries)} queries"')
+        self.assertRegex(timings['cache']['desc'], r'"\d+ hits / \d+ misses"')
+
+        record = logs.records[0]
+        self.assertEqual(record.timings['view'], 'product-list')
+        self.assertEqual(record.timings['status'], 200)
+        self.assertEqual(record.timings['db_queries'], len(queries))
+        self.assertIn('path=/api/products/ view=product-list status=200', record.getMessage())
+
+        # Function views and the fast retrieve path are covered too
+        response = self.client.get('/api/users/me/')
+        self.assertLessEqual({'auth', 'throttle', 'render', 'total'}, set(metrics(response)))
+        transaction = Transaction.objects.create(product=self.product, user=self.user, quantity=1,
+                                                 payment_method='APP', total_amount=Decimal('2.50'))
+        response = self.client.get(f'/api/transactions/{transaction.pk}/')
+        self.assertIn('serialize', metrics(response))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        options = {'OPTIONS': {'L2': 'shared', 'STAMP_INTERVAL': 0}}
+        # Two L1 locations stand in for two worker processes
+        self.worker_a = TieredCache('test-worker-a', options)
+        self.worker_b = TieredCache('test-worker-b', options)
+
+    def test_reads_fill_l1_from_shared_tier(self):
+        """Test that a value set by one worker is served from L1 by another"""
+        self.worker_a.set('greeting', 'hello')
+        before = self.worker_b.stats()
+        self.assertEqual(self.worker_b.get('greeting'), 'hello')
+        self.assertEqual(self.worker_b.get('greeting'), 'hello')
+        after = self.worker_b.stats()
+        self.assertEqual(after['l2_hits'] - before['l2_hits'], 1)
+        self.assertEqual(after['l1_hits'] - before['l1_hits'], 1)
+
+    def test_delete_is_broadcast_to_other_workers(self):
+        """Test that a delete in one worker invalidates the other's L1"""
+        self.worker_a.set('stock', 5)
+        self.assertEqual(self.worker_b.get('stock'), 5)
+        self.worker_a.delete('stock')
+        self.assertIsNone(self.worker_b.get('stock'))
+
+    def test_l2_only_keys_skip_l1_and_broadcasts(self):
+        """Test that bumping a generation leaves every worker's L1 in place"""
+        options = {'OPTIONS': {'L2': 'shared', 'L2_ONLY': ['generation:'], 'STAMP_INTERVAL': 0}}
+        worker_a = TieredCache('test-worker-a', options)
+        worker_b = TieredCache('test-worker-b', options)
+        worker_a.set('page', 'cached')
+        worker_a.set('generation:products', 1)
+        self.assertEqual(worker_b.get('page'), 'cached')
+        self.assertEqual(worker_b.get('generation:products'), 1)
+
+        worker_a.incr('generation:products')
+        self.assertEqual(worker_b.get('generation:products'), 2)
+        before = worker_b.stats()
+        self.assertEqual(worker_b.get('page'), 'cached')
+        self.assertEqual(worker_b.stats()['l1_hits'] - before['l1_hits'], 1)
+
+        # Every generation the app bumps is configured as L2-only
+        l2_only = tuple(settings.CACHES['default']['OPTIONS']['L2_ONLY'])
+        for key in (PRODUCT_GENERATION_KEY, NAMES_GENERATION_KEY, 'transaction_generation:1'):
+            self.assertTrue(key.startswith(l2_only), key)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StampedeProtectionTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_concurrent_misses_fill_once(self):
+        """Test that racing cache misses run the fill a single time"""
+        calls = []
+        results = []
+
+        def fill():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'page'
+
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_fill('hot-page', fill)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['page'] * 8)
+
+    def test_waiters_get_stale_value_during_fill(self):
+        """Test that a request blocked by another fill serves the stale copy"""
+        cache.set('page:stale', 'old page')
+        shared_cache.set('page:new:lock', 1)
+        self.assertEqual(
+            get_or_fill('page:new', lambda: 'new page', stale_key='page:stale'),
+            'old page'
+        )
+
+    def test_entry_is_refreshed_early_near_expiry(self):
+        """Test probabilistic early refresh of an entry about to expire"""
+        cache.set('slow-page', ('old page', 1000.0, time.time() + 1))
+        self.assertEqual(get_or_fill('slow-page', lambda: 'new page'), 'new page')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SlidingWindowThrottleTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='throttled')
+        self.now = 1000 * 60.0
+
+        class ThreePerMinute(UserSlidingWindowThrottle):
+            rate = '3/min'
+            timer = lambda throttle: self.now
+
+        self.throttle_class = ThreePerMinute
+
+    def allow(self):
+        request = APIRequestFactory().get('/api/products/')
+        request.user = self.user
+        throttle = self.throttle_class()
+        return throttle.allow_request(request, None), throttle
+
+    def test_rate_is_enforced_over_a_sliding_window(self):
+        """Test that the limit holds across a window boundary"""
+        self.assertEqual([self.allow()[0] for _ in range(3)], [True, True, True])
+        allowed, throttle = self.allow()
+        self.assertFalse(allowed)
+        self.assertGreater(throttle.wait(), 0)
+
+        # Halfway into the next window half of the old requests still count
+        self.now += 90
+        self.assertEqual([self.allow()[0] for _ in range(3)], [True, True, False])
+
+        # Two windows later everything has aged out
+        self.now += 120
+        self.assertTrue(self.allow()[0])
+
+    def test_counters_outlive_the_default_cache_timeout(self):
+        """Test that an hourly limit survives past the cache's default timeout"""
+        self.throttle_class.rate = '3/hour'
+        self.assertEqual([self.allow()[0] for _ in range(3)], [True, True, True])
+        # incr() on the file-based cache would have reset the expiry to 300 s
+        later = time.time() + 10 * 60
+        with mock.patch('time.time', return_value=later):
+            self.assertFalse(self.allow()[0])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ConcurrentPurchaseTests(TransactionTestCase):
+    def setUp(self):
+        clear_caches()
+        self.product = Product.objects.create(
+            name='Hot Cola',
+            price=Decimal('2.50'),
+            quantity=10
+        )
+        self.tokens = []
+        for i in range(25):
+            user = User.objects.create(username=f'buyer{i}')
+            self.tokens.append(Token.objects.create(user=user).key)
+
+    def purchase(self, token, results, **extra):
+        """
+        POST one purchase from a worker thread. SQLite's shared in-memory
+        test database reports lock contention as OperationalError, which a
+        real client would see as a 500 and retry. The test client re-raises
+        exceptions from every thread's requests, so it returns responses
+        instead.
+        """
+        client = APIClient(raise_request_exception=False)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        try:
+            for _ in range(50):
+                response = client.post(
+                    f'/api/products/{self.product.id}/purchase/',
+                    {'quantity': 1},
+                    **extra
+                )
+                if response.status_code != status.HTTP_500_INTERNAL_SERVER_ERROR:
+                    results.append(response.status_code)
+                    return
+        finally:
+            connection.close()
+
+    def run_concurrently(self, targets):
+        barrier = threading.Barrier(len(targets))
+
+        def run(target):
+            barrier.wait()
+            target()
+
+        threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_purchases_never_oversell(self):
+        """Test that racing purchases cannot take stock below zero"""
+        results = []
+        self.run_concurrently([
+            lambda token=token: self.purchase(token, results) for token in self.tokens
+        ])
+
+        sold = Transaction.objects.count()
+        self.product.refresh_from_db()
+        self.assertGreater(sold, 0)
+        self.assertLessEqual(sold, 10)
+        self.assertEqual(self.product.quantity, 10 - sold)
+        self.assertEqual(results.count(status.HTTP_201_CREATED), sold)
+
+    def test_concurrent_duplicates_run_once(self):
+        """Test that racing requests with one Idempotency-Key write once"""
+        results = []
+        self.run_concurrently([
+            lambda: self.purchase(self.tokens[0], results, HTTP_IDEMPOTENCY_KEY='same-key')
+            for _ in range(5)
+        ])
+
+        self.assertIn(status.HTTP_201_CREATED, results)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 9)
+
+
+def current_rss():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/statm'), 'needs /proc to read RSS')
+@override_settings(CACHES=TEST_CACHES)
+class TransactionExportMemoryTests(TestCase):
+    rows = int(os.environ.get('EXPORT_TEST_ROWS', 1_000_000))
+    rss_ceiling = 64 * 1024 * 1024
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='finance', password='x', is_staff=True)
+        product = Product.objects.create(name='Cola', price=Decimal('2.50'), quantity=0)
+        batch = 50_000
+        for offset in range(0, cls.rows, batch):
+            Transaction.objects.bulk_create(
+                Transaction(product=product, user=cls.staff, quantity=1, total_amount=Decimal('2.50'),
+                            payment_method='APP', status='COMPLETED')
+                for _ in range(min(batch, cls.rows - offset))
+            )
+
+    def test_export_memory_is_flat(self):
+        """Test that exporting the whole history keeps RSS under a fixed ceiling"""
+        client = APIClient()
+        client.force_authenticate(user=self.staff)
+        for export_format in ('ndjson', 'csv'):
+            response = client.get(f'/api/transactions/export/?format={export_format}')
+            baseline = peak = current_rss()
+            lines = 0
+            for i, chunk in enumerate(response.streaming_content):
+                lines += chunk.count(b'\n')
+                if i % 50 == 0:
+                    peak = max(peak, current_rss())
+            response.close()
+            expected = self.rows + (export_format == 'csv')
+            self.assertEqual(lines, expected)
+            self.assertLess(peak - baseline, self.rss_ceiling, export_format)
@@ -0,0 +1,111 @@
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+
+from .cache import cache_backend, shared_cache
+from .timing import measure
+
+# Backends whose incr() is atomic and keeps the key's expiry. Elsewhere
+# (FileBasedCache, LocMemCache, ...) incr() is a get and a set that resets
+# the expiry to the default timeout.
+ATOMIC_INCR_BACKENDS = (RedisCache, BaseMemcachedCache)
+
+
+class SlidingWindowThrottleMixin:
+    """
+    Sliding-window counter throttling with fixed-size state.
+
+    DRF's SimpleRateThrottle keeps a list with one timestamp per request and
+    rewrites it on every call, so its cost grows with the rate. This keeps
+    two integer counters per key instead: one for the current fixed window
+    and one for the previous window. The request count over the last
+    ``duration`` seconds is estimated by weighting the previous window by how
+    much of it still overlaps. A client may burst up to the full rate at
+    once and is then held to it.
+
+    Counters must outlive the window after theirs. On Redis and Memcached
+    they are bumped with ``incr``, which is atomic and keeps their expiry.
+    Other backends get the new count written back with ``set()`` and an
+    explicit timeout; there concurrent workers can lose increments, so a
+    burst may get slightly past the limit. Configure one of the former as
+    the coordination cache where limits must be exact.
+
+    Mix in front of any SimpleRateThrottle subclass to keep its scope, rate
+    and cache key.
+    """
+    cache = shared_cache
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    @measure('throttle')
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window, offset = divmod(self.now, self.duration)
+        current_key = f'{self.key}:{int(window)}'
+        previous_key = f'{self.key}:{int(window) - 1}'
+
+        counts = self.cache.get_many([current_key, previous_key])
+        self.current = counts.get(current_key, 0)
+        self.previous = counts.get(previous_key, 0)
+        self.elapsed = offset / self.duration
+
+        if self.previous * (1 - self.elapsed) + self.current >= self.num_requests:
+            return self.throttle_failure()
+
+        self.count_request(current_key)
+        return True
+
+    def count_request(self, key):
+        # Counters must outlive the following window, which still reads them
+        timeout = self.duration * 2
+        if not isinstance(cache_backend(self.cache), ATOMIC_INCR_BACKENDS):
+            self.cache.set(key, self.current + 1, timeout)
+        elif not self.cache.add(key, 1, timeout):
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.add(key, 1, timeout)
+
+    def wait(self):
+        """
+        Seconds until the estimated count drops below the limit
+        """
+        remaining = (1 - self.elapsed) * self.duration
+        if self.current >= self.num_requests or not self.previous:
+            return remaining
+        # The previous window's weight falls linearly until the window ends
+        needed = 1 - (self.num_requests - self.current) / self.previous
+        return max(needed - self.elapsed, 0) * self.duration
+
+
+class AnonSlidingWindowThrottle(SlidingWindowThrottleMixin, AnonRateThrottle):
+    pass
+
+
+class UserSlidingWindowThrottle(SlidingWindowThrottleMixin, UserRateThrottle):
+    pass
+
+
+class PurchaseRateThrottle(UserSlidingWindowThrottle):
+    """
+    Separate per-user bucket for the purchase action
+    """
+    scope = 'purchase'
+
+    def allow_request(self, request, view):
+        if getattr(view, 'action', None) != 'purchase':
+            return True
+        return super().allow_request(request, view)
+
+
+class AutocompleteRateThrottle(UserSlidingWindowThrottle):
+    """
+    Autocomplete fires on every keystroke, so it gets its own, larger bucket
+    """
+    scope = 'autocomplete'
@@ -0,0 +1,134 @@
+"""
+Per-request timings for the Server-Timing header and request log.
+
+``ServerTimingMiddleware`` (api.middleware) puts a ``RequestTimings`` in
+a context variable for the duration of each request. Code on the request
+path adds to it with ``measure('<metric>')`` blocks and ``count()``; both
+do nothing outside a request, e.g. in management commands. A metric only
+accrues in its outermost block, so a serializer nested in another, or
+``has_key()`` calling ``get()``, is not counted twice. Different metrics
+may overlap: a query run while serializing counts towards db and
+serialize.
+"""
+import functools
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+_current = ContextVar('request_timings', default=None)
+
+# Header order; other metrics follow in the order they were first recorded
+METRICS = ('db', 'cache', 'auth', 'throttle', 'serialize', 'render')
+
+
+class RequestTimings:
+    """
+    Seconds spent per metric and event counters for one request
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.active = set()
+
+    @property
+    def total(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def time_query(self, execute, sql, params, many, context):
+        """
+        ``connection.execute_wrapper()`` hook counting queries and their time
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += time.perf_counter() - started
+            self.counts['db_queries'] += 1
+
+    def metrics(self):
+        """
+        ``{name: milliseconds}`` for every metric recorded, plus total
+        """
+        names = [name for name in METRICS if name in self.durations]
+        names += [name for name in self.durations if name not in METRICS]
+        metrics = {name: round(self.durations[name] * 1000, 3) for name in names}
+        metrics['total'] = round(self.total * 1000, 3)
+        return metrics
+
+    def header(self):
+        """
+        Server-Timing header value
+        """
+        descriptions = {
+            'db': f'{self.counts["db_queries"]} queries',
+            'cache': f'{self.counts["cache_hits"]} hits / {self.counts["cache_misses"]} misses',
+        }
+        entries = []
+        for name, ms in self.metrics().items():
+            entry = f'{name};dur={ms}'
+            if name in descriptions:
+                entry += f';desc="{descriptions[name]}"'
+            entries.append(entry)
+        return ', '.join(entries)
+
+
+def activate(timings):
+    """
+    Collect into ``timings`` until ``deactivate()`` is called with the token
+    """
+    return _current.set(timings)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def count(name, n=1):
+    timings = _current.get()
+    if timings is not None:
+        timings.counts[name] += n
+
+
+class measure:
+    """
+    Context manager and decorator adding the time spent in a block to the
+    current request's ``metric``
+    """
+    __slots__ = ('metric', 'timings', 'started')
+
+    def __init__(self, metric):
+        self.metric = metric
+        self.timings = None
+
+    def __enter__(self):
+        timings = _current.get()
+        if timings is None or self.metric in timings.active:
+            self.timings = None
+            return self
+        timings.active.add(self.metric)
+        self.timings = timings
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        timings = self.timings
+        if timings is not None:
+            timings.durations[self.metric] += time.perf_counter() - self.started
+            timings.active.discard(self.metric)
+            self.timings = None
+
+    def __call__(self, func):
+        metric = self.metric
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure(metric):
+                return func(*args, **kwargs)
+
+        return wrapper
@@ -6,10 +6,14 @@ from . import views
 router = DefaultRouter()
 router.register(r'products', views.ProductViewSet)
 router.register(r'transactions', views.TransactionViewSet, basename='transaction')
+router.register(r'reservations', views.ReservationViewSet, basename='reservation')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('token/', obtain_auth_token, name='api_token_auth'),
     path('signup/', views.signup, name='signup'),
     path('users/me/', views.get_current_user, name='current_user'),
+    path('checkout/', views.checkout, name='checkout'),
+    path('reports/sales/', views.sales_report, name='sales_report'),
+    path('analytics/<str:report>/', views.analytics_report, name='analytics_report'),
 ] 
\ No newline at end of file
@@ -1,3 +1,7 @@
 from .auth import signup, get_current_user
+from .checkout import checkout
 from .products import ProductViewSet
-from .transactions import TransactionViewSet 
\ No newline at end of file
+from .transactions import TransactionViewSet
+from .reservations import ReservationViewSet
+from .reports import sales_report
+from .analytics import analytics_report
@@ -0,0 +1,53 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from ..analytics import REPORTS, ReportParams, TransactionColumns, np
+from .reports import parse_list
+
+ANALYTICS_MAX_DAYS = 366
+
+
+def parse_report_params(params):
+    """
+    ReportParams from ?product=, ?days=, ?window= and ?horizon=. Raises
+    ValueError with a client-facing message.
+    """
+    defaults = ReportParams()
+    try:
+        parsed = ReportParams(
+            product_ids=[int(pk) for pk in parse_list(params.get('product'))] or None,
+            days=int(params.get('days', defaults.days)),
+            window=int(params.get('window', defaults.window)),
+            horizon=int(params.get('horizon', defaults.horizon)),
+        )
+    except ValueError:
+        raise ValueError('product, days, window and horizon must be integers')
+    for name in ('days', 'window', 'horizon'):
+        if not 1 <= getattr(parsed, name) <= ANALYTICS_MAX_DAYS:
+            raise ValueError(f'{name} must be between 1 and {ANALYTICS_MAX_DAYS}')
+    return parsed
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def analytics_report(request, report):
+    """
+    Ad-hoc analysis of the transaction history: hour_of_day, basket_sizes,
+    demand (moving average per product) or restock
+    """
+    if report not in REPORTS:
+        return Response({'error': f'Unknown report: {report}'}, status=status.HTTP_404_NOT_FOUND)
+    if np is None:
+        return Response({'error': 'Analytics need NumPy'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    try:
+        params = parse_report_params(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Kept up to date by the analytics management command, not by requests
+    columns = TransactionColumns().load()
+    if columns is None:
+        return Response({'error': 'Analytics data is not loaded yet'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response({'report': report, 'results': REPORTS[report](columns, params)})
@@ -0,0 +1,101 @@
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from django.db import transaction
+
+from ..cache import invalidate_product_cache, invalidate_transaction_cache
+from ..idempotency import idempotent
+from ..inventory import InsufficientStock, decrement_stock
+from ..models import Product, Transaction
+from ..reports import record_sales, sale_changes
+from ..serializers import TransactionSerializer
+
+PAYMENT_METHODS = {code for code, _ in Transaction.PAYMENT_METHODS}
+
+
+def parse_cart_lines(lines):
+    """
+    Merge ``[{product_id, quantity}, ...]`` into ``{product_id: quantity}``.
+    Raises ValueError with a client-facing message on malformed input.
+    """
+    if not isinstance(lines, list) or not lines:
+        raise ValueError('items must be a non-empty list')
+
+    quantities = {}
+    for line in lines:
+        if not isinstance(line, dict):
+            raise ValueError('Each item must be an object with product_id and quantity')
+        try:
+            product_id = int(line['product_id'])
+            quantity = int(line['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Each item needs an integer product_id and quantity')
+        if quantity <= 0:
+            raise ValueError('Quantity must be greater than 0')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+@api_view(['POST'])
+@idempotent
+def checkout(request):
+    """
+    Purchase every line of a cart in one all-or-nothing database transaction
+    """
+    data = request.data
+    lines = data if isinstance(data, list) else data.get('items')
+    payment_method = 'APP' if isinstance(data, list) else data.get('payment_method', 'APP')
+
+    if payment_method not in PAYMENT_METHODS:
+        return Response(
+            {'error': 'Invalid payment method'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        quantities = parse_cart_lines(lines)
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    products = Product.objects.in_bulk(list(quantities))
+    missing = set(quantities) - set(products)
+    if missing:
+        return Response(
+            {'error': f'Product not found: {", ".join(map(str, sorted(missing)))}'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    try:
+        with transaction.atomic():
+            transactions = Transaction.objects.bulk_create([
+                Transaction(
+                    product=products[product_id],
+                    user=request.user,
+                    quantity=quantity,
+                    payment_method=payment_method,
+                    total_amount=products[product_id].price * quantity,
+                    status='COMPLETED'
+                )
+                for product_id, quantity in quantities.items()
+            ])
+            # Rolls the transactions back when any product is short
+            decrement_stock(quantities, user=request.user,
+                            transactions={t.product_id: t.pk for t in transactions})
+            record_sales(sale_changes(transactions))
+    except InsufficientStock as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # One invalidation pass for the whole cart; bulk_create sends no signals
+    invalidate_product_cache()
+    invalidate_transaction_cache(request.user.pk)
+
+    return Response({
+        'transactions': TransactionSerializer(transactions, many=True).data,
+        'total_amount': str(sum(t.total_amount for t in transactions)),
+    }, status=status.HTTP_201_CREATED)
@@ -0,0 +1,204 @@
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from ..cache import PRODUCT_CACHE_TIMEOUT, get_or_fill, normalized_query, request_origin_path, response_cache_key
+from ..middleware import accepts_gzip, gzip_content, use_compressed
+from ..timing import measure
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETags and If-None-Match handling for list and detail responses.
+
+    Views provide ``get_etag_version()``, a cheap string that changes whenever
+    the underlying rows change. The tag is derived from it and the request,
+    so a matching If-None-Match gets a 304 before any serialization happens.
+    """
+
+    def get_etag_version(self, request):
+        raise NotImplementedError
+
+    def get_etag(self, request):
+        raw = '|'.join([
+            str(self.get_etag_version(request)),
+            request_origin_path(request),
+            normalized_query(request.query_params),
+            request.accepted_renderer.format or '',
+        ])
+        return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+
+    def not_modified(self, request):
+        etag = self.get_etag(request)
+        request.response_etag = etag
+        if_none_match = request.headers.get('If-None-Match')
+        if not if_none_match:
+            return None
+        tags = [tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(if_none_match)]
+        if etag in tags or '*' in tags:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.not_modified(request) or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.not_modified(request) or super().retrieve(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        etag = getattr(request, 'response_etag', None)
+        if etag and response.status_code == 200:
+            response['ETag'] = etag
+        return response
+
+
+class ResponseCacheMixin:
+    """
+    Cache the rendered bytes of list responses.
+
+    Views provide ``get_response_cache_generation()``; entries are keyed by
+    that generation plus the normalised query string, so bumping the
+    generation invalidates every page and filter combination at once. Hits
+    are answered without touching the queryset or serializer, and misses are
+    filled by a single request while concurrent ones get the previous
+    generation's bytes (see ``api.cache.get_or_fill``). Entries also hold
+    the gzipped bytes, so hits are not compressed again, and the ETag of
+    the request that filled them, so previous-generation bytes never go
+    out under the current generation's tag.
+    """
+    response_cache_prefix = None
+    response_cache_timeout = PRODUCT_CACHE_TIMEOUT
+    # Only renderers whose output is the same for every user may be cached
+    response_cache_formats = ('json',)
+
+    def get_response_cache_generation(self):
+        raise NotImplementedError
+
+    def render_list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        response.render()
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format not in self.response_cache_formats:
+            return super().list(request, *args, **kwargs)
+
+        key = response_cache_key(
+            self.response_cache_prefix, request, self.get_response_cache_generation()
+        )
+        stale_key = response_cache_key(self.response_cache_prefix, request, 'stale')
+        rendered = []
+
+        def fill():
+            response = self.render_list(request, *args, **kwargs)
+            rendered.append(response)
+            # Compress once here rather than in the middleware on every hit
+            return (response.content, response['Content-Type'], gzip_content(response.content),
+                    getattr(request, 'response_etag', None))
+
+        content, content_type, compressed, etag = get_or_fill(
+            key, fill, timeout=self.response_cache_timeout, stale_key=stale_key
+        )
+        if rendered:
+            # This request did the fill; return the full DRF response
+            response = rendered[0]
+        else:
+            response = HttpResponse(content, content_type=content_type)
+            # The bytes may be another generation's; tag them as such
+            request.response_etag = etag
+        if compressed is not None and accepts_gzip(request):
+            use_compressed(response, compressed)
+        return response
+
+
+class SparseFieldsetMixin:
+    """
+    ``?fields=`` and ``?expand=`` for list and retrieve, e.g.
+    ``?fields=id,name,price`` or ``?fields=id,product.name``. The serializer
+    drops the other fields (see ``api.serializers.SparseFieldsMixin``) and
+    the queryset only loads the columns and joins they need.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def _names(self, param):
+        value = self.request.query_params.get(param, '')
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def get_fieldset(self):
+        if self.action not in ('list', 'retrieve'):
+            return {}
+        fields = self._names(self.fields_query_param)
+        return {
+            'fields': fields or None,
+            'expand': self._names(self.expand_query_param),
+        }
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **{**self.get_fieldset(), **kwargs})
+
+    def get_fast_serializer(self, **kwargs):
+        return super().get_fast_serializer(**{**self.get_fieldset(), **kwargs})
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.get_fieldset().get('fields') is None:
+            return queryset
+        serializer = self.get_serializer()
+        return (queryset.select_related(None)
+                .select_related(*serializer.get_related())
+                .only(*serializer.get_columns()))
+
+
+class FastSerializationMixin:
+    """
+    Serve list and retrieve from ``.values()`` rows through
+    ``fast_serializer_class`` (see ``api.fast_serializers``) instead of
+    building model instances. The JSON is identical to the
+    ``serializer_class`` output. Set API_FAST_SERIALIZATION = False to
+    fall back to the regular serializers.
+    """
+    fast_serializer_class = None
+
+    def use_fast_serializer(self):
+        return (self.fast_serializer_class is not None
+                and getattr(settings, 'API_FAST_SERIALIZATION', True))
+
+    def get_fast_serializer(self, **kwargs):
+        return self.fast_serializer_class(context=self.get_serializer_context(), **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_serializer():
+            return super().list(request, *args, **kwargs)
+
+        serializer = self.get_fast_serializer()
+        queryset = self.filter_queryset(self.get_queryset())
+        # Cursor pagination reads the ordering columns from each row
+        ordering = [name.lstrip('-') for name in queryset.query.order_by if isinstance(name, str)]
+        rows = queryset.values(*dict.fromkeys(serializer.columns + ordering))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize_many(page))
+        return Response(serializer.serialize_many(rows))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_fast_serializer():
+            return super().retrieve(request, *args, **kwargs)
+
+        serializer = self.get_fast_serializer()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        rows = self.filter_queryset(self.get_queryset()).values(*serializer.columns)
+        row = get_object_or_404(rows, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, row)
+        with measure('serialize'):
+            data = serializer.to_representation(row)
+        return Response(data)
@@ -1,59 +1,138 @@
 from rest_framework import viewsets, status, filters
+from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.throttling import UserRateThrottle
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
-from django.core.cache import cache
 from django.db import transaction
+from django.utils import timezone
 
-from ..models import Product, Transaction
-from ..serializers import ProductSerializer, TransactionSerializer
+from ..authentication import CachedTokenAuthentication
+from ..cache import invalidate_product_cache, product_generation
+from ..fast_serializers import ProductRowSerializer
+from ..idempotency import idempotent
+from ..inventory import InsufficientStock, adjust_stock, decrement_stock
+from ..models import InventoryMovement, Product, Transaction
+from ..reports import record_sales, sale_changes
+from ..search import IndexedSearchFilter, product_index
+from ..serializers import BulkProductOperationSerializer, ProductSerializer, TransactionSerializer
+from ..throttling import AutocompleteRateThrottle, PurchaseRateThrottle, UserSlidingWindowThrottle
+from .mixins import ConditionalGetMixin, FastSerializationMixin, ResponseCacheMixin, SparseFieldsetMixin
 
-class ProductRateThrottle(UserRateThrottle):
+BULK_MAX_OPERATIONS = 10000
+BULK_RESPONSE_FIELDS = ['id', 'name', 'price', 'quantity']
+
+class ProductRateThrottle(UserSlidingWindowThrottle):
     rate = '100/hour'
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, ResponseCacheMixin, SparseFieldsetMixin, FastSerializationMixin,
+                     viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    authentication_classes = [TokenAuthentication]
+    fast_serializer_class = ProductRowSerializer
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
-    throttle_classes = [ProductRateThrottle]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    throttle_classes = [ProductRateThrottle, PurchaseRateThrottle]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, filters.OrderingFilter]
     filterset_fields = ['name', 'price']
     search_fields = ['name']
     ordering_fields = ['name', 'price', 'quantity']
     ordering = ['name']  # Default ordering
+    cursor_ordering = 'name'
+    response_cache_prefix = 'product_list'
+
+    def get_response_cache_generation(self):
+        return product_generation()
+
+    def get_etag_version(self, request):
+        return product_generation()
 
-    def get_queryset(self):
+    def get_count_version(self):
+        return product_generation()
+
+    def invalidate_cache(self):
         """
-        Cache and return the product list
+        Invalidate every cached product list response
         """
-        page = self.request.query_params.get("page", 1)
-        cache_key = f'product_list_page_{page}'
-        queryset = cache.get(cache_key)
-        
-        if queryset is None:
-            queryset = super().get_queryset()
-            cache.set(cache_key, queryset, timeout=300)  # Cache for 5 minutes
-        
-        return queryset
+        invalidate_product_cache()
 
-    def invalidate_cache(self):
+    def perform_update(self, serializer):
+        # Quantity edits are applied relative to the loaded stock by Product.save
+        try:
+            serializer.save()
+        except InsufficientStock as e:
+            raise ValidationError({'quantity': [str(e)]})
+
+    @action(detail=False, methods=['get'], throttle_classes=[AutocompleteRateThrottle])
+    def autocomplete(self, request):
+        """
+        Suggest products whose name, or a word in it, starts with ?q=
         """
-        Invalidate all product list cache pages
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+        matches = product_index.autocomplete(request.query_params.get('q', '').strip(), limit)
+        return Response([{'id': product_id, 'name': name} for product_id, name in matches])
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    @idempotent
+    def bulk(self, request):
         """
-        # Get the total number of pages
-        total_items = Product.objects.count()
-        pages = (total_items + 5) // 6  # 6 items per page, rounded up
+        Restock and reprice many products in one transaction:
+        [{"id": 1, "quantity_delta": 24}, {"id": 2, "price": "1.75"}, ...]
+        """
+        operations = request.data.get('operations') if isinstance(request.data, dict) else request.data
+        if not isinstance(operations, list) or not operations:
+            return Response(
+                {'error': 'Expected a non-empty list of operations'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(operations) > BULK_MAX_OPERATIONS:
+            return Response(
+                {'error': f'At most {BULK_MAX_OPERATIONS} operations per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = BulkProductOperationSerializer(data=operations, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        deltas, prices = {}, {}
+        for operation in serializer.validated_data:
+            if 'quantity_delta' in operation:
+                deltas[operation['id']] = deltas.get(operation['id'], 0) + operation['quantity_delta']
+            if 'price' in operation:
+                prices[operation['id']] = operation['price']
+        ids = set(deltas) | set(prices)
+
+        missing = ids - set(Product.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        if missing:
+            return Response(
+                {'error': 'Product not found', 'missing': sorted(missing)},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            with transaction.atomic():
+                # Deltas are applied as F() increments, never read-modify-write
+                adjust_stock(deltas, InventoryMovement.RESTOCK, user=request.user)
+                now = timezone.now()
+                Product.objects.bulk_update(
+                    [Product(pk=pk, price=price, updated_at=now) for pk, price in prices.items()],
+                    ['price', 'updated_at'],
+                    batch_size=500
+                )
+        except InsufficientStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One version bump for the whole batch
+        self.invalidate_cache()
 
-        # Invalidate cache for each page
-        for page in range(1, pages + 1):
-            cache_key = f'product_list_page_{page}'
-            cache.delete(cache_key)
+        rows = ProductRowSerializer(self.get_serializer_context(), fields=BULK_RESPONSE_FIELDS)
+        products = Product.objects.filter(pk__in=ids).order_by('pk').values(*rows.columns)
+        return Response({'updated': len(ids), 'products': rows.serialize_many(products)})
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def purchase(self, request, pk=None):
         """
         Purchase a product
@@ -68,12 +147,6 @@ class ProductViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            if quantity > product.quantity:
-                return Response(
-                    {'error': 'Not enough stock available'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
             with transaction.atomic():
                 # Create transaction
                 transaction_obj = Transaction.objects.create(
@@ -85,19 +158,28 @@ class ProductViewSet(viewsets.ModelViewSet):
                     status='COMPLETED'
                 )
 
-                # Update product quantity
-                product.quantity -= quantity
-                product.save()
+                # Take stock with a single conditional UPDATE so concurrent
+                # purchases can never take the quantity below zero; rolls
+                # the transaction back when short
+                decrement_stock({product.pk: quantity}, user=request.user,
+                                transactions={product.pk: transaction_obj.pk})
+                record_sales(sale_changes([transaction_obj]))
+                product.refresh_from_db(fields=['quantity', 'updated_at'])
 
-                # Invalidate cache
-                self.invalidate_cache()
+            # Invalidate cache
+            self.invalidate_cache()
 
-                return Response(
-                    TransactionSerializer(transaction_obj).data,
-                    status=status.HTTP_201_CREATED
-                )
+            return Response(
+                TransactionSerializer(transaction_obj).data,
+                status=status.HTTP_201_CREATED
+            )
 
-        except ValueError:
+        except InsufficientStock as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except (TypeError, ValueError):
             return Response(
                 {'error': 'Invalid quantity'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -106,9 +188,4 @@ class ProductViewSet(viewsets.ModelViewSet):
             return Response(
                 {'error': 'Product not found'},
                 status=status.HTTP_404_NOT_FOUND
-            )
-        except Exception as e:
-            return Response(
-                {'error': str(e)},
-                status=status.HTTP_400_BAD_REQUEST
             ) 
\ No newline at end of file
@@ -0,0 +1,96 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from ..models import SalesRollup
+from ..reports import period_start
+from ..fast_serializers import SalesReportRowFastSerializer
+from .transactions import parse_export_bound
+
+# ?group_by= name -> rollup columns
+REPORT_GROUPS = {
+    'period': ['period_start'],
+    'product': ['product_id', 'product__name'],
+    'payment_method': ['payment_method'],
+}
+# ?ordering= name -> column or aggregate
+REPORT_ORDERING = {
+    'period': 'period_start',
+    'product': 'product__name',
+    'payment_method': 'payment_method',
+    'quantity': 'units',
+    'revenue': 'amount',
+    'transactions': 'count',
+}
+REPORT_MAX_ROWS = 5000
+
+
+def parse_list(value):
+    return [item for item in (value or '').split(',') if item]
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sales_report(request):
+    """
+    Sales totals from the hourly or daily rollups.
+
+    ?grain=hour|day (default day), ?from= / ?to= dates or datetimes,
+    ?product=1,2 and ?payment_method= filters, ?group_by= any of period,
+    product and payment_method (default period,product), ?ordering= e.g.
+    -revenue, and ?limit=. Top sellers:
+    ``?group_by=product&ordering=-revenue&limit=10``.
+    """
+    params = request.query_params
+    grain = params.get('grain', SalesRollup.DAY)
+    group_by = parse_list(params.get('group_by', 'period,product'))
+    ordering = parse_list(params.get('ordering')) or (['period'] if 'period' in group_by else ['-revenue'])
+    try:
+        if grain not in dict(SalesRollup.GRAINS):
+            raise ValueError(f'Invalid grain: {grain}')
+        unknown = set(group_by) - set(REPORT_GROUPS)
+        if unknown:
+            raise ValueError(f'Invalid group_by: {", ".join(sorted(unknown))}')
+        for name in ordering:
+            column = name.lstrip('-')
+            if column not in REPORT_ORDERING or (column in REPORT_GROUPS and column not in group_by):
+                raise ValueError(f'Invalid ordering: {name}')
+        limit = min(int(params.get('limit', REPORT_MAX_ROWS)), REPORT_MAX_ROWS)
+        product_ids = [int(pk) for pk in parse_list(params.get('product'))]
+
+        rollups = SalesRollup.objects.filter(grain=grain)
+        if params.get('from'):
+            start, _ = parse_export_bound(params['from'])
+            rollups = rollups.filter(period_start__gte=period_start(start, grain))
+        if params.get('to'):
+            end, inclusive = parse_export_bound(params['to'], end=True)
+            rollups = rollups.filter(**{'period_start__lte' if inclusive else 'period_start__lt': end})
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if product_ids:
+        rollups = rollups.filter(product_id__in=product_ids)
+    if params.get('payment_method'):
+        rollups = rollups.filter(payment_method=params['payment_method'])
+
+    columns = [column for name in group_by for column in REPORT_GROUPS[name]]
+    totals = {
+        'units': Coalesce(Sum('quantity'), 0),
+        'amount': Coalesce(Sum('revenue'), Value(Decimal('0')), output_field=DecimalField()),
+        'count': Coalesce(Sum('transactions'), 0),
+    }
+    order_by = [('-' if name.startswith('-') else '') + REPORT_ORDERING[name.lstrip('-')] for name in ordering]
+    # Ties fall back to the grouping columns, so pages of a report are stable
+    order_by += [column for column in columns if column not in {o.lstrip('-') for o in order_by}]
+    rows = rollups.values(*columns).annotate(**totals).filter(count__gt=0).order_by(*order_by)
+    serializer = SalesReportRowFastSerializer()
+    return Response({
+        'grain': grain,
+        'results': serializer.serialize_many(rows[:max(limit, 0)]),
+        'totals': serializer.to_representation(rollups.aggregate(**totals)),
+    })
@@ -0,0 +1,79 @@
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from ..authentication import CachedTokenAuthentication
+from ..idempotency import idempotent
+from ..inventory import InsufficientStock
+from ..models import Reservation, Transaction
+from ..reservations import ReservationExpired, cancel, purchase, reserve
+from ..serializers import ReservationSerializer, TransactionSerializer
+
+PAYMENT_METHODS = {code for code, _ in Transaction.PAYMENT_METHODS}
+
+
+class ReservationViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                         mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Stock held for the current user's cart. DELETE releases a hold early;
+    POST .../purchase/ buys it.
+    """
+    serializer_class = ReservationSerializer
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    # A cart's worth of holds; cached page counts would lag behind them
+    pagination_class = None
+
+    def get_queryset(self):
+        return Reservation.objects.filter(user=self.request.user).select_related('product').order_by('expires_at')
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            reservation = reserve(
+                request.user,
+                serializer.validated_data['product'],
+                serializer.validated_data['quantity'],
+                ttl=serializer.validated_data.get('ttl')
+            )
+        except InsufficientStock as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(self.get_serializer(reservation).data, status=status.HTTP_201_CREATED)
+
+    @idempotent
+    def destroy(self, request, *args, **kwargs):
+        cancel(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    @idempotent
+    def purchase(self, request, pk=None):
+        """
+        Buy the reserved units; the stock was set aside when they were reserved
+        """
+        payment_method = request.data.get('payment_method', 'APP')
+        if payment_method not in PAYMENT_METHODS:
+            return Response(
+                {'error': 'Invalid payment method'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            transaction_obj = purchase(self.get_object(), payment_method)
+        except ReservationExpired as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_410_GONE
+            )
+        except Reservation.DoesNotExist:
+            return Response(
+                {'error': 'Reservation not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(TransactionSerializer(transaction_obj).data, status=status.HTTP_201_CREATED)
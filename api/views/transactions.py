@@ -1,17 +1,68 @@
+import datetime
+
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
-from django.core.cache import cache
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
-from ..models import Transaction, Product
+from ..authentication import CachedTokenAuthentication
+from ..cache import invalidate_product_cache, product_generation, transaction_generation
+from ..fast_serializers import TransactionRowSerializer
+from ..idempotency import idempotent
+from ..inventory import InsufficientStock, adjust_stock
+from ..models import InventoryMovement, Transaction, Product
+from ..reports import record_sales, sale_changes
+from ..renderers import CSVRenderer, NDJSONRenderer
 from ..serializers import TransactionSerializer
+from .mixins import ConditionalGetMixin, FastSerializationMixin, SparseFieldsetMixin
+
+# Export header -> values_list() column
+EXPORT_COLUMNS = {
+    'id': 'id',
+    'created_at': 'created_at',
+    'user': 'user__username',
+    'product_id': 'product_id',
+    'product_name': 'product__name',
+    'product_price': 'product__price',
+    'quantity': 'quantity',
+    'total_amount': 'total_amount',
+    'payment_method': 'payment_method',
+    'status': 'status',
+}
+EXPORT_CHUNK_SIZE = 2000
+
+
+def parse_export_bound(value, end=False):
+    """
+    Parse a ?from= / ?to= value given as a date or a datetime. A date used
+    as the upper bound includes that whole day. Returns (datetime, inclusive).
+    """
+    parsed = parse_datetime(value)
+    inclusive = True
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        if end:
+            day += datetime.timedelta(days=1)
+            inclusive = False
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed, inclusive
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(ConditionalGetMixin, SparseFieldsetMixin, FastSerializationMixin,
+                         viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
-    authentication_classes = [TokenAuthentication]
+    fast_serializer_class = TransactionRowSerializer
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status']
@@ -19,11 +70,52 @@ class TransactionViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
 
     def get_queryset(self):
-        return Transaction.objects.filter(user=self.request.user)
+        # The serializer nests the product, so join it instead of one query per row
+        return Transaction.objects.filter(user=self.request.user).select_related('product')
+
+    def get_count_version(self):
+        # Nested product data changes with the product generation
+        return f'{transaction_generation(self.request.user.pk)}:{product_generation()}'
+
+    def get_etag_version(self, request):
+        return self.get_count_version()
+
+    def get_export_queryset(self, params):
+        queryset = Transaction.objects.order_by('id')
+        if params.get('from'):
+            start, _ = parse_export_bound(params['from'])
+            queryset = queryset.filter(created_at__gte=start)
+        if params.get('to'):
+            end, inclusive = parse_export_bound(params['to'], end=True)
+            queryset = queryset.filter(**{'created_at__lte' if inclusive else 'created_at__lt': end})
+        return queryset
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser],
+            renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream every user's transactions, oldest first, as ?format=ndjson
+        (default) or csv, optionally limited to ?from= / ?to=
+        """
+        try:
+            queryset = self.get_export_queryset(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        # iterator() fetches in chunks instead of loading the whole result set
+        rows = queryset.values_list(*EXPORT_COLUMNS.values()).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(list(EXPORT_COLUMNS), rows),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = f'attachment; filename="transactions.{renderer.format}"'
+        return response
+
+    @idempotent
     def update(self, request, *args, **kwargs):
-        transaction = self.get_object()
-        
+        transaction_obj = self.get_object()
+
         # Get the new quantity from request data
         new_quantity = int(request.data.get('quantity', 0))
         if new_quantity <= 0:
@@ -32,44 +124,56 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Calculate quantity difference
-        quantity_diff = new_quantity - transaction.quantity
-
-        # Check if there's enough stock
-        if quantity_diff > 0:  # Only check if we're increasing the quantity
-            if transaction.product.quantity < quantity_diff:
-                return Response(
-                    {'error': 'Not enough stock available'},
-                    status=status.HTTP_400_BAD_REQUEST
+        try:
+            with transaction.atomic():
+                # Lock and re-read the row so concurrent edits each apply
+                # their own difference
+                transaction_obj = get_object_or_404(
+                    Transaction.objects.select_for_update().select_related('product'), pk=transaction_obj.pk
                 )
+                quantity_diff = new_quantity - transaction_obj.quantity
+
+                # Takes stock when the quantity grows and returns it when it
+                # shrinks, refusing to go below zero
+                adjust_stock({transaction_obj.product_id: -quantity_diff}, InventoryMovement.ADJUSTMENT,
+                             user=request.user, transactions={transaction_obj.product_id: transaction_obj.pk})
 
-        # Update product stock
-        product = transaction.product
-        product.quantity -= quantity_diff  # Will add if quantity_diff is negative
-        product.save()
+                previous_amount = transaction_obj.total_amount
+                transaction_obj.quantity = new_quantity
+                transaction_obj.total_amount = new_quantity * transaction_obj.product.price
+                transaction_obj.save(update_fields=['quantity', 'total_amount', 'updated_at'])
 
-        # Update transaction
-        transaction.quantity = new_quantity
-        transaction.total_amount = new_quantity * product.price
-        transaction.save()
+                if transaction_obj.status == 'COMPLETED':
+                    record_sales([(transaction_obj.created_at, transaction_obj.product_id,
+                                   transaction_obj.payment_method, quantity_diff,
+                                   transaction_obj.total_amount - previous_amount, 0)])
+        except InsufficientStock as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        # Invalidate cache
-        cache.delete_many([f'product_list_page_{i}' for i in range(1, 10)])
+        # adjust_stock() sends no signals
+        invalidate_product_cache()
 
-        return Response(TransactionSerializer(transaction).data)
+        transaction_obj.product.refresh_from_db(fields=['quantity', 'updated_at'])
+        return Response(TransactionSerializer(transaction_obj).data)
 
+    @idempotent
     def destroy(self, request, *args, **kwargs):
-        transaction = self.get_object()
+        transaction_obj = self.get_object()
 
-        # Restore product quantity
-        product = transaction.product
-        product.quantity += transaction.quantity
-        product.save()
+        with transaction.atomic():
+            # Locked so a concurrent delete cannot restore the stock twice
+            transaction_obj = get_object_or_404(Transaction.objects.select_for_update(), pk=transaction_obj.pk)
 
-        # Delete the transaction
-        transaction.delete()
+            # Restore product quantity
+            adjust_stock({transaction_obj.product_id: transaction_obj.quantity}, InventoryMovement.REFUND,
+                         user=request.user, transactions={transaction_obj.product_id: transaction_obj.pk})
+            record_sales(sale_changes([transaction_obj], sign=-1))
+            transaction_obj.delete()
 
-        # Invalidate cache
-        cache.delete_many([f'product_list_page_{i}' for i in range(1, 10)])
+        # adjust_stock() sends no signals
+        invalidate_product_cache()
 
-        return Response(status=status.HTTP_204_NO_CONTENT) 
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,49 @@
+"""
+Shared setup for the benchmark scripts.
+
+Each benchmark runs against a throwaway SQLite file database so it never
+touches db.sqlite3 and so that worker threads get real, separate connections.
+The shared cache lives in a throwaway directory too, unless CACHE_DIR is set.
+"""
+import logging
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vending_machine.settings')
+os.environ.setdefault('CACHE_DIR', tempfile.mkdtemp(prefix='vending-bench-cache-'))
+
+import django
+
+django.setup()
+
+# Rejected requests are expected in several benchmarks; keep the output readable
+logging.getLogger('django.request').setLevel(logging.ERROR)
+logging.getLogger('api.timing').setLevel(logging.WARNING)
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Create a temporary test database, yield, then destroy it
+    """
+    setup_test_environment()
+    workdir = tempfile.mkdtemp(prefix='vending-bench-')
+    connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    cache.clear()
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def report(label, count, seconds, unit='ops'):
+    rate = count / seconds if seconds else float('inf')
+    print(f'{label:<40} {count:>8} {unit} in {seconds:8.3f}s  ({rate:,.0f} {unit}/s)')
@@ -0,0 +1,109 @@
+"""
+Ad-hoc analyses over the transaction history: ORM annotate() queries
+versus the NumPy column store in api.analytics. Also reports the time to
+load the column files from scratch and to refresh them incrementally.
+
+Usage: python benchmarks/bench_analytics.py [transactions]
+"""
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from _django import benchmark_database
+
+from django.contrib.auth.models import User
+from django.db.models import Sum
+from django.db.models.functions import ExtractHour, TruncDay, TruncSecond
+from django.utils import timezone
+
+from api.analytics import (
+    ReportParams, TransactionColumns, basket_sizes, hour_of_day, moving_average_demand, restock_forecast
+)
+from api.models import Product, Transaction
+
+
+def best_of(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(transactions=500_000):
+    random.seed(1)
+    with benchmark_database():
+        users = User.objects.bulk_create([User(username=f'bench{i}') for i in range(200)])
+        products = Product.objects.bulk_create([
+            Product(name=f'Product {i:03d}', price=Decimal('1.50') + i % 5, quantity=1000)
+            for i in range(100)
+        ])
+        now = timezone.now()
+        # Spread the rows over the last 90 days; auto_now_add would stamp them all now
+        Transaction._meta.get_field('created_at').auto_now_add = False
+        for start in range(0, transactions, 10_000):
+            Transaction.objects.bulk_create([
+                Transaction(product=random.choice(products), user=random.choice(users),
+                            quantity=random.randint(1, 3), total_amount=Decimal('2.50'),
+                            payment_method=random.choice(['APP', 'CASH']), status='COMPLETED',
+                            created_at=now - timedelta(seconds=random.randrange(90 * 24 * 3600)))
+                for _ in range(min(10_000, transactions - start))
+            ])
+        Transaction._meta.get_field('created_at').auto_now_add = True
+
+        store = TransactionColumns(tempfile.mkdtemp(prefix='vending-analytics-'))
+        start = time.perf_counter()
+        store.refresh(lag=0)
+        print(f'{transactions} transactions loaded into column files in {time.perf_counter() - start:.2f}s')
+        Transaction.objects.bulk_create([
+            Transaction(product=products[0], user=users[0], quantity=1, total_amount=Decimal('2.50'),
+                        payment_method='APP', status='COMPLETED')
+            for _ in range(1000)
+        ])
+        refresh = best_of(lambda: store.refresh(lag=0), repeat=1)
+        print(f'incremental refresh of 1000 new transactions in {refresh * 1000:.1f}ms')
+
+        sales = Transaction.objects.filter(status='COMPLETED')
+        since = now - timedelta(days=28)
+        params = ReportParams(days=28, window=7, horizon=7)
+
+        def orm_hour_of_day():
+            list(sales.filter(created_at__gte=since).annotate(hour=ExtractHour('created_at'))
+                 .values('hour').annotate(units=Sum('quantity')))
+
+        def orm_basket_sizes():
+            baskets = (sales.filter(created_at__gte=since).annotate(second=TruncSecond('created_at'))
+                       .values('user_id', 'second').annotate(units=Sum('quantity')))
+            Counter(row['units'] for row in baskets)
+
+        def orm_demand():
+            list(sales.filter(created_at__gte=now - timedelta(days=34)).annotate(day=TruncDay('created_at'))
+                 .values('product_id', 'day').annotate(units=Sum('quantity')).order_by('product_id', 'day'))
+
+        def orm_restock():
+            demand = dict(sales.filter(created_at__gte=now - timedelta(days=7)).values('product_id')
+                          .annotate(units=Sum('quantity')).values_list('product_id', 'units'))
+            list(Product.objects.values_list('pk', 'quantity', 'reserved'))
+            return demand
+
+        cases = [
+            ('hour of day (28 days)', orm_hour_of_day, hour_of_day),
+            ('basket sizes (28 days)', orm_basket_sizes, basket_sizes),
+            ('7-day moving avg demand', orm_demand, moving_average_demand),
+            ('restock forecast', orm_restock, restock_forecast),
+        ]
+        print(f'{"analysis":<26} {"ORM annotate":>14} {"NumPy":>10} {"speedup":>8}')
+        for label, orm, vectorized in cases:
+            orm_time = best_of(orm)
+            numpy_time = best_of(lambda: vectorized(store.load(), params))
+            print(f'{label:<26} {orm_time * 1000:12.1f}ms {numpy_time * 1000:8.1f}ms {orm_time / numpy_time:7.1f}x')
+        print('The ORM moving average still needs the window sums done in Python on top.')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,52 @@
+"""
+Cart checkout: one POST /api/checkout/ versus N single purchases.
+
+Usage: python benchmarks/bench_checkout.py [cart_lines] [rounds]
+"""
+import sys
+import time
+
+from _django import benchmark_database, report
+
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.models import Product
+from api.views import ProductViewSet
+
+
+def main(lines=10, rounds=50):
+    ProductViewSet.throttle_classes = []
+
+    with benchmark_database():
+        products = [
+            Product.objects.create(name=f'Item {i}', price=Decimal('1.25'), quantity=10 ** 6)
+            for i in range(lines)
+        ]
+        user = User.objects.create(username='bench')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for product in products:
+                response = client.post(f'/api/products/{product.id}/purchase/', {'quantity': 1})
+                assert response.status_code == 201, response.content
+        single = time.perf_counter() - start
+        report(f'{lines} single purchases', rounds, single, 'carts')
+
+        cart = {'items': [{'product_id': p.id, 'quantity': 1} for p in products]}
+        start = time.perf_counter()
+        for _ in range(rounds):
+            response = client.post('/api/checkout/', cart, format='json')
+            assert response.status_code == 201, response.content
+        bulk = time.perf_counter() - start
+        report(f'checkout of {lines} lines', rounds, bulk, 'carts')
+        print(f'speedup: {single / bulk:.1f}x')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
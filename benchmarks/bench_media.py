@@ -0,0 +1,58 @@
+"""
+Image requests per second: django.views.static.serve (the previous
+MEDIA_URL view) versus api.media.serve_media, for full downloads,
+ETag revalidation and a range request. Bodies are read in full, as a
+server without wsgi.file_wrapper would.
+
+Usage: python benchmarks/bench_media.py [requests] [image_kb]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from _django import report
+
+from django.test import RequestFactory
+from django.views.static import serve
+
+from api.media import serve_media
+
+
+def consume(response):
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    response.close()
+    return response
+
+
+def main(requests=2000, image_kb=200):
+    root = tempfile.mkdtemp(prefix='vending-media-')
+    name = 'products/variants/0123456789abcdef-600x400.jpg'
+    os.makedirs(os.path.join(root, os.path.dirname(name)))
+    with open(os.path.join(root, name), 'wb') as f:
+        f.write(os.urandom(image_kb * 1024))
+
+    factory = RequestFactory()
+    etag = consume(serve_media(factory.get('/'), name, document_root=root))['ETag']
+    scenarios = [
+        ('full GET', {}),
+        ('revalidate', {'HTTP_IF_NONE_MATCH': etag}),
+        ('16 KB range', {'HTTP_RANGE': 'bytes=0-16383'}),
+    ]
+    print(f'{image_kb} KB image, {requests} requests each')
+    for label, headers in scenarios:
+        for view_name, view in [('static.serve', serve), ('serve_media', serve_media)]:
+            request = factory.get('/media/' + name, **headers)
+            status = consume(view(request, name, document_root=root)).status_code
+            start = time.perf_counter()
+            for _ in range(requests):
+                consume(view(request, name, document_root=root))
+            report(f'{label}: {view_name} {status}', requests, time.perf_counter() - start, unit='req')
+    print('Repeat views of content-hashed files are served from the browser cache (immutable) '
+          'and never reach the server.')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,91 @@
+"""
+Deep-page latency on a large transaction history: OFFSET page numbers
+(with and without a cached COUNT) versus keyset cursors.
+
+Usage: python benchmarks/bench_pagination.py [rows]
+"""
+import base64
+import json
+import sys
+import time
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from _django import benchmark_database
+
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Product, Transaction
+from api.views import TransactionViewSet
+
+PAGE_SIZE = 6
+
+
+def cursor_for(created_at, pk):
+    """
+    Build the cursor KeysetPagination would hand out for a page starting
+    after the row (created_at, pk)
+    """
+    position = json.dumps([str(created_at), str(pk)])
+    return base64.b64encode(urlencode({'p': position}).encode()).decode()
+
+
+def timed_get(client, url, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        best = min(best, time.perf_counter() - start)
+        assert response.status_code == 200, response.content
+    return best * 1000
+
+
+def main(rows=1_000_000):
+    TransactionViewSet.throttle_classes = []
+
+    with benchmark_database():
+        product = Product.objects.create(name='Cola', price=Decimal('2.50'), quantity=0)
+        user = User.objects.create(username='bench')
+        start = timezone.now() - timedelta(seconds=rows)
+        batch = 20_000
+        for offset in range(0, rows, batch):
+            transactions = [
+                Transaction(product=product, user=user, quantity=1, total_amount=Decimal('2.50'),
+                            payment_method='APP', status='COMPLETED')
+                for _ in range(offset, min(offset + batch, rows))
+            ]
+            Transaction.objects.bulk_create(transactions)
+        # created_at is auto_now_add, so spread the rows out in time afterwards
+        for offset in range(0, rows, batch):
+            Transaction.objects.filter(id__gt=offset, id__lte=offset + batch).update(
+                created_at=start + timedelta(seconds=offset)
+            )
+        print(f'{rows:,} transactions loaded')
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        last_page = (rows + PAGE_SIZE - 1) // PAGE_SIZE
+        middle = last_page // 2
+        history = Transaction.objects.order_by('-created_at', '-id').values_list('created_at', 'id')
+
+        print(f'{"page":<12} {"OFFSET, no count cache":>24} {"OFFSET, cached count":>22} {"cursor":>10}')
+        for label, page in [('first', 1), ('middle', middle), ('last', last_page)]:
+            url = f'/api/transactions/?page={page}'
+            cache.clear()
+            uncached = timed_get(client, url, repeat=1)
+            timed_get(client, url, repeat=1)
+            cached = timed_get(client, url)
+            # Position of the row before that page, as a cursor would carry;
+            # found with an untimed OFFSET
+            cursor = cursor_for(*history[(page - 1) * PAGE_SIZE - 1]) if page > 1 else ''
+            keyset = timed_get(client, f'/api/transactions/?pagination=cursor&cursor={cursor}')
+            print(f'{label:<12} {uncached:>21.1f} ms {cached:>19.1f} ms {keyset:>7.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,61 @@
+"""
+Purchase throughput for a single hot product.
+
+Usage: python benchmarks/bench_purchase.py [threads] [purchases_per_thread]
+"""
+import sys
+import threading
+import time
+
+from _django import benchmark_database, report
+
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.models import Product, Transaction
+from api.views import ProductViewSet
+
+
+def main(threads=8, per_thread=50):
+    # Measure the purchase path itself, not the hourly rate limit
+    ProductViewSet.throttle_classes = []
+
+    with benchmark_database():
+        stock = threads * per_thread // 2
+        product = Product.objects.create(name='Hot Cola', price=Decimal('2.50'), quantity=stock)
+        user = User.objects.create(username='bench')
+        token = Token.objects.create(user=user).key
+        statuses = []
+
+        def worker():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+            try:
+                for _ in range(per_thread):
+                    response = client.post(f'/api/products/{product.id}/purchase/', {'quantity': 1})
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        product.refresh_from_db()
+        sold = statuses.count(201)
+        report(f'purchase ({threads} threads, 1 product)', len(statuses), elapsed, 'requests')
+        print(f'sold={sold} rejected={len(statuses) - sold} stock_left={product.quantity} '
+              f'transactions={Transaction.objects.count()}')
+        assert product.quantity == stock - sold >= 0, 'stock oversold'
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,61 @@
+"""
+JSON rendering and compression cost for serialized product rows: DRF's
+JSONRenderer versus FastJSONRenderer, plus gzip on every response versus
+serving the bytes compressed once by the response cache.
+
+Usage: python benchmarks/bench_renderers.py [rows]
+"""
+import sys
+import time
+
+from _django import benchmark_database, report
+
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.middleware import gzip_content
+from api.models import Product
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import ProductSerializer
+
+
+def best_of(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(rows=10_000):
+    if orjson is None:
+        print('orjson is not installed; FastJSONRenderer falls back to the stdlib encoder')
+
+    with benchmark_database():
+        Product.objects.bulk_create([
+            Product(name=f'Product {i:06d}', price=Decimal('1.25') + i % 7, quantity=i % 50)
+            for i in range(rows)
+        ])
+        request = APIRequestFactory().get('/api/products/')
+        data = ProductSerializer(Product.objects.all(), many=True, context={'request': request}).data
+
+        stdlib = JSONRenderer().render(data)
+        fast = FastJSONRenderer().render(data)
+        assert stdlib == fast
+
+        for label, renderer in [('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())]:
+            seconds = best_of(lambda: renderer.render(data))
+            report(f'render, {label}', rows, seconds, unit='rows')
+            print(f'  {seconds / rows * 1000 * 1000:.2f} ms per 1,000 rows')
+
+        compressed = gzip_content(fast)
+        seconds = best_of(lambda: gzip_content(fast))
+        print(f'gzip {len(fast):,} -> {len(compressed):,} bytes: {seconds * 1000:.2f} ms per response '
+              f'when compressed on every request, 0 ms when served from the response cache')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,81 @@
+"""
+Sales report latency: aggregating the Transaction table directly versus
+reading the hourly/daily rollups, for a 30-day revenue-per-product-per-day
+report and a top-10 sellers report.
+
+Usage: python benchmarks/bench_reports.py [transactions]
+"""
+import random
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from _django import benchmark_database
+
+from django.contrib.auth.models import User
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Product, Transaction
+from api.reports import rebuild_rollups
+
+
+def best_of(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(transactions=200_000):
+    random.seed(1)
+    with benchmark_database():
+        user = User.objects.create(username='bench', is_staff=True)
+        products = Product.objects.bulk_create([
+            Product(name=f'Product {i:03d}', price=Decimal('1.50') + i % 5, quantity=1000)
+            for i in range(100)
+        ])
+        now = timezone.now()
+        # Spread the rows over the last 90 days; auto_now_add would stamp them all now
+        Transaction._meta.get_field('created_at').auto_now_add = False
+        for start in range(0, transactions, 10_000):
+            Transaction.objects.bulk_create([
+                Transaction(product=random.choice(products), user=user, quantity=1,
+                            total_amount=Decimal('2.50'), payment_method=random.choice(['APP', 'CASH']),
+                            status='COMPLETED', created_at=now - timedelta(minutes=random.randrange(90 * 24 * 60)))
+                for _ in range(min(10_000, transactions - start))
+            ])
+        Transaction._meta.get_field('created_at').auto_now_add = True
+        print(f'{transactions} transactions, {rebuild_rollups()} rollup rows')
+
+        since = now - timedelta(days=30)
+        sales = Transaction.objects.filter(status='COMPLETED')
+
+        def scan_daily():
+            list(sales.filter(created_at__gte=since).annotate(day=TruncDay('created_at'))
+                 .values('day', 'product_id').annotate(revenue=Sum('total_amount')).order_by('day'))
+
+        def scan_top():
+            list(sales.values('product_id', 'product__name')
+                 .annotate(revenue=Sum('total_amount'), count=Count('id')).order_by('-revenue')[:10])
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        daily_url = f'/api/reports/sales/?from={since.date().isoformat()}'
+        top_url = '/api/reports/sales/?group_by=product&ordering=-revenue&limit=10'
+        assert client.get(daily_url).status_code == 200
+
+        print(f'{"report":<22} {"table scan":>12} {"rollups (HTTP)":>16}')
+        for label, scan, url in [('30 days by product', scan_daily, daily_url), ('top 10 all time', scan_top, top_url)]:
+            scanned = best_of(scan)
+            rolled = best_of(lambda: client.get(url))
+            print(f'{label:<22} {scanned * 1000:10.1f}ms {rolled * 1000:14.1f}ms')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
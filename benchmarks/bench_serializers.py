@@ -0,0 +1,72 @@
+"""
+Serialization cost per 1,000 rows: DRF ModelSerializers over model
+instances versus the values() row serializers, including the query.
+
+Usage: python benchmarks/bench_serializers.py [rows]
+"""
+import sys
+import time
+
+from _django import benchmark_database
+
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.fast_serializers import ProductRowSerializer, TransactionRowSerializer
+from api.models import Product, Transaction
+from api.serializers import ProductSerializer, TransactionSerializer
+
+
+def best_of(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(rows=10_000):
+    request = APIRequestFactory().get('/api/products/')
+    context = {'request': request}
+    renderer = JSONRenderer()
+
+    with benchmark_database():
+        user = User.objects.create(username='bench')
+        Product.objects.bulk_create([
+            Product(name=f'Product {i:06d}', price=Decimal('1.25') + i % 7, quantity=i % 50,
+                    image=f'products/{i}.png' if i % 2 else '')
+            for i in range(rows)
+        ])
+        products = list(Product.objects.all()[:50])
+        Transaction.objects.bulk_create([
+            Transaction(product=products[i % len(products)], user=user, quantity=1,
+                        total_amount=Decimal('2.50'), payment_method='APP', status='COMPLETED')
+            for i in range(rows)
+        ])
+
+        cases = [
+            ('products', Product.objects.order_by('name'), ProductSerializer, ProductRowSerializer),
+            ('transactions', Transaction.objects.select_related('product').order_by('-created_at'),
+             TransactionSerializer, TransactionRowSerializer),
+        ]
+        print(f'{"rows":<14} {"ModelSerializer":>18} {"row serializer":>18} {"speedup":>8}')
+        for label, queryset, serializer_class, row_serializer_class in cases:
+            def model_path():
+                return renderer.render(serializer_class(queryset.all(), many=True, context=context).data)
+
+            def row_path():
+                serializer = row_serializer_class(context=context)
+                return renderer.render(serializer.serialize_many(queryset.values(*serializer.columns)))
+
+            assert model_path() == row_path()
+            slow = best_of(model_path) / rows * 1000 * 1000
+            fast = best_of(row_path) / rows * 1000 * 1000
+            print(f'{label:<14} {slow:>12.2f} ms/1k {fast:>12.2f} ms/1k {slow / fast:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
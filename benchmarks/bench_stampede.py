@@ -0,0 +1,76 @@
+"""
+Load test for product cache stampedes: concurrent readers hammer the
+product list while the product generation is bumped (as a purchase does).
+Reports database queries per invalidation, which should stay near the
+number of queries one page render needs (a COUNT plus a SELECT).
+
+The readers are threads of one process, so this exercises the in-process
+half of the single-flight lock. How well it holds across workers depends
+on the shared cache's add() (see api.cache.get_or_fill).
+
+Usage: python benchmarks/bench_stampede.py [threads] [invalidations]
+"""
+import sys
+import threading
+import time
+
+from _django import benchmark_database
+
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from rest_framework.test import APIClient
+
+from api.cache import invalidate_product_cache
+from api.models import Product
+from api.views import ProductViewSet
+
+
+def main(threads=16, invalidations=10):
+    ProductViewSet.throttle_classes = []
+
+    with benchmark_database():
+        Product.objects.bulk_create([
+            Product(name=f'Item {i}', price=Decimal('1.00'), quantity=100) for i in range(50)
+        ])
+        user = User.objects.create(username='bench')
+        queries = []
+        requests = []
+        stop = threading.Event()
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def reader():
+            client = APIClient()
+            client.force_authenticate(user=user)
+            try:
+                with connection.execute_wrapper(count_queries):
+                    while not stop.is_set():
+                        assert client.get('/api/products/?page=2').status_code == 200
+                        requests.append(1)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=reader) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        time.sleep(0.5)
+
+        queries.clear()
+        requests.clear()
+        for _ in range(invalidations):
+            invalidate_product_cache()
+            time.sleep(0.5)
+        stop.set()
+        for thread in workers:
+            thread.join()
+
+        print(f'{len(requests)} requests from {threads} threads, {invalidations} invalidations')
+        print(f'{len(queries)} queries, {len(queries) / invalidations:.1f} per invalidation')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
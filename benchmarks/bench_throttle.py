@@ -0,0 +1,66 @@
+"""
+Throttle microbenchmark: DRF's timestamp-list UserRateThrottle versus the
+sliding-window counters in api.throttling, at high request rates. Both run
+against the configured coordination cache (settings.CACHES['coordination']),
+the one the throttles use in production.
+
+Usage: python benchmarks/bench_throttle.py [requests]
+"""
+import pickle
+import sys
+import time
+
+from _django import report
+
+from django.contrib.auth.models import User
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import UserRateThrottle
+
+from api.cache import cache_backend, shared_cache
+from api.throttling import UserSlidingWindowThrottle
+
+
+def state_keys(throttle):
+    if isinstance(throttle, UserSlidingWindowThrottle):
+        window = int(throttle.now // throttle.duration)
+        return [f'{throttle.key}:{window}', f'{throttle.key}:{window - 1}']
+    return [throttle.key]
+
+
+def run(throttle_class, requests):
+    request = APIRequestFactory().get('/api/products/')
+    request.user = User(pk=1, username='bench')
+    shared_cache.clear()
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        throttle = throttle_class()
+        assert throttle.allow_request(request, None)
+    elapsed = time.perf_counter() - start
+
+    stored = shared_cache.get_many(state_keys(throttle))
+    state = sum(len(pickle.dumps(value)) for value in stored.values())
+    shared_cache.clear()
+    return elapsed, state
+
+
+def main(requests=5000):
+    rate = f'{requests * 2}/hour'
+
+    class DRFThrottle(UserRateThrottle):
+        cache = shared_cache
+
+    class SlidingThrottle(UserSlidingWindowThrottle):
+        pass
+
+    DRFThrottle.rate = SlidingThrottle.rate = rate
+    print(f'shared cache: {type(cache_backend(shared_cache)).__name__}')
+    for label, throttle_class in [('DRF UserRateThrottle', DRFThrottle),
+                                  ('sliding window', SlidingThrottle)]:
+        elapsed, state = run(throttle_class, requests)
+        report(label, requests, elapsed, 'requests')
+        print(f'{"":<40} cached state: {state:,} bytes')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
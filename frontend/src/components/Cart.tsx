@@ -46,9 +46,12 @@ export const Cart: React.FC = () => {
   const [error, setError] = useState<string | null>(null);
   const queryClient = useQueryClient();
 
-  const purchaseMutation = useMutation({
-    mutationFn: async (item: { productId: number; quantity: number }) => {
-      return apiService.purchaseProduct(item.productId, item.quantity, paymentMethod);
+  const checkoutMutation = useMutation({
+    mutationFn: async (items: CartItemType[]) => {
+      return apiService.checkout(
+        items.map((item) => ({ product_id: item.product.id, quantity: item.quantity })),
+        paymentMethod
+      );
     },
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ['products'] });
@@ -62,13 +65,8 @@ export const Cart: React.FC = () => {
   const handleCheckout = async () => {
     try {
       setError(null);
-      // Purchase each item in the cart
-      for (const item of cartItems) {
-        await purchaseMutation.mutateAsync({
-          productId: item.product.id,
-          quantity: item.quantity,
-        });
-      }
+      // Purchase the whole cart in a single request
+      await checkoutMutation.mutateAsync(cartItems);
       clearCart();
       setIsCheckoutOpen(false);
     } catch (error) {
@@ -36,7 +36,7 @@ export const ProductCard: React.FC<ProductCardProps> = ({
           Price: ${Number(product.price).toFixed(2)}
         </Typography>
         <Typography variant="body2" color="text.secondary">
-          Available: {product.quantity}
+          Available: {product.available_quantity ?? product.quantity}
         </Typography>
       </CardContent>
       <Box sx={{ p: 2 }}>
@@ -45,7 +45,7 @@ export const ProductCard: React.FC<ProductCardProps> = ({
           color="primary"
           fullWidth
           onClick={() => onPurchase(product)}
-          disabled={disabled || product.quantity === 0}
+          disabled={disabled || (product.available_quantity ?? product.quantity) === 0}
         >
           Purchase
         </Button>
@@ -148,7 +148,7 @@ export const Products: React.FC = () => {
                     <CardMedia
                       component="img"
                       height="200"
-                      image={product.image_url || 'https://via.placeholder.com/200'}
+                      image={product.image_source || 'https://via.placeholder.com/200'}
                       alt={product.name}
                       sx={{ objectFit: 'cover' }}
                     />
@@ -160,7 +160,7 @@ export const Products: React.FC = () => {
                         ${Number(product.price).toFixed(2)}
                       </Typography>
                       <Typography variant="body2" color="text.secondary">
-                        Stock: {product.quantity}
+                        Stock: {product.available_quantity ?? product.quantity}
                       </Typography>
                       <Box
                         sx={{
@@ -189,7 +189,7 @@ export const Products: React.FC = () => {
                               handleQuantityChange(product.id, 1)
                             }
                             disabled={
-                              (quantities[product.id] || 1) >= product.quantity
+                              (quantities[product.id] || 1) >= (product.available_quantity ?? product.quantity)
                             }
                           >
                             <AddIcon />
@@ -198,7 +198,7 @@ export const Products: React.FC = () => {
                         <Button
                           variant="contained"
                           onClick={() => handleAddToCart(product.id)}
-                          disabled={product.quantity === 0}
+                          disabled={(product.available_quantity ?? product.quantity) === 0}
                         >
                           Add to Cart
                         </Button>
@@ -9,18 +9,43 @@ const api = axios.create({
   },
 });
 
+// Last ETag and body seen for each GET url, used for conditional requests
+const etagCache = new Map<string, { etag: string; data: unknown }>();
+
+// Accept 304 Not Modified so it can be answered from etagCache
+api.defaults.validateStatus = (status) => (status >= 200 && status < 300) || status === 304;
+
 // Add token to requests if it exists
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem('token');
   if (token) {
     config.headers.Authorization = `Token ${token}`;
   }
+  if (config.method === 'get' && config.url) {
+    const cached = etagCache.get(config.url);
+    if (cached) {
+      config.headers['If-None-Match'] = cached.etag;
+    }
+  }
   return config;
 });
 
 // Handle errors
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    const url = response.config.url;
+    if (response.config.method === 'get' && url) {
+      if (response.status === 304) {
+        const cached = etagCache.get(url);
+        if (cached) {
+          return { ...response, status: 200, data: cached.data };
+        }
+      } else if (response.headers.etag) {
+        etagCache.set(url, { etag: response.headers.etag, data: response.data });
+      }
+    }
+    return response;
+  },
   (error: AxiosError) => {
     if (error.response?.status === 401) {
       localStorage.removeItem('token');
@@ -46,8 +71,14 @@ export interface Product {
   name: string;
   price: number;
   quantity: number;
+  reserved?: number;
+  available_quantity?: number;
   image_url?: string;
   image_source?: string;
+  image_sources?: {
+    original?: string;
+    [size: string]: string | { jpeg: string; webp: string } | undefined;
+  };
 }
 
 export interface User {
@@ -67,6 +98,14 @@ export interface Transaction {
   created_at: string;
 }
 
+export interface Reservation {
+  id: number;
+  product: number;
+  quantity: number;
+  created_at: string;
+  expires_at: string;
+}
+
 export interface PaginatedResponse<T> {
   count: number;
   next: string | null;
@@ -156,6 +195,62 @@ export const apiService = {
     }
   },
 
+  checkout: async (
+    items: { product_id: number; quantity: number }[],
+    paymentMethod: 'APP' | 'CASH'
+  ): Promise<{ transactions: Transaction[]; total_amount: string }> => {
+    try {
+      const response = await api.post('/checkout/', {
+        items,
+        payment_method: paymentMethod,
+      });
+      return response.data;
+    } catch (error) {
+      if (error instanceof AxiosError) {
+        throw new Error(error.response?.data?.error || 'Checkout failed');
+      }
+      throw error;
+    }
+  },
+
+  // Reservations
+  reserveProduct: async (productId: number, quantity: number): Promise<Reservation> => {
+    try {
+      const response = await api.post<Reservation>('/reservations/', { product: productId, quantity });
+      return response.data;
+    } catch (error) {
+      if (error instanceof AxiosError) {
+        throw new Error(error.response?.data?.error || 'Failed to reserve product');
+      }
+      throw error;
+    }
+  },
+
+  cancelReservation: async (id: number): Promise<void> => {
+    try {
+      await api.delete(`/reservations/${id}/`);
+    } catch (error) {
+      if (error instanceof AxiosError) {
+        throw new Error(error.response?.data?.error || 'Failed to cancel reservation');
+      }
+      throw error;
+    }
+  },
+
+  purchaseReservation: async (id: number, paymentMethod: 'APP' | 'CASH'): Promise<Transaction> => {
+    try {
+      const response = await api.post<Transaction>(`/reservations/${id}/purchase/`, {
+        payment_method: paymentMethod,
+      });
+      return response.data;
+    } catch (error) {
+      if (error instanceof AxiosError) {
+        throw new Error(error.response?.data?.error || 'Failed to purchase reservation');
+      }
+      throw error;
+    }
+  },
+
   // Transactions
   getTransactions: async (page = 1): Promise<PaginatedResponse<Transaction>> => {
     try {
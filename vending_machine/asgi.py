@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "vending_machine.settings")
 
 application = get_asgi_application()
+
+# Build the product search index before the first request (api.search)
+from api.search import product_index  # noqa: E402
+from django.db import connections  # noqa: E402
+
+product_index.warm()
+# Workers forked from a preloading server must not share this connection
+connections.close_all()
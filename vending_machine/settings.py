@@ -46,7 +46,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "api.middleware.MinimumSizeGZipMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -131,14 +133,20 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # REST Framework settings
 REST_FRAMEWORK = {
+    # orjson-backed JSON when it is installed, stdlib json otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Page numbers with cached counts; ?pagination=cursor opts into keyset pages
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.HybridPagination',
     'PAGE_SIZE': 6,  # Show 6 products per page
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -146,23 +154,104 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'api.throttling.AnonSlidingWindowThrottle',
+        'api.throttling.UserSlidingWindowThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '20/hour',
-        'user': '100/hour'
+        'user': '100/hour',
+        'purchase': '30/minute',
+        'autocomplete': '120/minute'
     }
 }
 
 # Cache settings
+# 'default' is a per-process LRU (L1) in front of the 'shared' cache (L2),
+# which every gunicorn worker sees. 'coordination' holds fill locks and
+# throttle counters (api.cache.shared_cache): few, short-lived keys that
+# must not be culled along with response bytes. Swap both for
+# Redis/Memcached in production; the file-based backend is a local
+# stand-in. It culls when MAX_ENTRIES is reached, dropping
+# 1/CULL_FREQUENCY of its entries at random.
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-    }
+        'BACKEND': 'api.cache_backends.TieredCache',
+        'LOCATION': 'vending-l1',
+        'OPTIONS': {
+            'L2': 'shared',
+            # Generations are bumped on every write (see api.cache)
+            'L2_ONLY': ['product_generation', 'product_names_generation', 'transaction_generation:'],
+            'MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 30,
+            'STAMP_INTERVAL': 1.0,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    'coordination': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'coordination'),
+        'OPTIONS': {
+            # Locks and counters expire within hours; never cull them
+            'MAX_ENTRIES': 1000000,
+        },
+    },
 }
 
+# Token -> user lookups are cached for this long (see api.authentication)
+AUTH_TOKEN_CACHE_TIMEOUT = 300
+
+# Sessions are read from the cache and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Idempotency-Key handling for purchase and transaction mutations
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # Replay stored responses for a day
+IDEMPOTENCY_WAIT_TIMEOUT = 5  # Seconds a concurrent duplicate waits for the original
+
+# Resized product image variants (api.images): size -> (width, height)
+PRODUCT_IMAGE_SIZES = {'thumb': (200, 200), 'card': (600, 400)}
+PRODUCT_IMAGE_SOURCE_SIZE = 'card'  # Variant served as image_source
+PRODUCT_IMAGE_WORKERS = 2  # Background threads per process
+
+# Responses smaller than this are sent uncompressed
+GZIP_MIN_LENGTH = 1024
+
+# Serve product and transaction reads from .values() rows (api.fast_serializers)
+API_FAST_SERIALIZATION = True
+
+# Cart reservations (api.reservations), in seconds
+RESERVATION_TTL = 10 * 60
+RESERVATION_MAX_TTL = 30 * 60
+
+# Per-request timings (api.middleware.ServerTimingMiddleware): one log
+# line per request on api.timing, and the Server-Timing header, which goes
+# to staff users and in DEBUG only unless SERVER_TIMING is true
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() == 'true'
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Memory-mapped transaction columns for api.analytics
+ANALYTICS_DIR = os.environ.get('ANALYTICS_DIR', os.path.join(BASE_DIR, '.analytics'))
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
 CORS_ALLOW_CREDENTIALS = True
@@ -188,8 +277,21 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
+    'if-none-match',
+]
+CORS_EXPOSE_HEADERS = [
+    'etag',
+    'server-timing',
 ]
 
 # Media files (Uploaded files)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Serve MEDIA_URL from Django (api.media) with caching headers and Range
+# support. Set MEDIA_ACCEL_REDIRECT to an nginx internal location (e.g.
+# /protected-media/) to have nginx send the files instead.
+SERVE_MEDIA = os.environ.get('SERVE_MEDIA', 'true').lower() == 'true'
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT')
+MEDIA_CACHE_MAX_AGE = 60 * 60  # Uploads that are not content-hashed